@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Depends, Query
+from db.db import get_db as get_database
+from schemas.farmSession import FarmSessionCreate, FarmSession, FarmStageAction, FarmStageResponse
+from services.farmSession import FarmSessionService
+
+router = APIRouter(
+    prefix="/farm-sessions",
+    tags=["Farm Sessions"],
+)
+
+
+@router.post("/", response_model=FarmSession, response_model_exclude_none=True, status_code=201)
+def create_farm_session(farm: FarmSessionCreate, db: get_database = Depends()):
+    """
+    Create a farm session with many plots, each with its own area and water regime.
+    """
+    return FarmSessionService(db).create_farm_session(farm)
+
+
+@router.get("/{session_id}", response_model=FarmSession, response_model_exclude_none=True)
+def get_farm_session(
+    session_id: str,
+    plots: bool = Query(False, description="Include per-plot results of the last stage."),
+    db: get_database = Depends()
+):
+    return FarmSessionService(db).get_farm_session(session_id, include_plots=plots)
+
+
+@router.post("/{session_id}/play-stage", response_model=FarmStageResponse, response_model_exclude_none=True)
+def play_farm_stage(
+    session_id: str,
+    action: FarmStageAction,
+    plots: bool = Query(False, description="Include per-plot results in the response."),
+    db: get_database = Depends()
+):
+    """
+    Play one stage on every plot of the farm in a single vectorized pass.
+
+    `plans` is a short list of actions and `plan_index` says which plan each
+    plot uses, so a 10,000-plot farm does not need 10,000 action objects.
+    """
+    return FarmSessionService(db).play_stage(session_id, action, include_plots=plots)
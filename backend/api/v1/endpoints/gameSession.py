@@ -1,10 +1,16 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, Request, Response, Query
 # from db.db import get_database
 from db.db import get_db as get_database
-from schemas.gameSession import GameSessionCreate, GameSessionInDB, GameSessionList, GameSession, StageSnapshotCreate, PlayerActionCreate
+from schemas.gameSession import GameSessionCreate, GameSessionInDB, GameSessionList, GameSession, StageSnapshot, StageSnapshotCreate, PlayerActionCreate, PlayStageDelta
 from services.gameSession import GameSessionService
+from services.turnSnapshot import TurnSnapshotService
+from services.idempotency import IdempotencyService
+from services.events import broker, session_topic, format_sse, TooManySubscribers
+from middleware.compression import strip_etag_coding
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pymongo.database import Database
-from typing import List
+from typing import List, Optional, Union
 from fastapi import HTTPException, status
 
 router = APIRouter(
@@ -12,16 +18,36 @@ router = APIRouter(
     tags=["Game Sessions"],
 )
 
+def _caller(request: Request, client_id: Optional[str]) -> str:
+    """Who sent the request: the client's `X-Client-ID`, or its address when it sends none."""
+    if client_id:
+        return f"id:{client_id}"
+    return f"addr:{request.client.host if request.client else ''}"
+
 @router.post("/", response_model=GameSessionInDB, status_code=201)
 def create_game_session(
     game_session: GameSessionCreate,
-    db: get_database = Depends()
+    request: Request,
+    response: Response,
+    db: get_database = Depends(),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    client_id: Optional[str] = Header(None, alias="X-Client-ID", description="Stable id of the client (e.g. a random id kept in local storage); scopes Idempotency-Key.")
 ):
     """
     Create a new game session.
+
+    Retries sending the same `Idempotency-Key` get the originally created session back.
+    Keys are scoped to the caller (`X-Client-ID`, or the client address without it),
+    so two clients using the same key never see each other's session.
     """
     # import pdb; pdb.set_trace()
-    return GameSessionService(db).create_game_session(game_session=game_session)
+    return IdempotencyService(db).run(
+        idempotency_key,
+        scope=f"create-game-session:{_caller(request, client_id)}",
+        request_body=game_session.dict(exclude={"start_time"}),
+        handler=lambda: GameSessionService(db).create_game_session(game_session=game_session),
+        response=response
+    )
 
 @router.get("/", response_model=GameSessionList)
 def read_game_sessions(
@@ -34,33 +60,114 @@ def read_game_sessions(
     sessions = GameSessionService(db).get_all_game_sessions()
     return {"game_sessions": sessions}
 
-@router.get("/{session_id}", response_model=GameSession)
+def _matching_etag(if_none_match: Optional[str], etag: str) -> Optional[str]:
+    """The tag of If-None-Match that matches `etag`, or None."""
+    if not if_none_match:
+        return None
+    for tag in (tag.strip() for tag in if_none_match.split(",")):
+        if tag == "*":
+            return etag
+        # If-None-Match uses weak comparison; compressed representations add a coding suffix
+        if strip_etag_coding(tag[2:] if tag.startswith("W/") else tag) == etag:
+            return tag
+    return None
+
+@router.get("/{session_id}", response_model=GameSession, responses={304: {"description": "Not modified"}})
 def get_game_session_by_id(
     session_id: str,
-    db: get_database = Depends()
+    response: Response,
+    db: get_database = Depends(),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match")
 ):
     """
     Lấy thông tin chi tiết của một phiên game bằng ID của nó.
+
+    Trả về header `ETag`; gửi lại qua `If-None-Match` để nhận 304 nếu session chưa thay đổi.
     """
-    game_session = GameSessionService(db).get_session_by_id(session_id)
+    service = GameSessionService(db)
+    if if_none_match:
+        matched = _matching_etag(if_none_match, service.get_session_etag(session_id))
+        if matched:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": matched})
+
+    game_session = service.get_session_by_id(session_id)
+    response.headers["ETag"] = service.make_etag(game_session.version, len(game_session.game_history))
     return game_session
 
-@router.post("/{session_id}/play-stage", response_model=GameSession)
+@router.get("/{session_id}/stages", response_model=List[StageSnapshot])
+def read_game_session_stages(
+    session_id: str,
+    from_stage: Optional[int] = Query(None, ge=1, description="First stage to return (inclusive)"),
+    to_stage: Optional[int] = Query(None, ge=1, description="Last stage to return (inclusive)"),
+    db: get_database = Depends()
+):
+    """
+    Lấy các lượt chơi của một phiên game (toàn bộ hoặc một khoảng stage),
+    không tải cả document của session.
+    """
+    return TurnSnapshotService(db).get_stages(session_id, from_stage, to_stage)
+
+@router.get("/{session_id}/events")
+async def stream_game_session_events(
+    session_id: str,
+    db: get_database = Depends()
+):
+    """
+    Server-Sent Events stream of a session's progress.
+
+    Sends a `snapshot` event with the current status and last stage, then a
+    `stage` event after every committed stage.
+    """
+    service = GameSessionService(db)
+    try:
+        subscription = broker.subscribe(session_topic(session_id))
+    except TooManySubscribers as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    try:
+        progress = await run_in_threadpool(service.get_progress, session_id)
+    except Exception:
+        broker.unsubscribe(subscription)
+        raise
+    return StreamingResponse(
+        broker.stream(subscription, initial=format_sse("snapshot", progress)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/{session_id}/play-stage", response_model=Union[PlayStageDelta, GameSession])
 def play_game_stage(
     session_id: str,
     player_action: PlayerActionCreate,
-    db: get_database = Depends()
+    response: Response,
+    db: get_database = Depends(),
+    view: str = Query("full", pattern="^(full|delta)$", description="'delta' returns only the new stage, cumulative state and status"),
+    prefer: Optional[str] = Header(None, description="'return=minimal' is the same as view=delta"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
     Thực hiện một lượt chơi cho giai đoạn hiện tại.
     
     Gửi hành động của người chơi. Backend sẽ tính toán kết quả,
     cập nhật trạng thái game và trả về session mới.
+
+    Retries sending the same `Idempotency-Key` replay the stored response
+    instead of playing the stage again.
+
+    `?view=delta` (hoặc header `Prefer: return=minimal`) chỉ trả về stage mới,
+    cumulative state và status thay vì toàn bộ session.
     """
     # import pdb; pdb.set_trace()
+    compact = view == "delta" or "return=minimal" in (prefer or "").replace(" ", "")
+    if compact:
+        response.headers["Preference-Applied"] = "return=minimal"
     service = GameSessionService(db)
-    updated_session = service.play_stage(session_id, player_action)
-    return updated_session
+    return IdempotencyService(db).run(
+        idempotency_key,
+        scope=f"play-stage:{session_id}",
+        request_body={"player_action": player_action, "view": "delta" if compact else "full"},
+        handler=lambda: service.play_stage(session_id, player_action, compact=compact),
+        response=response
+    )
 
 @router.post("/{session_id}/history", response_model=GameSession, status_code=status.HTTP_201_CREATED)
 def add_new_stage_to_session(
@@ -0,0 +1,21 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from db.db import db_client
+
+router = APIRouter(prefix="/health", tags=["Monitoring"])
+
+@router.get("/live")
+def liveness():
+    """
+    The process is up and serving requests.
+    """
+    return {"status": "ok"}
+
+@router.get("/ready")
+def readiness():
+    """
+    Ready to serve traffic: the last background MongoDB check succeeded.
+    Answered from the cached health state, never touches the database.
+    """
+    health = db_client.health
+    return JSONResponse(status_code=200 if db_client.is_ready() else 503, content=health)
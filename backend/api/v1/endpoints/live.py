@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, Query, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from db.db import get_db as get_database
+from services.gameSession import GameSessionService
+from services.events import broker, format_sse, LEADERBOARD_TOPIC, TooManySubscribers
+
+router = APIRouter(
+    prefix="/live",
+    tags=["Live"],
+)
+
+@router.get("/leaderboard")
+async def stream_leaderboard(
+    limit: int = Query(10, ge=1, le=100, description="Number of completed sessions in the initial snapshot"),
+    db: get_database = Depends()
+):
+    """
+    Server-Sent Events stream for classroom dashboards.
+
+    Sends a `snapshot` event with the best completed sessions, then a `stage`
+    event for every stage played by any player.
+    """
+    try:
+        subscription = broker.subscribe(LEADERBOARD_TOPIC)
+    except TooManySubscribers as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    try:
+        leaderboard = await run_in_threadpool(GameSessionService(db).get_leaderboard, limit)
+    except Exception:
+        broker.unsubscribe(subscription)
+        raise
+    return StreamingResponse(
+        broker.stream(subscription, initial=format_sse("snapshot", {"leaderboard": leaderboard})),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
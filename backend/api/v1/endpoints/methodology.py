@@ -0,0 +1,27 @@
+from typing import List
+from fastapi import APIRouter, Depends
+from db.db import get_db as get_database
+from schemas.methodology import MethodologyComparison, MethodologyComparisonRequest, MethodologyInfo
+from services.methodology import MethodologyService
+
+router = APIRouter(
+    prefix="/methodologies",
+    tags=["Emission Methodologies"],
+)
+
+
+@router.get("/", response_model=List[MethodologyInfo])
+def list_methodologies(db: get_database = Depends()):
+    """
+    Emission methodologies a session can be scored with (`methodology` when creating a session).
+    """
+    return MethodologyService(db).list_methodologies()
+
+
+@router.post("/compare", response_model=MethodologyComparison)
+def compare_methodologies(request: MethodologyComparisonRequest, db: get_database = Depends()):
+    """
+    Score one plan under every methodology (or the listed ones), side by side.
+    Each methodology evaluates all stages of the plan in one batched call.
+    """
+    return MethodologyService(db).compare(request)
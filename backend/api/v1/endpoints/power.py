@@ -9,7 +9,7 @@ app = FastAPI()
 router = APIRouter(prefix="/power", tags=["NASA POWER API"])
 
 @router.get("/api/temporal/daily/point")
-async def proxy_nasa_power_daily_point(
+def proxy_nasa_power_daily_point(
     start: int = Query(..., description="Start date in YYYYMMDD format"),
     end: int = Query(..., description="End date in YYYYMMDD format"),
     longitude: float = Query(..., description="Longitude of the point"),
@@ -25,6 +25,10 @@ async def proxy_nasa_power_daily_point(
     It constructs a request like:
 
     https://power.larc.nasa.gov/api/temporal/daily/point
+
+    Upstream calls are rate limited, retried with backoff and guarded by a
+    circuit breaker (see services/power.py). Declared sync so the blocking
+    call runs in the threadpool instead of the event loop.
     """
 
     try:
@@ -40,8 +44,13 @@ async def proxy_nasa_power_daily_point(
             time_standard=time_standard
         )
     except AppExceptionCase as e:
+        headers = {}
+        retry_after = (e.context or {}).get("retry_after")
+        if retry_after is not None:
+            headers["Retry-After"] = str(retry_after)
         return JSONResponse(
             status_code=e.status_code,
-            content={"error": e.exception_case, "context": e.context}
+            content={"error": e.exception_case, "context": e.context},
+            headers=headers
         )
 
@@ -0,0 +1,65 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import FileResponse
+from utils import profiling
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not profiling.is_admin(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token required.")
+
+router = APIRouter(
+    prefix="/admin/profiling",
+    tags=["Admin"],
+    dependencies=[Depends(require_admin)],
+)
+
+@router.get("/files")
+def list_profiles():
+    """
+    Request profiles and tracemalloc snapshots of this host, newest first.
+    """
+    return profiling.list_files()
+
+@router.get("/files/{name}")
+def download_profile(name: str):
+    """
+    Download one file: `*.speedscope.json` opens in https://www.speedscope.app,
+    `*.folded.txt` feeds flamegraph.pl, `*.tracemalloc` loads with `tracemalloc.Snapshot.load`.
+    """
+    path = profiling.file_path(name)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Profile '{name}' not found")
+    return FileResponse(path, filename=name)
+
+@router.get("/tracemalloc")
+def tracemalloc_status():
+    """
+    Allocation tracing state of the worker process that answers.
+    """
+    return profiling.tracemalloc_status()
+
+@router.post("/tracemalloc/start")
+def tracemalloc_start(frames: int = Query(25, ge=1, le=100, description="Traceback depth stored per allocation")):
+    """
+    Start tracing allocations in this worker. Tracing slows every allocation down; stop it when done.
+    """
+    return profiling.start_tracemalloc(frames)
+
+@router.post("/tracemalloc/stop")
+def tracemalloc_stop():
+    return profiling.stop_tracemalloc()
+
+@router.post("/tracemalloc/snapshot")
+def tracemalloc_snapshot(
+    limit: int = Query(30, ge=1, le=500),
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+    compare: bool = Query(False, description="Rank by growth since the previous snapshot of this worker")
+):
+    """
+    Take an allocation snapshot, save it to the profile directory and return the top allocation sites.
+    """
+    result = profiling.take_snapshot(limit, group_by, compare)
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="tracemalloc is not tracing; POST /admin/profiling/tracemalloc/start first.")
+    return result
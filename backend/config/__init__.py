@@ -1 +1,2 @@
-from .config import GAME_CONFIG
\ No newline at end of file
+from .config import GAME_CONFIG
+from .database import DB_CONFIG
\ No newline at end of file
@@ -0,0 +1,26 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGODB_USER = os.getenv("MONGODB_USER")
+MONGODB_PASSWORD = os.getenv("MONGODB_PASSWORD")
+
+# Either set MONGODB_URI, or MONGODB_USER/MONGODB_PASSWORD (+ MONGODB_HOST) for Atlas
+DEFAULT_URI = (
+    f"mongodb+srv://{MONGODB_USER}:{MONGODB_PASSWORD}@{os.getenv('MONGODB_HOST', 'cluster0.olr4kkg.mongodb.net')}"
+    "/?retryWrites=true&w=majority&appName=Cluster0"
+)
+
+DB_CONFIG = {
+    "uri": os.getenv("MONGODB_URI", DEFAULT_URI),
+    "db_name": os.getenv("MONGODB_DB"),
+    "max_pool_size": int(os.getenv("MONGODB_MAX_POOL_SIZE", "100")),
+    "min_pool_size": int(os.getenv("MONGODB_MIN_POOL_SIZE", "0")),
+    "max_idle_time_ms": int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "60000")),
+    "server_selection_timeout_ms": int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+    "connect_timeout_ms": int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000")),
+    "socket_timeout_ms": int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "20000")),
+    # Seconds between background health checks backing /health/ready
+    "health_check_interval": float(os.getenv("MONGODB_HEALTH_CHECK_INTERVAL", "10")),
+}
@@ -0,0 +1,23 @@
+"""
+Keys of the emission model: fertilizer types, water regimes and methodologies.
+
+Request schemas validate against these, and the coefficient tables of
+`services.engine_core` and the registry of `services.emission_methods` are
+checked against them at import, so schemas never import the engine.
+
+Tên các loại phân bón, chế độ tưới và phương pháp tính phát thải.
+"""
+
+import os
+
+ORGANIC_FERTILIZERS = ("Straw_short", "Straw_long", "Compost", "Farm_yard_manure", "Green_manure")
+SYNTHETIC_FERTILIZERS = (
+    "Urea", "Diammonium_phosphate", "Ammonium_sulphate", "Ammonium_chloride", "Ammonium_nitrate",
+    "Lân", "Kali", "NPK_de_nhanh", "NPK_lam_rong",
+)
+WATER_REGIMES = ("AWD", "regular_rainfed", "traditional_technique")
+
+# Sessions created before methodologies existed were scored with this one
+LEGACY_METHODOLOGY = "monnas"
+METHODOLOGIES = (LEGACY_METHODOLOGY, "ipcc2006", "ipcc2019", "ipcc2019-sea", "ipcc2019-vn")
+DEFAULT_METHODOLOGY = os.getenv("EMISSION_METHODOLOGY", LEGACY_METHODOLOGY)
@@ -0,0 +1,62 @@
+from typing import Optional
+
+import numpy as np
+from bson import Binary
+
+from services.main import AppCRUD
+from models.farmSession import FarmSessionModel
+from models.main import ObjectId
+
+COLLECTION_NAME = FarmSessionModel.Config.collection_name
+
+# Per-plot arrays are stored as raw little-endian bytes (BSON Binary): a 10,000-plot
+# float64 column is 80 KB instead of a 10,000-element BSON array.
+FLOAT = np.dtype("<f8")
+INDEX = np.dtype("<u4")
+CODE = np.dtype("u1")
+
+# Everything needed to play the next stage, without the per-stage arrays of the history
+STATE_PROJECTION = {
+    "history.ch4": 0,
+    "history.n2o": 0,
+    "history.plan_index": 0,
+}
+
+
+def pack(array: np.ndarray, dtype: np.dtype) -> Binary:
+    return Binary(np.ascontiguousarray(array, dtype=dtype).tobytes())
+
+
+def unpack(data: bytes, dtype: np.dtype) -> np.ndarray:
+    return np.frombuffer(data, dtype=dtype)
+
+
+class FarmSessionCRUD(AppCRUD):
+    def create(self, doc: dict) -> dict:
+        """Lưu một farm session mới (document đã được dựng sẵn bởi service)."""
+        result = self.db[COLLECTION_NAME].insert_one(doc)
+        doc["_id"] = result.inserted_id
+        return doc
+
+    def get_state(self, session_id: str) -> Optional[dict]:
+        """
+        Lấy farm session, không kèm các mảng theo từng stage trong lịch sử.
+        """
+        return self.db[COLLECTION_NAME].find_one({"_id": ObjectId(session_id)}, STATE_PROJECTION)
+
+    def get_last_stage(self, session_id: str) -> Optional[dict]:
+        """Stage cuối cùng, kèm các mảng theo từng ô."""
+        doc = self.db[COLLECTION_NAME].find_one(
+            {"_id": ObjectId(session_id)}, {"history": {"$slice": -1}, "plots": 0, "cumulative": 0}
+        )
+        return doc["history"][0] if doc and doc.get("history") else None
+
+    def append_stage(self, session_id: str, version: int, stage: dict, sets: dict) -> bool:
+        """
+        $push stage mới và $set trạng thái, chỉ khi không ai ghi đè session kể từ lúc đọc (version).
+        """
+        result = self.db[COLLECTION_NAME].update_one(
+            {"_id": ObjectId(session_id), "version": version},
+            {"$push": {"history": stage}, "$set": {**sets, "version": version + 1}}
+        )
+        return result.matched_count == 1
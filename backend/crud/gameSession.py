@@ -3,23 +3,37 @@ from typing import List, Optional
 from schemas.gameSession import GameSessionCreate, GameSession, GameSessionInDB, StageSnapshot
 from services.main import AppCRUD # Giả sử AppCRUD được định nghĩa ở đây
 from models.gameSession import GameSessionModel
+from crud.turnSnapshot import TurnSnapshotCRUD
+from services.weather_samples import DrawnWeather
 from pydantic import ValidationError
 from models.main import ObjectId
 from config import GAME_CONFIG 
+import logging
+
+logger = logging.getLogger(__name__)
 
 class GameSessionCRUD(AppCRUD):
-    def create_game_session(self, game_session: GameSessionCreate) -> GameSessionInDB:
+    def create_game_session(self, game_session: GameSessionCreate, weather: Optional[DrawnWeather] = None) -> GameSessionInDB:
+        """
+        Tạo session mới. `weather` là thời tiết ngẫu nhiên đã lấy mẫu (weather_mode "stochastic");
+        nếu không có thì dùng thời tiết cố định của mùa vụ.
+        """
         # Chuyển đổi model create thành một dictionary để insert
         new_game_session_data = game_session.dict()
-        print('New game session data to insert: ', new_game_session_data)
         weather_data = GAME_CONFIG['weather_data'][new_game_session_data['season_key']]
-        print('Weather data for season:', weather_data)
+        if weather is not None:
+            weather_data = weather.weather_data
+            new_game_session_data.update({"weather_seed": weather.seed, "weather_year": weather.year})
+        logger.debug("Creating game session", extra={"season_key": new_game_session_data['season_key']})
         # Thêm các trường mặc định nếu cần
         new_game_session_data.update({
             "end_time": None,
             "weather_data": weather_data, 
-            "game_history": [],
-            "final_metrics": None
+            # Stages are stored in the turnSnapshot collection, not in a game_history array
+            "stage_count": 0,
+            "final_metrics": None,
+            "version": 0,
+            "last_activity": new_game_session_data['start_time']
         })
         COLLECTION_NAME = GameSessionModel.Config.collection_name
         result = self.db[COLLECTION_NAME].insert_one(new_game_session_data)
@@ -29,12 +43,33 @@ class GameSessionCRUD(AppCRUD):
     def get_all_game_sessions(self) -> List[GameSessionInDB]:
         COLLECTION_NAME = GameSessionModel.Config.collection_name
         sessions = list(self.db[COLLECTION_NAME].find())
+        stored = [session["_id"] for session in sessions if session.get("stage_count") is not None]
+        stages = TurnSnapshotCRUD(self.db).get_stages_by_session(stored) if stored else {}
+        for session in sessions:
+            if session["_id"] in stages:
+                session["game_history"] = stages[session["_id"]]
         return [GameSessionInDB(**session) for session in sessions]
     
-    
-    def get_by_id(self, session_id: str) -> Optional[GameSessionInDB]:
+    def with_history(self, session_doc: dict, last_stage_only: bool = False) -> dict:
+        """
+        Gắn các stage từ turnSnapshot vào document (game_history), hoặc chỉ stage cuối.
+        Session cũ vẫn lưu game_history bên trong document được trả về nguyên vẹn.
         """
-        Lấy một game session bằng ID của nó.
+        if session_doc.get("stage_count") is None:
+            return session_doc
+        snapshots = TurnSnapshotCRUD(self.db)
+        session_id = str(session_doc["_id"])
+        if last_stage_only:
+            last = snapshots.get_last_stage(session_id) if session_doc["stage_count"] else None
+            session_doc["game_history"] = [last] if last else []
+        else:
+            session_doc["game_history"] = snapshots.get_stages(session_id)
+        return session_doc
+
+    def get_by_id(self, session_id: str, last_stage_only: bool = False) -> Optional[GameSessionInDB]:
+        """
+        Lấy một game session bằng ID của nó, kèm lịch sử các stage
+        (chỉ stage cuối nếu `last_stage_only`, đủ để chơi lượt tiếp theo).
         Trả về None nếu không tìm thấy.
         """
         COLLECTION_NAME = GameSessionModel.Config.collection_name
@@ -42,7 +77,7 @@ class GameSessionCRUD(AppCRUD):
         session_doc = self.db[COLLECTION_NAME].find_one({"_id": ObjectId(session_id)})
         
         if session_doc:
-            return GameSessionInDB.parse_obj(session_doc)
+            return GameSessionInDB.parse_obj(self.with_history(session_doc, last_stage_only))
             
         return None
     
@@ -53,8 +88,9 @@ class GameSessionCRUD(AppCRUD):
         """
         COLLECTION_NAME = GameSessionModel.Config.collection_name
         
-        # make sure _id be used
-        session_data = session.dict(by_alias=True)
+        # make sure _id be used; stages stored in turnSnapshot stay out of the document
+        session_data = session.dict(by_alias=True, exclude={"game_history"} if session.stage_count is not None else None)
+        session_data["version"] = session.version + 1
 
         result = self.db[COLLECTION_NAME].replace_one(
             {"_id": ObjectId(session.id)}, 
@@ -68,6 +104,43 @@ class GameSessionCRUD(AppCRUD):
         
         return None 
     
+    def append_stage(self, session: GameSession) -> bool:
+        """
+        Ghi lượt vừa chơi: một insert nhỏ vào turnSnapshot và $set trạng thái của session,
+        chỉ khi không ai ghi session kể từ lúc đọc (version). Session cũ còn lưu game_history
+        bên trong document được chuyển toàn bộ lịch sử sang turnSnapshot ở lượt này.
+
+        Trả về False nếu một lượt chơi đồng thời đã ghi trước.
+        """
+        COLLECTION_NAME = GameSessionModel.Config.collection_name
+
+        snapshots = TurnSnapshotCRUD(self.db)
+        stages = session.game_history if session.stage_count is None else session.game_history[-1:]
+        inserted = snapshots.insert(str(session.id), stages, session.last_activity, session.engine_version)
+        if inserted is None:
+            return False
+
+        version = session.version
+        result = self.db[COLLECTION_NAME].update_one(
+            {"_id": ObjectId(session.id), "version": {"$in": [0, None]} if version == 0 else version},
+            {
+                "$set": {
+                    "status": session.status,
+                    "end_time": session.end_time,
+                    "final_metrics": session.final_metrics,
+                    "engine_version": session.engine_version,
+                    "last_activity": session.last_activity,
+                    "stage_count": session.game_history[-1].stage_number,
+                    "version": version + 1
+                },
+                "$unset": {"game_history": ""}
+            }
+        )
+        if result.matched_count != 1:
+            snapshots.delete(inserted)
+            return False
+        return True
+
     def add_turn_to_history(self, session_id: str, turn: StageSnapshot) -> GameSessionInDB:
         """
         Thêm một TurnSnapshot vào mảng game_history của một GameSession.
@@ -75,7 +148,7 @@ class GameSessionCRUD(AppCRUD):
         """
         result = self.db["gameSession"].find_one_and_update(
             {"_id": ObjectId(session_id)},
-            {"$push": {"game_history": turn.dict()}},
+            {"$push": {"game_history": turn.dict()}, "$inc": {"version": 1}},
             return_document=True # Trả về document sau khi đã update
         )
         return GameSessionInDB.parse_obj(result)
@@ -89,7 +162,7 @@ class GameSessionCRUD(AppCRUD):
 
         result = self.db["gameSession"].find_one_and_update(
             {"_id": ObjectId(session_id)},
-            {"$set": update_fields},
+            {"$set": update_fields, "$inc": {"version": 1}},
             array_filters=[{"turn.turn_number": turn_number}],
             return_document=True
         )
@@ -102,8 +175,53 @@ class GameSessionCRUD(AppCRUD):
         """
         result = self.db["gameSession"].find_one_and_update(
             {"_id": ObjectId(session_id)},
-            {"$pull": {"game_history": {"turn_number": turn_number}}},
+            {"$pull": {"game_history": {"turn_number": turn_number}}, "$inc": {"version": 1}},
             return_document=True
         )
         return GameSessionInDB.parse_obj(result)
-    
\ No newline at end of file
+
+    def get_history_source(self, session_id: str) -> Optional[dict]:
+        """
+        Chỉ lấy stage_count và game_history (session cũ) để biết các stage được lưu ở đâu.
+        """
+        COLLECTION_NAME = GameSessionModel.Config.collection_name
+        return self.db[COLLECTION_NAME].find_one({"_id": ObjectId(session_id)}, {"stage_count": 1, "game_history": 1})
+
+    def get_version(self, session_id: str) -> Optional[dict]:
+        """
+        Chỉ lấy version và số stage của session (không tải document) để tính ETag.
+        """
+        COLLECTION_NAME = GameSessionModel.Config.collection_name
+        result = list(self.db[COLLECTION_NAME].aggregate([
+            {"$match": {"_id": ObjectId(session_id)}},
+            {"$project": {
+                "version": {"$ifNull": ["$version", 0]},
+                "stage_count": {"$ifNull": ["$stage_count", {"$size": {"$ifNull": ["$game_history", []]}}]}
+            }}
+        ]))
+        return result[0] if result else None
+
+    def get_progress(self, session_id: str) -> Optional[dict]:
+        """
+        Lấy trạng thái hiện tại (status, stage cuối cùng) mà không tải toàn bộ document.
+        """
+        COLLECTION_NAME = GameSessionModel.Config.collection_name
+        progress = self.db[COLLECTION_NAME].find_one(
+            {"_id": ObjectId(session_id)},
+            {"player_name": 1, "status": 1, "final_metrics": 1, "stage_count": 1, "game_history": {"$slice": -1}}
+        )
+        if progress:
+            self.with_history(progress, last_stage_only=True)
+            progress.pop("stage_count", None)
+        return progress
+
+    def get_leaderboard(self, limit: int = 10) -> List[dict]:
+        """
+        Các ván đã hoàn thành có tổng phát thải thấp nhất.
+        """
+        COLLECTION_NAME = GameSessionModel.Config.collection_name
+        cursor = self.db[COLLECTION_NAME].find(
+            {"status": "completed"},
+            {"player_name": 1, "season_key": 1, "water_regime": 1, "final_metrics": 1}
+        ).sort("final_metrics.final_net_emission", 1).limit(limit)
+        return list(cursor)
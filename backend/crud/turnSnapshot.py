@@ -1,6 +1,133 @@
-# from services.main import AppCRUD
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
 
-# class TurnSnapshotCRUD(AppCRUD):
-#     def create_turn_snapshot(self, turn_snapshot: TurnSnapshotCreate):
-#         pass
-    
\ No newline at end of file
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError
+
+from services.main import AppCRUD
+from models.turnSnapshot import TurnSnapshotModel
+from models.main import ObjectId
+from schemas.gameSession import StageSnapshot
+
+COLLECTION_NAME = TurnSnapshotModel.Config.collection_name
+
+# Store snapshots in a MongoDB time-series collection (timeField created_at, metaField session_id).
+# Only applies when the collection is created. Time-series collections cannot have a unique index,
+# so concurrent plays are then caught by the session version alone, and rolling back the loser's
+# snapshot needs MongoDB 7.0+ (deletes by _id).
+TURN_SNAPSHOT_TIMESERIES = os.getenv("TURN_SNAPSHOT_TIMESERIES", "false").lower() in ("1", "true", "yes")
+
+# Fields of a snapshot document that are part of the StageSnapshot schema
+STAGE_PROJECTION = {"_id": 0, "session_id": 0, "created_at": 0, "engine_version": 0}
+
+_ready_dbs = set()
+
+
+class TurnSnapshotCRUD(AppCRUD):
+    """
+    Các lượt chơi của game session, mỗi lượt là một document riêng trong `turnSnapshot`,
+    đánh index theo (session_id, stage_number).
+    """
+
+    def _collection(self):
+        collection = self.db[COLLECTION_NAME]
+        if id(self.db) not in _ready_dbs:
+            if TURN_SNAPSHOT_TIMESERIES:
+                try:
+                    self.db.create_collection(COLLECTION_NAME, timeseries={
+                        "timeField": "created_at", "metaField": "session_id", "granularity": "seconds"
+                    })
+                except CollectionInvalid: # already exists
+                    pass
+                collection.create_index([("session_id", ASCENDING), ("stage_number", ASCENDING)])
+            else:
+                # Unique: two concurrent plays of the same stage cannot both be stored
+                collection.create_index([("session_id", ASCENDING), ("stage_number", ASCENDING)], unique=True)
+            _ready_dbs.add(id(self.db))
+        return collection
+
+    @staticmethod
+    def _document(session_id: ObjectId, stage: StageSnapshot, created_at: datetime, engine_version: Optional[str]) -> dict:
+        return {
+            "session_id": session_id,
+            **stage.dict(),
+            "created_at": created_at,
+            "engine_version": engine_version,
+        }
+
+    def insert(self, session_id: str, stages: List[StageSnapshot], created_at: datetime,
+               engine_version: Optional[str] = None) -> Optional[List[ObjectId]]:
+        """
+        Lưu các stage mới. Trả về các _id đã chèn, hoặc None nếu một stage đã tồn tại
+        (một lượt chơi đồng thời đã lưu trước).
+        """
+        docs = [self._document(ObjectId(session_id), stage, created_at, engine_version) for stage in stages]
+        collection = self._collection()
+        try:
+            if len(docs) == 1:
+                return [collection.insert_one(docs[0]).inserted_id]
+            return collection.insert_many(docs, ordered=True).inserted_ids
+        except DuplicateKeyError:
+            return None
+        except BulkWriteError as e:
+            # Keep the stages inserted before the duplicate from leaking
+            self.delete([doc["_id"] for doc in docs[:e.details.get("nInserted", 0)]])
+            return None
+
+    def delete(self, snapshot_ids: Iterable[ObjectId]):
+        snapshot_ids = list(snapshot_ids)
+        if snapshot_ids:
+            self._collection().delete_many({"_id": {"$in": snapshot_ids}})
+
+    def get_stages(self, session_id: str, first: Optional[int] = None, last: Optional[int] = None) -> List[dict]:
+        """
+        Các stage của một session theo thứ tự, chỉ trong khoảng [first, last] nếu có.
+        """
+        query = {"session_id": ObjectId(session_id)}
+        if first is not None or last is not None:
+            query["stage_number"] = {
+                **({"$gte": first} if first is not None else {}),
+                **({"$lte": last} if last is not None else {}),
+            }
+        return list(self._collection().find(query, STAGE_PROJECTION).sort("stage_number", ASCENDING))
+
+    def get_last_stage(self, session_id: str) -> Optional[dict]:
+        return self._collection().find_one(
+            {"session_id": ObjectId(session_id)}, STAGE_PROJECTION, sort=[("stage_number", DESCENDING)]
+        )
+
+    def get_stages_by_session(self, session_ids: List[ObjectId]) -> Dict[ObjectId, List[dict]]:
+        """Các stage của nhiều session trong một truy vấn, nhóm theo session_id."""
+        by_session = {session_id: [] for session_id in session_ids}
+        cursor = self._collection().find(
+            {"session_id": {"$in": list(session_ids)}}, {"_id": 0, "created_at": 0, "engine_version": 0}
+        ).sort([("session_id", ASCENDING), ("stage_number", ASCENDING)])
+        for doc in cursor:
+            by_session[doc.pop("session_id")].append(doc)
+        return by_session
+
+    def get_documents_by_session(self, session_ids: List[ObjectId]) -> Dict[ObjectId, List[dict]]:
+        """Các document stage đầy đủ (trừ _id) của nhiều session, nhóm theo session_id; dùng khi lưu trữ."""
+        by_session = {session_id: [] for session_id in session_ids}
+        cursor = self._collection().find(
+            {"session_id": {"$in": list(session_ids)}}, {"_id": 0}
+        ).sort([("session_id", ASCENDING), ("stage_number", ASCENDING)])
+        for doc in cursor:
+            by_session[doc["session_id"]].append(doc)
+        return by_session
+
+    def delete_sessions(self, session_ids: Iterable[ObjectId]):
+        session_ids = list(session_ids)
+        if session_ids:
+            self._collection().delete_many({"session_id": {"$in": session_ids}})
+
+    def replace_session(self, session_id: ObjectId, docs: List[dict]):
+        """
+        Ghi lại các stage của một session (khi khôi phục từ kho lưu trữ). Xóa các stage
+        cũ trước, nên gọi lại sau khi bị gián đoạn vẫn an toàn.
+        """
+        collection = self._collection()
+        collection.delete_many({"session_id": session_id})
+        if docs:
+            collection.insert_many([dict(doc) for doc in docs], ordered=True)
@@ -1,24 +1,48 @@
 from typing import Union
 from fastapi import FastAPI, Query
 import requests
-from api.v1.endpoints import power, gameSession, playerAction
+from api.v1.endpoints import power, gameSession, farmSession, playerAction, methodology, metrics, live, health, profiling
 from middleware.cors import setup_cors
+from middleware.http import setup_timing, setup_request_id
+from middleware.compression import setup_compression
+from middleware.profiling import setup_profiling
 from contextlib import asynccontextmanager
-from db.db import db_client
+from db.db import db_client, get_db
+from services.session_archive import archive_periodically, SESSION_ARCHIVE_INTERVAL_SECONDS
+from services import static_data
+from utils.log import setup_logging, shutdown_logging
+from utils.profiling import PROFILING_ENABLED
+import asyncio
+import logging
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("Starting up...")
-    # Ping to confirm a successful connection
-    try:
-        db_client.client.admin.command('ping')
-        print("Pinged your deployment. You successfully connected to MongoDB!")
-    except Exception as e:
-        print(e)
+    logger.info("Starting up...")
+    # Warm up the Mongo pool and keep the readiness state fresh in the background,
+    # so startup does not block on the cluster
+    health_task = asyncio.create_task(db_client.monitor())
+    background_tasks = [health_task]
+    # One worker publishes static game data to shared memory; the others attach to it
+    background_tasks.append(asyncio.create_task(static_data.maintain(get_db)))
+    # Move abandoned / long-completed sessions out of the hot collection
+    if SESSION_ARCHIVE_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(archive_periodically(get_db)))
     
     yield
     
-    print("Shutting down...")
+    logger.info("Shutting down...")
+    for task in background_tasks:
+        task.cancel()
+    for task in background_tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
     db_client.close()
+    shutdown_logging()
 # @asynccontextmanager
 # async def lifespan(app: FastAPI):
 #     print("Starting up...")
@@ -33,9 +57,22 @@ async def lifespan(app: FastAPI):
 app = FastAPI(lifespan=lifespan)
 
 setup_cors(app)
+setup_compression(app)
+setup_profiling(app)
+setup_timing(app)
+setup_request_id(app)
 
 app.include_router(power.router)
 app.include_router(gameSession.router)
+app.include_router(farmSession.router)
 app.include_router(playerAction.router)
+app.include_router(methodology.router)
+app.include_router(live.router)
+app.include_router(metrics.router)
+app.include_router(health.router)
+
 
 
+# Admin-only profiling endpoints exist only when profiling is enabled
+if PROFILING_ENABLED:
+    app.include_router(profiling.router)
@@ -0,0 +1,138 @@
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError: # optional, gzip is always available
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSIBLE_TYPES = (b"application/json", b"text/")
+
+
+def _choose_encoding(accept_encoding: str):
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, *params = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0: # q=0 means "not acceptable"
+            accepted.add(coding)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def coded_etag(etag: bytes, encoding: str) -> bytes:
+    """The ETag of a compressed representation: '"1.4"' -> '"1.4-gzip"', keeping a W/ prefix."""
+    if not etag.endswith(b'"'):
+        return etag
+    return etag[:-1] + b"-" + encoding.encode("latin-1") + b'"'
+
+
+def strip_etag_coding(etag: str) -> str:
+    """The identity ETag behind a tag sent back in If-None-Match ('"1.4-br"' -> '"1.4"')."""
+    for encoding in ("gzip", "br"):
+        suffix = f'-{encoding}"'
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        # Low quality keeps CPU cost close to gzip -6 while still compressing better
+        return brotli.compress(body, quality=4)
+    return gzip.compress(body, compresslevel=6)
+
+
+class CompressionMiddleware:
+    """
+    Compress complete JSON/text responses larger than `COMPRESSION_MIN_SIZE`
+    with brotli (when installed and accepted) or gzip.
+
+    Streaming responses (e.g. Server-Sent Events) and responses that already
+    have a Content-Encoding are passed through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = _choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = dict(message.get("headers", []))
+                content_type = headers.get(b"content-type", b"")
+                if b"content-encoding" in headers or not content_type.startswith(COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            passthrough = True
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = _compress(body, encoding)
+            vary = b"Accept-Encoding"
+            headers = []
+            for name, value in start_message.get("headers", []):
+                if name == b"vary":
+                    vary = value + b", Accept-Encoding"
+                elif name == b"etag":
+                    # A strong ETag names one exact byte sequence: tag the compressed one apart
+                    headers.append((name, coded_etag(value, encoding)))
+                elif name != b"content-length":
+                    headers.append((name, value))
+            headers += [
+                (b"content-encoding", encoding.encode("latin-1")),
+                (b"content-length", str(len(compressed)).encode("latin-1")),
+                (b"vary", vary),
+            ]
+            start_message["headers"] = headers
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def setup_compression(app):
+    app.add_middleware(CompressionMiddleware)
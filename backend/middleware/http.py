@@ -0,0 +1,87 @@
+import time
+import uuid
+from utils.log import request_id_var
+from utils.metrics import (
+    HTTP_REQUEST_DURATION, HTTP_REQUESTS_TOTAL, HTTP_REQUESTS_IN_FLIGHT,
+    start_request_spans, server_timing_header,
+)
+
+
+class TimingMiddleware:
+    """
+    Pure ASGI middleware that records per-route latency, status counters and
+    in-flight requests, and adds a `Server-Timing` header with the spans
+    recorded by the handler (see `utils.metrics.span`).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        spans = start_request_spans()
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                header = server_timing_header(spans, time.perf_counter() - started)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode("latin-1"))]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc(method)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec(method)
+            # Label by route template (/game-sessions/{session_id}) to keep cardinality bounded
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, method, route_path)
+            HTTP_REQUESTS_TOTAL.inc(method, route_path, str(status_code))
+
+
+class RequestIdMiddleware:
+    """
+    Tag each request with an id (the client's `X-Request-ID` or a new one),
+    expose it to log records via `utils.log.request_id_var` and echo it back.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:128]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
+
+
+def setup_timing(app):
+    app.add_middleware(TimingMiddleware)
+
+def setup_request_id(app):
+    app.add_middleware(RequestIdMiddleware)
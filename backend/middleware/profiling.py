@@ -0,0 +1,56 @@
+import os
+import threading
+
+from utils import profiling
+from utils.log import request_id_var
+
+
+class ProfilingMiddleware:
+    """
+    Sample the stacks of requests picked by `utils.profiling.should_profile`
+    (admin `X-Profile: 1` header or `PROFILING_SAMPLE_RATE`) and name the
+    profile file in an `X-Profile-File` response header.
+
+    Only installed when `PROFILING_ENABLED` is set.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header = token = None
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                header = value.decode("latin-1")
+            elif name == b"x-admin-token":
+                token = value.decode("latin-1")
+        if not profiling.should_profile(header, token):
+            await self.app(scope, receive, send)
+            return
+
+        sampler = profiling.Sampler.begin(profiling.profile_name(scope["method"], scope["path"], request_id_var.get()))
+        if sampler is None: # PROFILING_MAX_CONCURRENT samplers already running
+            await self.app(scope, receive, send)
+            return
+        # The event loop thread; sync handlers add their threadpool thread via profiling.attach()
+        sampler.watch(threading.get_ident())
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                file_name = os.path.basename(sampler.path)
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-file", file_name.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.end()
+
+
+def setup_profiling(app):
+    if profiling.PROFILING_ENABLED:
+        app.add_middleware(ProfilingMiddleware)
@@ -0,0 +1,7 @@
+from models.main import MongoBaseModel
+
+
+class FarmSessionModel(MongoBaseModel):
+    player_name: str
+    class Config(MongoBaseModel.Config):
+        collection_name = "farmSession"
@@ -1,7 +1,8 @@
-from models.main import MongoBaseModel
+from models.main import MongoBaseModel, PyObjectId
 
 # Model cụ thể của bạn kế thừa từ MongoBaseModel
 class TurnSnapshotModel(MongoBaseModel):
-    turn_number: int
+    session_id: PyObjectId
+    stage_number: int
     class Config(MongoBaseModel.Config): # Kế thừa Config của lớp cha
-        collection_name = "gameSession"
\ No newline at end of file
+        collection_name = "turnSnapshot"
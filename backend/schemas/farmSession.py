@@ -0,0 +1,103 @@
+from pydantic import BaseModel, Field, validator
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Union
+from models.main import PyObjectId, ObjectId
+from config.model_keys import LEGACY_METHODOLOGY
+from schemas.gameSession import StageAction, StageResult, CumulativeState, methodology_key
+
+
+# -----------------Farm Session-------------------------
+class FarmSessionCreate(BaseModel):
+    """
+    A farm made of many plots (tiles of the grid map).
+    Một trang trại gồm nhiều ô ruộng, mỗi ô có diện tích và chế độ tưới riêng.
+    """
+    player_name: str = Field(default="Anonymous", description="Player's name (optional).")
+    season_key: str = Field(default="dong-xuan", description="The key for the chosen season, e.g., 'dong-xuan'.")
+    areas: List[float] = Field(..., min_items=1, description="Area of each plot in hectares.")
+    water_regimes: Union[str, List[str]] = Field(
+        default="traditional_technique",
+        description="One water regime for every plot, or one per plot."
+    )
+    methodology: Optional[str] = Field(None, description="Emission methodology for this farm; the server default when omitted.")
+
+    @validator("areas", each_item=True)
+    def area_positive(cls, value):
+        if value <= 0:
+            raise ValueError("plot area must be positive")
+        return value
+
+    @validator("water_regimes")
+    def regimes_match_plots(cls, value, values):
+        if isinstance(value, list) and "areas" in values and len(value) != len(values["areas"]):
+            raise ValueError("water_regimes must have one entry per plot")
+        return value
+
+    @validator("methodology", always=True)
+    def known_methodology(cls, value):
+        return methodology_key(value)
+
+
+class FarmStageAction(BaseModel):
+    """
+    A stage action for the whole farm: a few plans and, for every plot, the plan applied to it.
+    Hành động của một lượt cho toàn trang trại: vài phương án và phương án áp dụng cho từng ô.
+    """
+    plans: List[StageAction] = Field(..., min_items=1, description="`player_action` bodies ({'fertilization': ..., 'irrigation': ...}).")
+    plan_index: Optional[List[int]] = Field(None, description="Plan used by each plot; all plots use plans[0] when omitted.")
+
+
+class PlotResults(BaseModel):
+    """Per-plot values, in plot order."""
+    ch4_emission: List[float] = Field(..., description="CH4 emitted by each plot in the last stage (kg).")
+    n2o_emission: List[float] = Field(..., description="N2O emitted by each plot in the last stage (kg).")
+    cumulative_emission: List[float] = Field(..., description="Total GHG emission of each plot so far (kg CO2e).")
+    biomass: Optional[List[float]] = Field(None, description="Standing rice biomass of each plot (kg).")
+
+
+class FarmStage(BaseModel):
+    stage_number: int
+    stage_name: str
+    weather_conditions: Dict[str, Any]
+    plans: List[Dict[str, Any]]
+    stage_result: StageResult = Field(..., description="Whole-farm results of this stage.")
+    cumulative_state: CumulativeState = Field(..., description="Whole-farm cumulative state after this stage.")
+
+
+class FarmSession(BaseModel):
+    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    player_name: str
+    season_key: str
+    status: str
+    start_time: datetime
+    end_time: Optional[datetime] = None
+    last_activity: Optional[datetime] = None
+    version: int = 0
+    methodology: str = LEGACY_METHODOLOGY
+    engine_version: Optional[str] = None
+    plot_count: int
+    total_area: float
+    history: List[FarmStage] = []
+    final_metrics: Optional[Dict[str, Any]] = None
+    plots: Optional[PlotResults] = Field(None, description="Per-plot results, only when requested with `plots=true`.")
+
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {
+            datetime: lambda dt: dt.isoformat(),
+            ObjectId: str
+        }
+
+
+class FarmStageResponse(BaseModel):
+    """
+    Result of playing one farm stage.
+    Kết quả của một lượt chơi trên toàn trang trại.
+    """
+    session_id: str
+    status: str
+    version: int
+    stage: FarmStage
+    final_metrics: Optional[Dict[str, Any]] = None
+    plots: Optional[PlotResults] = None
@@ -1,7 +1,100 @@
-from pydantic import BaseModel, UUID4, Field
+import os
+from enum import Enum
+from pydantic import BaseModel, UUID4, Field, confloat, validator
 from datetime import datetime
 from typing import Optional, Dict, Any, List
 from models.main import PyObjectId, ObjectId
+from config.model_keys import (
+    ORGANIC_FERTILIZERS, SYNTHETIC_FERTILIZERS, METHODOLOGIES, DEFAULT_METHODOLOGY, LEGACY_METHODOLOGY
+)
+
+# Upper bounds of a stage action, checked once when the request is parsed
+MAX_ORGANIC_AMOUNT = float(os.getenv("ACTION_MAX_ORGANIC_AMOUNT", "50")) # t/ha
+MAX_SYNTHETIC_AMOUNT = float(os.getenv("ACTION_MAX_SYNTHETIC_AMOUNT", "1000")) # kg/ha
+MAX_FLOODING_LEVEL = float(os.getenv("ACTION_MAX_FLOODING_LEVEL", "30")) # cm
+
+# Fertilizer types are the keys of the engine's coefficient tables
+OrganicFertilizer = Enum("OrganicFertilizer", {name: name for name in ORGANIC_FERTILIZERS}, type=str)
+SyntheticFertilizer = Enum("SyntheticFertilizer", {name: name for name in SYNTHETIC_FERTILIZERS}, type=str)
+
+
+def _fertilizer_key(name) -> str:
+    return str(name).strip().lower().replace(" ", "_").replace("-", "_")
+
+# Labels the frontend (StepPlay.tsx) sends for some engine keys
+FERTILIZER_ALIASES = {
+    "Superphosphate": "Lân",
+    "NPK in stage 2 (NPK_de_nhanh)": "NPK_de_nhanh",
+    "NPK in stage 3 (NPK_lam_rong)": "NPK_lam_rong",
+}
+
+_FERTILIZER_NAMES = {
+    _fertilizer_key(name): name for name in (*ORGANIC_FERTILIZERS, *SYNTHETIC_FERTILIZERS)
+} | {_fertilizer_key(alias): name for alias, name in FERTILIZER_ALIASES.items()}
+
+
+def methodology_key(value: Optional[str]) -> str:
+    """The methodology key of a create request; the server default when omitted."""
+    value = value or DEFAULT_METHODOLOGY
+    if value not in METHODOLOGIES:
+        raise ValueError(f"Unknown methodology {value!r}; expected one of {list(METHODOLOGIES)}")
+    return value
+
+
+class Fertilization(BaseModel):
+    """
+    Fertilizer applied in a stage, amount per type.
+    Lượng phân bón theo từng loại; tên loại phải có trong bảng hệ số của mô hình.
+    """
+    organic_fertilizer: Dict[OrganicFertilizer, confloat(ge=0, le=MAX_ORGANIC_AMOUNT, allow_inf_nan=False)] = Field(
+        default_factory=dict, description="Organic amendments (t/ha) by type."
+    )
+    synthetic_fertilizer: Dict[SyntheticFertilizer, confloat(ge=0, le=MAX_SYNTHETIC_AMOUNT, allow_inf_nan=False)] = Field(
+        default_factory=dict, description="Synthetic fertilizers (kg/ha) by type."
+    )
+
+    class Config:
+        extra = "forbid"
+        use_enum_values = True # plain str keys, stored as-is
+
+    @validator("organic_fertilizer", "synthetic_fertilizer", pre=True)
+    def canonical_names(cls, value):
+        """
+        Accept 'Diammonium phosphate' or 'urea' for 'Diammonium_phosphate' and 'Urea',
+        and the frontend labels in FERTILIZER_ALIASES. Entries without a name ({"": 0}
+        when nothing was chosen) are dropped; zero amounts are kept, since a non-empty
+        synthetic plan is what adds the crop residue N2O term, as for stored actions.
+        """
+        if not isinstance(value, dict):
+            return value
+        result = {}
+        for name, amount in value.items():
+            if not str(name).strip():
+                continue
+            name = _FERTILIZER_NAMES.get(_fertilizer_key(name), name)
+            if name in result:
+                raise ValueError(f"fertilizer '{name}' is listed more than once")
+            result[name] = amount
+        return result
+
+
+class Irrigation(BaseModel):
+    level: confloat(ge=0, le=MAX_FLOODING_LEVEL, allow_inf_nan=False) = Field(..., description="Flooding level (cm).")
+
+    class Config:
+        extra = "forbid"
+
+
+class StageAction(BaseModel):
+    """
+    Typed body of a player's stage action, validated once at the API edge.
+    Hành động của người chơi trong một lượt, đã được kiểm tra kiểu và giới hạn.
+    """
+    fertilization: Fertilization
+    irrigation: Irrigation
+
+    class Config:
+        extra = "forbid"
 
 
 class PlayerActionBase(BaseModel):
@@ -18,6 +111,7 @@ class StageResult(BaseModel):
     """
     ch4_emission: float = Field(..., description="Methane (CH4) emitted in this stage (kg).")
     n2o_emission: float = Field(..., description="Nitrous Oxide (N2O) emitted in this stage (kg).")
+    biomass_growth: Optional[float] = Field(None, description="Rice dry matter produced in this stage (kg).")
 
 class CumulativeState(BaseModel):
     """
@@ -27,6 +121,7 @@ class CumulativeState(BaseModel):
     cumulative_ch4_emission: float = Field(..., description="Total CH4 emission so far (kg).")
     cumulative_n2o_emission: float = Field(..., description="Total N2O emission so far (kg).")
     cumulative_emission: float = Field(..., description="Total GHG emission so far (kg CO2e).")
+    cumulative_biomass: Optional[float] = Field(None, description="Standing rice biomass at the end of the stage (kg).")
 
 class StageSnapshot(BaseModel):
     """
@@ -55,8 +150,16 @@ class GameSessionBase(BaseModel):
     season_key: str = Field(default="dong-xuan", description="The key for the chosen season, e.g., 'dong-xuan'.")
     weather_data: Dict[str, Any] = Field(..., description="The full weather dataset for the entire season, fetched once at the start.")
     water_regime: str = Field(default="traditional_technique", description="Current status of the game: 'traditional_technique', 'awd', ...")     
+    weather_mode: str = Field(default="historical", description="'historical': the fixed season weather; 'stochastic': weather_data was drawn from past years.")
+    weather_seed: Optional[int] = Field(None, description="Seed the stochastic weather was drawn with; reuse it to replay the same weather.")
+    weather_year: Optional[int] = Field(None, description="Historical year the stochastic weather comes from.")
+    methodology: str = Field(default=LEGACY_METHODOLOGY, description="Emission methodology the stages are scored with (see GET /methodologies).")
     game_history: List[StageSnapshot] = Field(default=[], description="A list of snapshots for each completed turn.")
+    stage_count: Optional[int] = Field(None, description="Number of stages played; the stages are stored in the turnSnapshot collection. None for sessions that still embed their game_history.")
     final_metrics: Optional[Dict[str, Any]] = None
+    version: int = Field(default=0, description="Incremented on every write; used for ETags.")
+    engine_version: Optional[str] = Field(None, description="Version of the methodology the stored results were computed with.")
+    last_activity: Optional[datetime] = Field(None, description="Timestamp of the last played stage; drives archival of abandoned sessions.")
 
     class Config:
         """ Pydantic configuration. """
@@ -67,6 +170,24 @@ class GameSessionBase(BaseModel):
             ObjectId: str
         }
 
+class PlayStageDelta(BaseModel):
+    """
+    Compact play-stage response: only what changed in this stage.
+    Phản hồi gọn của play-stage, chỉ gồm phần thay đổi của lượt vừa chơi.
+    """
+    session_id: str
+    status: str
+    version: int
+    stage: StageSnapshot
+    cumulative_state: CumulativeState
+    end_time: Optional[datetime] = None
+    final_metrics: Optional[Dict[str, Any]] = None
+
+    class Config:
+        json_encoders = {
+            datetime: lambda dt: dt.isoformat(),
+        }
+
 # Properties to receive on item creation
 class GameSessionCreate(BaseModel):
     # Add fields required to create a game session
@@ -75,6 +196,13 @@ class GameSessionCreate(BaseModel):
     status: str = Field(default="in_progress", description="Current status of the game: 'in_progress', 'completed', 'failed'.")    
     season_key: str = Field(default="dong-xuan", description="The key for the chosen season, e.g., 'dong-xuan'.")
     water_regime: str = Field(default="traditional_technique", description="Current status of the game: 'traditional_technique', 'awd', ...")    
+    weather_mode: str = Field(default="historical", regex="^(historical|stochastic)$", description="'stochastic' draws the season weather from past years instead of the fixed season data.")
+    weather_seed: Optional[int] = Field(None, ge=0, lt=2**63, description="Seed for stochastic weather (random when omitted); the same seed gives the same weather.")
+    methodology: Optional[str] = Field(None, description="Emission methodology for this session; the server default when omitted.")
+
+    @validator("methodology", always=True)
+    def known_methodology(cls, value):
+        return methodology_key(value)
 
 # Properties to return to client
 class GameSessionInDB(GameSessionBase):
@@ -115,7 +243,8 @@ class GameSessionList(BaseModel):
 
 # -----------------Player Action-------------------------
 class PlayerActionCreate(PlayerActionBase):
-    pass
+    """Stored stages keep the loose PlayerActionBase; new actions must match StageAction."""
+    player_action: StageAction = Field(..., description="Fertilization and irrigation of this stage.")
 
 class PlayerActionUpdate(BaseModel):
     action_type: str
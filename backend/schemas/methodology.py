@@ -0,0 +1,44 @@
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, Any, List
+from schemas.gameSession import StageAction
+
+
+class MethodologyInfo(BaseModel):
+    key: str
+    name: str
+    tier: str
+    source: str = Field(..., description="Where the factors come from.")
+    version: str = Field(..., description="Changes with the factor tables; stamped on sessions as engine_version.")
+    default: bool = Field(False, description="Used for new sessions that do not choose one.")
+
+
+class MethodologyComparisonRequest(BaseModel):
+    """
+    One plan (the actions of consecutive stages from stage 1) to score under several methodologies.
+    Một phương án canh tác được tính theo nhiều phương pháp phát thải để so sánh.
+    """
+    season_key: str = Field(default="dong-xuan", description="The key for the season, e.g., 'dong-xuan'.")
+    water_regime: str = Field(default="traditional_technique", description="'traditional_technique', 'AWD' or 'regular_rainfed'.")
+    stages: List[StageAction] = Field(..., min_items=1, description="Actions of stages 1, 2, ... in order.")
+    methodologies: Optional[List[str]] = Field(None, description="Methodologies to compare; all when omitted.")
+
+
+class StageEmission(BaseModel):
+    ch4_emission: float = Field(..., description="CH4 emitted in the stage (kg).")
+    n2o_emission: float = Field(..., description="N2O emitted in the stage (kg).")
+    emission: float = Field(..., description="GHG emitted in the stage (kg CO2e).")
+
+
+class MethodologyResult(BaseModel):
+    methodology: str
+    stages: List[StageEmission]
+    total_ch4_emission: float
+    total_n2o_emission: float
+    total_emission: float = Field(..., description="Total GHG emission of the plan (kg CO2e).")
+
+
+class MethodologyComparison(BaseModel):
+    season_key: str
+    water_regime: str
+    weather_conditions: List[Dict[str, Any]] = Field(..., description="Season weather used for each stage.")
+    results: List[MethodologyResult]
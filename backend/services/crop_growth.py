@@ -0,0 +1,102 @@
+"""
+Rice biomass and yield growth model.
+
+A simplified radiation-use-efficiency model integrated day by day:
+
+    LAI      = min(LAI_MAX, SLA * leaf_fraction[stage] * biomass)
+    growth   = RUE * PAR_FRACTION * radiation * (1 - exp(-k * LAI))
+               * f_T(temperature) * f_N(available N) * f_W(water supply)
+
+with biomass in kg/ha. The day loop is the only sequential part; every
+operation works on numpy arrays, so one call grows a single field, all the
+plots of a farm or a whole batch of sessions at once. Coefficients live in
+`engine_core` (CROP_*) and are part of `ENGINE_VERSION`.
+
+Mô hình sinh trưởng sinh khối và năng suất lúa (tích phân theo ngày, vector hóa).
+"""
+
+import numpy as np
+
+from services import engine_core as core
+
+# Leaf fraction by stage as an array indexed by stage number
+_LEAF_FRACTION = np.array([0.0] + [core.CROP_LEAF_FRACTION[s] for s in sorted(core.CROP_LEAF_FRACTION)])
+
+
+def temperature_factor(temp):
+    """0 below T_BASE and above T_MAX, 1 between T_OPT_LOW and T_OPT_HIGH, linear in between."""
+    temp = np.asarray(temp, dtype=float)
+    rising = (temp - core.CROP_T_BASE) / (core.CROP_T_OPT_LOW - core.CROP_T_BASE)
+    falling = (core.CROP_T_MAX - temp) / (core.CROP_T_MAX - core.CROP_T_OPT_HIGH)
+    return np.clip(np.minimum(rising, falling), 0.0, 1.0)
+
+
+def nitrogen_factor(applied_n):
+    """Saturating response to the N available in a stage (soil supply + applied, kg N/ha)."""
+    available = core.CROP_SOIL_N_SUPPLY + np.asarray(applied_n, dtype=float)
+    return 1.0 - (1.0 - core.CROP_N_MIN_FACTOR) * np.exp(-available / core.CROP_N_RESPONSE)
+
+
+def water_factor(irrigation_supply, irrigation_level, total_rainfall_mm, days=core.STAGE_DAYS):
+    """
+    Water supply over demand, from rainfall and irrigation.
+
+    Args:
+        irrigation_supply: mm/day the water regime delivers at full irrigation level
+        irrigation_level: the player's flooding level
+    """
+    level = np.clip(np.asarray(irrigation_level, dtype=float) / core.CROP_FULL_IRRIGATION_LEVEL, 0.0, 1.0)
+    supply = np.asarray(total_rainfall_mm, dtype=float) / days + np.asarray(irrigation_supply, dtype=float) * level
+    return np.clip(supply / core.CROP_WATER_DEMAND, core.CROP_MIN_WATER_FACTOR, 1.0)
+
+
+def irrigation_supply(water_regime: str) -> float:
+    return core.CROP_IRRIGATION_SUPPLY.get(water_regime, 0.0)
+
+
+def radiation(season_key: str, weather: dict) -> float:
+    """Daily global radiation (MJ/m²/day) of a stage, from POWER data when the weather has it."""
+    value = weather.get("avg_radiation_mj_m2")
+    return float(value) if value is not None else core.CROP_DEFAULT_RADIATION[season_key]
+
+
+def grow(biomass, stage_num: int, temp, radiation_mj, f_n, f_w, days: int = core.STAGE_DAYS) -> np.ndarray:
+    """
+    Integrate daily growth over one stage.
+
+    All arguments except `stage_num` and `days` may be scalars or arrays of
+    the same shape. Returns standing biomass (kg/ha) at the end of the stage.
+    """
+    biomass = np.array(biomass, dtype=float)
+    # Everything but light interception is constant within a stage: kg/ha/day at full cover
+    potential = (core.CROP_RUE * core.CROP_PAR_FRACTION * np.asarray(radiation_mj, dtype=float) * 10.0
+                 * temperature_factor(temp) * f_n * f_w)
+    leaf_area_per_kg = core.CROP_SLA * _LEAF_FRACTION[stage_num]
+    for _ in range(days):
+        lai = np.minimum(core.CROP_LAI_MAX, leaf_area_per_kg * biomass)
+        biomass = biomass + potential * (1.0 - np.exp(-core.CROP_EXTINCTION * lai))
+    return biomass
+
+
+def stage_biomass(season_key: str, water_regime: str, stage_num: int, start_biomass: float,
+                  weather: dict, flooding_level: float, applied_n: float) -> float:
+    """Single-field convenience wrapper around `grow` (kg/ha at the end of the stage)."""
+    f_n = nitrogen_factor(applied_n)
+    f_w = water_factor(irrigation_supply(water_regime), flooding_level, weather["total_rainfall_mm"])
+    end = grow(start_biomass, stage_num, weather["avg_temp_c"], radiation(season_key, weather), f_n, f_w)
+    return float(end)
+
+
+def grain_yield(biomass):
+    return np.asarray(biomass, dtype=float) * core.CROP_HARVEST_INDEX
+
+
+def final_metrics(final_biomass: float, net_emission: float) -> dict:
+    """Crop entries of a finished game's `final_metrics` (biomass and yield in kg)."""
+    grain = float(grain_yield(final_biomass))
+    return {
+        "final_biomass": final_biomass,
+        "final_yield": grain,
+        # kg CO2e per kg of grain; lower is better
+        "emission_intensity": net_emission / grain if grain > 0 else None,
+    }
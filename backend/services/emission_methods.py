@@ -0,0 +1,276 @@
+"""
+Pluggable emission methodologies ("kernels").
+
+Every methodology computes CH4 and N2O for a `StageBatch`: any number of
+stages as numpy arrays (season and water regime codes, weather, flooding
+level, fertilizer amounts per type), in one vectorized pass. A game session
+stores the key of the methodology it is scored with; `compare` evaluates the
+same batch under several methodologies side by side.
+
+Built-in kernels:
+
+- `monnas` (default): the game's Tier 2 model in `engine_core`, i.e.
+  country-specific seasonal EF_c and SF_w curves fitted per stage and
+  water regime.
+- `ipcc2006`, `ipcc2019`: IPCC Tier 1 defaults (2006 Guidelines, 2019
+  Refinement; Vol. 4 Ch. 5 and 11). Global EF_c, water regime SF_w and CFOA
+  tables, SF_o = (1 + Σ ROA·CFOA)^0.59, and direct N2O from synthetic,
+  organic and crop residue N with EF_1FR.
+- `ipcc2019-sea`: 2019 Tier 1 with the South-East Asia EF_c.
+- `ipcc2019-vn`: 2019 scaling factors with the game's seasonal Vietnamese
+  EF_c (a Tier 2 variant).
+
+Register new kernels with `register()`, after adding their key to
+`config.model_keys.METHODOLOGIES`; `EMISSION_METHODOLOGY` selects the
+default for new sessions. Every kernel has a `version` that changes with its
+factor tables (and with `engine_core.ENGINE_VERSION`); sessions are stamped
+with it, so `stage_cache` and `tools.recompute_sessions` notice changed tables.
+
+Các phương pháp tính phát thải có thể thay thế, dùng chung một giao diện vector hóa.
+"""
+
+import abc
+import hashlib
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from config import GAME_CONFIG
+from config import model_keys
+from services import engine_core
+from services.engine_core import StageInput, StageOutcome
+
+SEASONS = sorted(engine_core.EF_C)
+WATER_REGIMES = list(model_keys.WATER_REGIMES)
+ORGANIC_TYPES = list(model_keys.ORGANIC_FERTILIZERS)
+SYNTHETIC_TYPES = list(model_keys.SYNTHETIC_FERTILIZERS)
+
+N2O_PER_N2O_N = 44.0 / 28.0
+
+_N_CONTENT = np.array([engine_core.F_SN[t] for t in SYNTHETIC_TYPES])
+
+
+class MethodologyError(ValueError):
+    pass
+
+
+class StageBatch(NamedTuple):
+    season: np.ndarray # (N,) index into SEASONS
+    regime: np.ndarray # (N,) index into WATER_REGIMES
+    stage_num: np.ndarray # (N,)
+    avg_temp_c: np.ndarray
+    total_rainfall_mm: np.ndarray
+    avg_humidity_percent: np.ndarray
+    flooding_level: np.ndarray
+    organic: np.ndarray # (N, len(ORGANIC_TYPES)) t/ha
+    synthetic: np.ndarray # (N, len(SYNTHETIC_TYPES)) kg/ha
+    has_synthetic: np.ndarray # (N,) bool
+    days: np.ndarray
+    area: np.ndarray # ha
+
+
+class BatchOutcome(NamedTuple):
+    ch4_emission: np.ndarray # (N,) kg
+    n2o_emission: np.ndarray # (N,) kg
+
+    @property
+    def co2e(self) -> np.ndarray:
+        return self.ch4_emission * engine_core.GWP_CH4 + self.n2o_emission * engine_core.GWP_N2O
+
+
+def _codes(values: Sequence[str], known: List[str], what: str) -> np.ndarray:
+    index = {value: code for code, value in enumerate(known)}
+    try:
+        return np.array([index[value] for value in values], dtype=np.intp)
+    except KeyError as e:
+        raise MethodologyError(f"Unknown {what} {e.args[0]!r}; expected one of {known}")
+
+
+def batch_from_inputs(inputs: Sequence[StageInput]) -> StageBatch:
+    """Stack StageInputs into a batch. Unknown fertilizer types are ignored, as in engine_core."""
+    organic_index = {t: i for i, t in enumerate(ORGANIC_TYPES)}
+    synthetic_index = {t: i for i, t in enumerate(SYNTHETIC_TYPES)}
+    organic = np.zeros((len(inputs), len(ORGANIC_TYPES)))
+    synthetic = np.zeros((len(inputs), len(SYNTHETIC_TYPES)))
+    for row, inp in enumerate(inputs):
+        for fert_type, amount in inp.organic_fertilizer:
+            if fert_type in organic_index:
+                organic[row, organic_index[fert_type]] += amount
+        for fert_type, amount in inp.synthetic_fertilizer:
+            if fert_type in synthetic_index:
+                synthetic[row, synthetic_index[fert_type]] += amount
+    stage_num = np.array([inp.stage_num for inp in inputs], dtype=np.intp)
+    if len(stage_num) and (stage_num.min() < 1 or stage_num.max() > GAME_CONFIG['total_stages']):
+        raise MethodologyError(f"Stage numbers must be between 1 and {GAME_CONFIG['total_stages']}.")
+    return StageBatch(
+        season=_codes([inp.season_key for inp in inputs], SEASONS, "season"),
+        regime=_codes([inp.water_regime for inp in inputs], WATER_REGIMES, "water regime"),
+        stage_num=stage_num,
+        avg_temp_c=np.array([inp.avg_temp_c for inp in inputs], dtype=float),
+        total_rainfall_mm=np.array([inp.total_rainfall_mm for inp in inputs], dtype=float),
+        avg_humidity_percent=np.array([inp.avg_humidity_percent for inp in inputs], dtype=float),
+        flooding_level=np.array([inp.flooding_level for inp in inputs], dtype=float),
+        organic=organic,
+        synthetic=synthetic,
+        has_synthetic=np.array([bool(inp.synthetic_fertilizer) for inp in inputs], dtype=bool),
+        days=np.array([inp.days for inp in inputs], dtype=float),
+        area=np.array([inp.area for inp in inputs], dtype=float),
+    )
+
+
+def table_version(*tables) -> str:
+    """Version of a kernel's factor tables, on top of the engine_core tables it also reads."""
+    return hashlib.sha1(repr((engine_core.ENGINE_VERSION, tables)).encode("utf-8")).hexdigest()[:12]
+
+
+class Methodology(abc.ABC):
+    """Base class of the kernels; subclasses implement `evaluate` and set `version`."""
+
+    key: str = ""
+    name: str = ""
+    tier: str = ""
+    source: str = ""
+    version: str = ""
+
+    @abc.abstractmethod
+    def evaluate(self, batch: StageBatch) -> BatchOutcome:
+        """CH4 and N2O (kg) of every stage of `batch`."""
+
+    def compute_stages(self, inputs: Sequence[StageInput]) -> List[StageOutcome]:
+        if not inputs:
+            return []
+        outcome = self.evaluate(batch_from_inputs(inputs))
+        return [StageOutcome(float(ch4), float(n2o)) for ch4, n2o in zip(outcome.ch4_emission, outcome.n2o_emission)]
+
+    def compute_stage(self, inp: StageInput) -> StageOutcome:
+        return self.compute_stages([inp])[0]
+
+    def describe(self) -> dict:
+        return {"key": self.key, "name": self.name, "tier": self.tier, "source": self.source, "version": self.version}
+
+
+class FittedCurveMethod(Methodology):
+    """The game's own model (`engine_core`): seasonal EF_c and fitted SF_w curves."""
+
+    key = model_keys.LEGACY_METHODOLOGY
+    name = "Seasonal EF_c with fitted SF_w curves"
+    tier = "Tier 2"
+    source = "engine_core"
+
+    def __init__(self):
+        # All of its tables are engine_core's: sessions scored before kernels existed stay current
+        self.version = engine_core.ENGINE_VERSION
+        # [stage - 1, regime, coefficient]; read at construction so a calibration file applies
+        self._sf_w = np.array([
+            [engine_core.SF_W_COEFFICIENTS[(stage, regime)] for regime in WATER_REGIMES]
+            for stage in sorted({stage for stage, _ in engine_core.SF_W_COEFFICIENTS})
+        ])
+        self._ef_c = np.array([engine_core.EF_C[season] for season in SEASONS])
+        self._ef_1i = np.array([engine_core.EF_1I[season] for season in SEASONS])
+        self._cfoa = np.array([engine_core.SF_O_MAPPING[t] for t in ORGANIC_TYPES])
+
+    def compute_stages(self, inputs: Sequence[StageInput]) -> List[StageOutcome]:
+        # A session's few stages are cheaper without numpy, and stay bit-identical to engine_core
+        return [engine_core.compute_stage(inp) for inp in inputs]
+
+    def evaluate(self, batch: StageBatch) -> BatchOutcome:
+        a, b, c, d, e = self._sf_w[batch.stage_num - 1, batch.regime].T
+        sf_w = (
+            a * np.exp(b * batch.avg_temp_c)
+            * (1 + c * batch.total_rainfall_mm)
+            / (1 + np.exp(-d * batch.avg_humidity_percent))
+            / (1 + np.exp(-e * batch.flooding_level))
+        )
+        sf_o = 1.0 + ((batch.organic * self._cfoa) ** 0.59).sum(axis=1)
+        scale = engine_core.SF_P * engine_core.SF_S * engine_core.SF_R
+        ch4 = self._ef_c[batch.season] * sf_w * sf_o * scale * batch.days * batch.area
+        n2o = np.where(batch.has_synthetic,
+                       batch.synthetic @ _N_CONTENT * self._ef_1i[batch.season] + engine_core.F_CR * engine_core.EF_1,
+                       0.0) * batch.area
+        return BatchOutcome(ch4, n2o)
+
+
+class Tier1Method(Methodology):
+    """
+    IPCC daily emission factor method with tabulated scaling factors:
+    CH4 = EF_c · SF_w · SF_p · SF_o · days, SF_o = (1 + Σ ROA·CFOA)^0.59;
+    N2O = (F_SN + F_ON + F_CR) · EF_1FR · 44/28, crop residue N spread over the stages.
+    """
+
+    tier = "Tier 1"
+
+    def __init__(self, key: str, name: str, source: str, ef_c: Dict[str, float], sf_w: Dict[str, float],
+                 cfoa: Dict[str, float], ef_1fr: float, sf_p: float = 1.0, tier: str = None):
+        self.key, self.name, self.source = key, name, source
+        if tier is not None:
+            self.tier = tier
+        self._ef_c = np.array([ef_c[season] for season in SEASONS])
+        self._sf_w = np.array([sf_w[regime] for regime in WATER_REGIMES])
+        self._cfoa = np.array([cfoa[t] for t in ORGANIC_TYPES])
+        self.ef_1fr = ef_1fr
+        self.sf_p = sf_p
+        self.version = table_version(key, sorted(ef_c.items()), sorted(sf_w.items()), sorted(cfoa.items()), ef_1fr, sf_p)
+
+    def evaluate(self, batch: StageBatch) -> BatchOutcome:
+        sf_o = (1.0 + batch.organic @ self._cfoa) ** 0.59
+        ch4 = self._ef_c[batch.season] * self._sf_w[batch.regime] * self.sf_p * sf_o * batch.days * batch.area
+        applied_n = (batch.synthetic @ _N_CONTENT + batch.organic.sum(axis=1) * engine_core.CROP_ORGANIC_N
+                     + engine_core.F_CR / GAME_CONFIG['total_stages'])
+        n2o = applied_n * self.ef_1fr * N2O_PER_N2O_N * batch.area
+        return BatchOutcome(ch4, n2o)
+
+
+def _per_season(value: float) -> Dict[str, float]:
+    return {season: value for season in SEASONS}
+
+
+# Water regimes of the game as IPCC categories: continuously flooded, multiple drainage periods, regular rainfed
+_SF_W_2006 = {"traditional_technique": 1.00, "AWD": 0.52, "regular_rainfed": 0.28}
+_SF_W_2019 = {"traditional_technique": 1.00, "AWD": 0.55, "regular_rainfed": 0.54}
+_CFOA_2006 = {"Straw_short": 1.00, "Straw_long": 0.29, "Compost": 0.05, "Farm_yard_manure": 0.14, "Green_manure": 0.50}
+_CFOA_2019 = dict(engine_core.SF_O_MAPPING)
+
+_methodologies: Dict[str, Methodology] = {}
+
+
+def register(methodology: Methodology) -> Methodology:
+    if methodology.key not in model_keys.METHODOLOGIES:
+        # Requests are validated against the keys in config/model_keys.py
+        raise MethodologyError(f"Add {methodology.key!r} to config.model_keys.METHODOLOGIES to register it.")
+    _methodologies[methodology.key] = methodology
+    return methodology
+
+
+def get(key: Optional[str] = None) -> Methodology:
+    """The methodology registered under `key` (the default one for None)."""
+    try:
+        return _methodologies[key or DEFAULT_METHODOLOGY]
+    except KeyError:
+        raise MethodologyError(f"Unknown methodology {key!r}; expected one of {available()}")
+
+
+def available() -> List[str]:
+    return list(_methodologies)
+
+
+def compare(batch: StageBatch, keys: Optional[Sequence[str]] = None) -> Dict[str, BatchOutcome]:
+    """The same batch under several methodologies (all registered ones by default)."""
+    return {key: get(key).evaluate(batch) for key in (keys or available())}
+
+
+register(FittedCurveMethod())
+register(Tier1Method("ipcc2006", "IPCC 2006 Guidelines, Tier 1 defaults", "IPCC 2006 Vol. 4 Tables 5.11-5.14, 11.1",
+                     _per_season(1.30), _SF_W_2006, _CFOA_2006, ef_1fr=0.003))
+register(Tier1Method("ipcc2019", "IPCC 2019 Refinement, Tier 1 defaults", "IPCC 2019 Vol. 4 Tables 5.11-5.14, 11.1",
+                     _per_season(1.19), _SF_W_2019, _CFOA_2019, ef_1fr=0.004))
+register(Tier1Method("ipcc2019-sea", "IPCC 2019 Refinement, South-East Asia EF_c", "IPCC 2019 Vol. 4 Table 5.11A",
+                     _per_season(1.22), _SF_W_2019, _CFOA_2019, ef_1fr=0.004))
+register(Tier1Method("ipcc2019-vn", "IPCC 2019 scaling factors, Vietnamese seasonal EF_c", "IPCC 2019 Vol. 4; engine_core.EF_C",
+                     dict(engine_core.EF_C), _SF_W_2019, _CFOA_2019, ef_1fr=0.004, tier="Tier 2"))
+
+DEFAULT_METHODOLOGY = model_keys.DEFAULT_METHODOLOGY
+if set(model_keys.METHODOLOGIES) != set(_methodologies):
+    raise MethodologyError(f"config.model_keys.METHODOLOGIES lists kernels that are not registered: "
+                           f"{sorted(set(model_keys.METHODOLOGIES) - set(_methodologies))}")
+if DEFAULT_METHODOLOGY not in _methodologies:
+    raise MethodologyError(f"EMISSION_METHODOLOGY={DEFAULT_METHODOLOGY!r} is not one of {available()}")
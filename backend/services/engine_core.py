@@ -0,0 +1,323 @@
+"""
+Pure-Python core of the emission model, independent of Pydantic and MongoDB.
+
+The core works on small `__slots__` dataclasses holding only numbers and plain
+tuples, so it can be reused from batch jobs, optimizers and tests without
+building any model objects. `GameEngine` converts to and from the API schemas
+once per stage; all arithmetic lives here.
+
+Lõi tính toán phát thải, không phụ thuộc Pydantic/MongoDB.
+"""
+
+import hashlib
+import json
+import math
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from config.model_keys import ORGANIC_FERTILIZERS, SYNTHETIC_FERTILIZERS, WATER_REGIMES
+
+# Global warming potentials (AR6, 100-year)
+GWP_CH4 = 27
+GWP_N2O = 273
+
+STAGE_DAYS = 28 # days per stage
+DEFAULT_AREA = 1.0 # hectares
+
+# SF_w = a * exp(b*T) * (1 + c*R) * sigmoid(d*H) * sigmoid(e*F)
+# (stage, water_regime) -> (a, b, c, d, e)
+SF_W_COEFFICIENTS: Dict[Tuple[int, str], Tuple[float, float, float, float, float]] = {
+    (1, 'traditional_technique'): (0.458694426, 0.043251497, 0.002195157, 0.128416648, 3.61328E-05),
+    (1, 'AWD'): (0.230519965, 0.052121708, 0.001862591, 0.090983292, 3.67026E-06),
+    (1, 'regular_rainfed'): (0.504341353, 0.023009281, 0.002453813, 0.105923764, 0.050536831),
+    (2, 'traditional_technique'): (0.970718789, 3.08017e-07, 2.22064E-14, 0.129716815, 0.370910015),
+    (2, 'AWD'): (0.411157427, 0.036009981, 2.26313E-14, 0.724674735, 2.22045E-14),
+    (2, 'regular_rainfed'): (0.296820827, 0.048356805, 2.28332E-14, 2.614438373, 0.031503649),
+    (3, 'traditional_technique'): (0.562444389, 0.032842182, 0.022408331, 0.032354655, 0.146150479),
+    (3, 'AWD'): (0.335273617, 0.04353807, 0.011566927, 0.082440357, 4.8745E-06),
+    (3, 'regular_rainfed'): (0.44668872, 0.034148876, 0.013843375, 0.24326874, 0.044627836),
+    (4, 'traditional_technique'): (1.120955286, 2.23181E-14, 0.007893869, 0.794350362, 0.423227968),
+    (4, 'AWD'): (0.436334021, 0.037913224, 0.009102005, 0.107006198, 3.53414E-05),
+    (4, 'regular_rainfed'): (1.22391098, 2.25066E-14, 0.008256156, 0.399764521, 0.166725189),
+}
+
+# Refitted coefficients written by tools/calibrate_sf_w.py replace the entries above they contain
+SF_W_FILE_FORMAT = "monnas-sf_w/1"
+SF_W_COEFFICIENTS_FILE = os.getenv("SF_W_COEFFICIENTS_FILE")
+
+
+def load_sf_w_coefficients(path: str) -> Tuple[str, Dict[Tuple[int, str], Tuple[float, float, float, float, float]]]:
+    """Version and (stage, water_regime) -> (a, b, c, d, e) of a calibration file."""
+    with open(path, encoding="utf-8") as f:
+        doc = json.load(f)
+    if doc.get("format") != SF_W_FILE_FORMAT:
+        raise ValueError(f"{path}: not an SF_w coefficient file (format {doc.get('format')!r}, expected {SF_W_FILE_FORMAT!r})")
+    coefficients = {}
+    for entry in doc["coefficients"]:
+        key = (int(entry["stage"]), entry["water_regime"])
+        if key not in SF_W_COEFFICIENTS:
+            raise ValueError(f"{path}: unknown stage/water regime {key}")
+        values = tuple(float(entry[name]) for name in "abcde")
+        if not all(math.isfinite(value) for value in values):
+            raise ValueError(f"{path}: non-finite coefficient for {key}")
+        coefficients[key] = values
+    return doc["version"], coefficients
+
+
+SF_W_COEFFICIENTS_VERSION: Optional[str] = None # None: the built-in table
+if SF_W_COEFFICIENTS_FILE:
+    SF_W_COEFFICIENTS_VERSION, _calibrated = load_sf_w_coefficients(SF_W_COEFFICIENTS_FILE)
+    SF_W_COEFFICIENTS.update(_calibrated)
+
+# Conversion factors for organic amendments (CFOA)
+SF_O_MAPPING = {
+    "Straw_short": 1.00,
+    "Straw_long": 0.19,
+    "Compost": 0.17,
+    "Farm_yard_manure": 0.21,
+    "Green_manure": 0.45,
+}
+
+# Emission factor baseline for continuously flooded fields without organic amendments, kg CH4/ha/day
+EF_C = {
+    "dong-xuan": 1.95,
+    "he-thu": 1.83,
+    "thu-dong": 2.20,
+}
+
+# Nitrogen content of synthetic fertilizers
+F_SN = {
+    "Urea": 0.46,
+    "Diammonium_phosphate": 0.18,
+    "Ammonium_sulphate": 0.21,
+    "Ammonium_chloride": 0.25,
+    "Ammonium_nitrate": 0.35,
+    "Lân": 0,
+    "Kali": 0,
+    "NPK_de_nhanh": 0.2,
+    "NPK_lam_rong": 0.15,
+}
+
+EF_1I = {
+    "dong-xuan": 0.15,
+    "he-thu": 0.2,
+    "thu-dong": 0.17,
+}
+
+F_CR = 24.57 # kg/ha - default value
+EF_1 = 0.01
+
+# Fixed scaling factors (pre-season water regime, soil type, rice cultivar)
+SF_P = 1.0
+SF_S = 1.0
+SF_R = 1.0
+
+# --- Crop growth (radiation use efficiency with N, water and temperature limits), see services/crop_growth.py ---
+CROP_RUE = 2.2 # g dry matter per MJ of intercepted PAR
+CROP_PAR_FRACTION = 0.5 # PAR share of global radiation
+CROP_EXTINCTION = 0.6 # canopy light extinction coefficient k
+CROP_SLA = 0.0022 # leaf area index per kg/ha of leaf dry matter
+CROP_LAI_MAX = 7.0
+CROP_LEAF_FRACTION = {1: 0.55, 2: 0.45, 3: 0.30, 4: 0.15} # leaf share of standing biomass by stage
+CROP_INITIAL_BIOMASS = 30.0 # kg/ha of seedlings at the start of stage 1
+CROP_HARVEST_INDEX = 0.45
+CROP_T_BASE, CROP_T_OPT_LOW, CROP_T_OPT_HIGH, CROP_T_MAX = 8.0, 25.0, 32.0, 42.0 # °C
+CROP_SOIL_N_SUPPLY = 25.0 # kg N/ha available per stage without fertilizer
+CROP_N_RESPONSE = 60.0 # kg N/ha; growth reaches ~63% of the N-limited gap at this supply
+CROP_N_MIN_FACTOR = 0.45 # growth factor with no available N
+CROP_ORGANIC_N = 5.0 # kg N per tonne of organic amendment
+CROP_WATER_DEMAND = 5.5 # mm/day
+CROP_IRRIGATION_SUPPLY = {"traditional_technique": 6.0, "AWD": 5.0, "regular_rainfed": 0.0} # mm/day at full irrigation level
+CROP_FULL_IRRIGATION_LEVEL = 5.0
+CROP_MIN_WATER_FACTOR = 0.3
+# Daily global radiation (MJ/m²/day) used when the stage weather has no `avg_radiation_mj_m2`
+CROP_DEFAULT_RADIATION = {
+    "dong-xuan": 15.0,
+    "he-thu": 17.5,
+    "thu-dong": 14.0,
+}
+
+
+# Requests are validated against config/model_keys.py; the tables must cover exactly those keys
+if (set(SF_O_MAPPING) != set(ORGANIC_FERTILIZERS) or set(F_SN) != set(SYNTHETIC_FERTILIZERS)
+        or {regime for _, regime in SF_W_COEFFICIENTS} != set(WATER_REGIMES)):
+    raise ValueError("engine_core tables do not match the keys in config/model_keys.py")
+
+
+def _model_version() -> str:
+    tables = (GWP_CH4, GWP_N2O, STAGE_DAYS, sorted(SF_W_COEFFICIENTS.items()), sorted(SF_O_MAPPING.items()),
+              sorted(EF_C.items()), sorted(F_SN.items()), sorted(EF_1I.items()), F_CR, EF_1, SF_P, SF_S, SF_R,
+              CROP_RUE, CROP_PAR_FRACTION, CROP_EXTINCTION, CROP_SLA, CROP_LAI_MAX, sorted(CROP_LEAF_FRACTION.items()),
+              CROP_INITIAL_BIOMASS, CROP_HARVEST_INDEX, CROP_T_BASE, CROP_T_OPT_LOW, CROP_T_OPT_HIGH, CROP_T_MAX,
+              CROP_SOIL_N_SUPPLY, CROP_N_RESPONSE, CROP_N_MIN_FACTOR, CROP_ORGANIC_N, CROP_WATER_DEMAND,
+              sorted(CROP_IRRIGATION_SUPPLY.items()), CROP_FULL_IRRIGATION_LEVEL, CROP_MIN_WATER_FACTOR,
+              sorted(CROP_DEFAULT_RADIATION.items()))
+    return hashlib.sha1(repr(tables).encode("utf-8")).hexdigest()[:12]
+
+# Changes whenever any coefficient above changes; stamped on stored sessions so
+# stale results can be found and recomputed (see tools/recompute_sessions.py).
+ENGINE_VERSION = _model_version()
+
+
+@dataclass(slots=True)
+class StageInput:
+    """Everything needed to compute one stage, as plain numbers."""
+    season_key: str
+    water_regime: str
+    stage_num: int
+    avg_temp_c: float
+    total_rainfall_mm: float
+    avg_humidity_percent: float
+    flooding_level: float
+    organic_fertilizer: Tuple[Tuple[str, float], ...] = ()
+    synthetic_fertilizer: Tuple[Tuple[str, float], ...] = ()
+    days: int = STAGE_DAYS
+    area: float = DEFAULT_AREA
+
+
+@dataclass(slots=True)
+class StageOutcome:
+    ch4_emission: float
+    n2o_emission: float
+
+    @property
+    def co2e(self) -> float:
+        return self.ch4_emission * GWP_CH4 + self.n2o_emission * GWP_N2O
+
+
+@dataclass(slots=True)
+class Totals:
+    cumulative_ch4_emission: float = 0.0
+    cumulative_n2o_emission: float = 0.0
+    cumulative_emission: float = 0.0
+
+    def add(self, outcome: StageOutcome) -> "Totals":
+        return Totals(
+            self.cumulative_ch4_emission + outcome.ch4_emission,
+            self.cumulative_n2o_emission + outcome.n2o_emission,
+            self.cumulative_emission + outcome.co2e,
+        )
+
+
+@dataclass(slots=True)
+class Action:
+    """
+    A player's stage action as plain numbers. Fertilizer items are sorted by
+    type so the input (and the result) does not depend on the key order of the request.
+    """
+    flooding_level: float
+    organic_fertilizer: Tuple[Tuple[str, float], ...] = ()
+    synthetic_fertilizer: Tuple[Tuple[str, float], ...] = ()
+
+
+def action_from_schema(action) -> Action:
+    """Action from a validated `schemas.gameSession.StageAction`."""
+    fertilization = action.fertilization
+    return Action(
+        flooding_level=action.irrigation.level,
+        organic_fertilizer=tuple(sorted(fertilization.organic_fertilizer.items())),
+        synthetic_fertilizer=tuple(sorted(fertilization.synthetic_fertilizer.items())),
+    )
+
+
+def action_from_dict(action: dict) -> Action:
+    """Action from the body of a stored `player_action` ({'fertilization': ..., 'irrigation': ...})."""
+    fertilization = action['fertilization']
+    return Action(
+        flooding_level=action['irrigation']['level'],
+        organic_fertilizer=tuple(sorted(fertilization['organic_fertilizer'].items())),
+        synthetic_fertilizer=tuple(sorted(fertilization['synthetic_fertilizer'].items())),
+    )
+
+
+def stage_input(season_key: str, water_regime: str, stage_num: int, action: Action, weather: dict) -> StageInput:
+    """Build a StageInput from an Action and a stage's `weather_conditions`."""
+    return StageInput(
+        season_key=season_key,
+        water_regime=water_regime,
+        stage_num=stage_num,
+        avg_temp_c=weather['avg_temp_c'],
+        total_rainfall_mm=weather['total_rainfall_mm'],
+        avg_humidity_percent=weather['avg_humidity_percent'],
+        flooding_level=action.flooding_level,
+        organic_fertilizer=action.organic_fertilizer,
+        synthetic_fertilizer=action.synthetic_fertilizer,
+    )
+
+
+def stage_input_from_action(season_key: str, water_regime: str, stage_num: int, action: dict, weather: dict) -> StageInput:
+    """
+    Build a StageInput from the plain-dict forms stored in MongoDB:
+    `action` is the body of `player_action` and `weather` a stage's `weather_conditions`.
+    """
+    return stage_input(season_key, water_regime, stage_num, action_from_dict(action), weather)
+
+
+def sf_w(stage_num: int, water_regime: str, avg_temp_c: float, total_rainfall_mm: float,
+         avg_humidity_percent: float, flooding_level: float) -> float:
+    """Scaling factor for the water regime during cultivation (SF_w)."""
+    a, b, c, d, e = SF_W_COEFFICIENTS[(stage_num, water_regime)]
+    return (
+        a * math.exp(b * avg_temp_c)
+        * (1 + c * total_rainfall_mm)
+        * (1 / (1 + math.exp(-d * avg_humidity_percent)))
+        * (1 / (1 + math.exp(-e * flooding_level)))
+    )
+
+
+def sf_o(organic_fertilizer) -> float:
+    """Scaling factor for organic amendments (SF_o). Unknown types are ignored."""
+    result = 1.0
+    for fert_type, fert_amount in organic_fertilizer:
+        cfoa = SF_O_MAPPING.get(fert_type)
+        if cfoa is not None:
+            result += (fert_amount * cfoa) ** 0.59
+    return result
+
+
+def ch4_emission(inp: StageInput) -> float:
+    """CH4 emission (kg) following the IPCC daily emission factor method."""
+    scaling = sf_w(inp.stage_num, inp.water_regime, inp.avg_temp_c, inp.total_rainfall_mm,
+                   inp.avg_humidity_percent, inp.flooding_level)
+    return EF_C[inp.season_key] * scaling * SF_P * sf_o(inp.organic_fertilizer) * SF_S * SF_R * inp.days * inp.area
+
+
+def n2o_emission(season_key: str, synthetic_fertilizer) -> float:
+    """Direct N2O emission (kg) from synthetic N and crop residues."""
+    if not synthetic_fertilizer:
+        return 0.0
+    applied_n = 0.0
+    for fert_type, fert_amount in synthetic_fertilizer:
+        n_content = F_SN.get(fert_type)
+        if n_content is not None:
+            applied_n += fert_amount * n_content
+    return applied_n * EF_1I[season_key] + F_CR * EF_1
+
+
+def applied_nitrogen(synthetic_fertilizer, organic_fertilizer) -> float:
+    """Plant-available N applied in a stage (kg N/ha) from synthetic and organic fertilizers."""
+    applied_n = 0.0
+    for fert_type, fert_amount in synthetic_fertilizer:
+        n_content = F_SN.get(fert_type)
+        if n_content is not None:
+            applied_n += fert_amount * n_content
+    for fert_type, fert_amount in organic_fertilizer:
+        if fert_type in SF_O_MAPPING:
+            applied_n += fert_amount * CROP_ORGANIC_N
+    return applied_n
+
+
+def compute_stage(inp: StageInput) -> StageOutcome:
+    return StageOutcome(ch4_emission(inp), n2o_emission(inp.season_key, inp.synthetic_fertilizer))
+
+
+def simulate(inputs, totals: Totals = None):
+    """Run consecutive stages, returning [(StageOutcome, Totals after the stage), ...]."""
+    totals = totals or Totals()
+    results = []
+    for inp in inputs:
+        outcome = compute_stage(inp)
+        totals = totals.add(outcome)
+        results.append((outcome, totals))
+    return results
@@ -0,0 +1,118 @@
+"""
+In-process pub/sub feeding the live (Server-Sent Events) endpoints.
+
+`publish()` may be called from any thread (sync endpoints run in the
+threadpool). Each event is serialized once and handed to every subscriber's
+event loop with `call_soon_threadsafe`. Subscribers own a bounded queue; when
+a slow client lets it fill up the oldest events are dropped, so one stalled
+connection never blocks publishers or other subscribers.
+
+An idle subscriber is one coroutine waiting on an empty queue, so a worker
+can hold thousands of them.
+"""
+
+import asyncio
+import json
+import os
+import threading
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+from fastapi.encoders import jsonable_encoder
+
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "32"))
+EVENT_MAX_SUBSCRIBERS = int(os.getenv("EVENT_MAX_SUBSCRIBERS", "10000"))
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", "15"))
+
+LEADERBOARD_TOPIC = "leaderboard"
+
+
+def session_topic(session_id: str) -> str:
+    return f"session:{session_id}"
+
+
+def format_sse(event: str, data: Any) -> str:
+    payload = data if isinstance(data, str) else json.dumps(jsonable_encoder(data))
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Subscription:
+    def __init__(self, topic: str, queue_size: int):
+        self.topic = topic
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def offer(self, message: str):
+        """Runs on the subscriber's loop. Drops the oldest message when full."""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+
+class EventBroker:
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE, max_subscribers: int = EVENT_MAX_SUBSCRIBERS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def subscriber_count(self, topic: Optional[str] = None) -> int:
+        with self._lock:
+            return self._count if topic is None else len(self._subscribers.get(topic, ()))
+
+    def subscribe(self, topic: str) -> Subscription:
+        subscription = Subscription(topic, self.queue_size)
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise TooManySubscribers(f"Subscriber limit reached ({self.max_subscribers}).")
+            self._subscribers[topic].add(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.topic)
+            if subscribers and subscription in subscribers:
+                subscribers.discard(subscription)
+                self._count -= 1
+                if not subscribers:
+                    del self._subscribers[subscription.topic]
+
+    def publish(self, topic: str, event: str, data: Any):
+        """Fan an event out to the topic's subscribers. Thread-safe, never blocks."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+        if not subscribers:
+            return
+        message = format_sse(event, data)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, message)
+            except RuntimeError:
+                # Loop already closed (shutdown); the stream's finally will unsubscribe.
+                pass
+
+    async def stream(self, subscription: Subscription, initial: Optional[str] = None) -> AsyncIterator[str]:
+        """Yield SSE messages for a subscription, with heartbeats while idle."""
+        try:
+            if initial:
+                yield initial
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.queue.get(), EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield message
+        finally:
+            self.unsubscribe(subscription)
+
+
+broker = EventBroker()
@@ -0,0 +1,254 @@
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+from fastapi import HTTPException, status
+
+from config import GAME_CONFIG
+from crud.farmSession import FarmSessionCRUD, pack, unpack, FLOAT, INDEX, CODE
+from models.main import ObjectId
+from schemas.farmSession import FarmSessionCreate, FarmStageAction, FarmSession, FarmStageResponse, PlotResults
+from services import crop_growth, emission_methods, engine_core, farm_engine, static_data
+from services.farm_engine import FarmEngineError
+from services.main import AppService
+from utils.metrics import span
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FarmSessionService(AppService):
+    """
+    Farm sessions: many plots played together, one vectorized pass per stage.
+    Ván chơi nhiều ô ruộng, mỗi lượt được tính một lần cho toàn bộ các ô.
+    """
+
+    def create_farm_session(self, farm: FarmSessionCreate) -> FarmSession:
+        if farm.season_key not in engine_core.EF_C:
+            raise HTTPException(status_code=400, detail=f"Unknown season '{farm.season_key}'.")
+        plot_count = len(farm.areas)
+        regimes = [farm.water_regimes] * plot_count if isinstance(farm.water_regimes, str) else farm.water_regimes
+        try:
+            codes = farm_engine.regime_codes(regimes)
+        except FarmEngineError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        methodology = emission_methods.get(farm.methodology)
+        now = datetime.utcnow()
+        areas = np.asarray(farm.areas, dtype=FLOAT)
+        zeros = np.zeros(plot_count)
+        doc = {
+            "player_name": farm.player_name,
+            "season_key": farm.season_key,
+            "status": "in_progress",
+            "start_time": now,
+            "end_time": None,
+            "last_activity": now,
+            "version": 0,
+            "methodology": methodology.key,
+            "engine_version": methodology.version,
+            "plot_count": plot_count,
+            "total_area": float(areas.sum()),
+            "plots": {
+                "area": pack(areas, FLOAT),
+                "regime": pack(codes, CODE),
+                "regimes": farm_engine.WATER_REGIMES,
+            },
+            "cumulative": {
+                "ch4": pack(zeros, FLOAT), "n2o": pack(zeros, FLOAT), "co2e": pack(zeros, FLOAT),
+                "biomass": pack(np.full(plot_count, engine_core.CROP_INITIAL_BIOMASS), FLOAT),
+            },
+            "history": [],
+            "final_metrics": None,
+        }
+        created = FarmSessionCRUD(self.db).create(doc)
+        return self._to_schema(created, include_plots=False)
+
+    def get_farm_session(self, session_id: str, include_plots: bool = False) -> FarmSession:
+        return self._to_schema(self._load(session_id), include_plots)
+
+    def _load(self, session_id: str) -> dict:
+        if not ObjectId.is_valid(session_id):
+            raise HTTPException(status_code=400, detail=f"Invalid session ID: {session_id}")
+        doc = FarmSessionCRUD(self.db).get_state(session_id)
+        if not doc:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Farm session with ID '{session_id}' not found"
+            )
+        return doc
+
+    def play_stage(self, session_id: str, action: FarmStageAction, include_plots: bool = False) -> FarmStageResponse:
+        """
+        Tính một lượt cho toàn trang trại và chỉ ghi phần thay đổi ($push stage, $set trạng thái).
+        """
+        with span("session_load"):
+            doc = self._load(session_id)
+        if doc["status"] == "completed":
+            raise HTTPException(status_code=400, detail="This game has already been completed.")
+
+        stage_num = len(doc["history"]) + 1
+        if stage_num > GAME_CONFIG['total_stages']:
+            raise HTTPException(status_code=400, detail=f"All stages have been played. Total turns: {GAME_CONFIG['total_stages']}")
+        plot_count = doc["plot_count"]
+
+        if action.plan_index is None:
+            plan_index = np.zeros(plot_count, dtype=INDEX)
+        else:
+            if len(action.plan_index) != plot_count:
+                raise HTTPException(status_code=400, detail=f"plan_index must have {plot_count} entries, one per plot.")
+            plan_index = np.asarray(action.plan_index, dtype=np.int64)
+            if plan_index.min() < 0 or plan_index.max() >= len(action.plans):
+                raise HTTPException(status_code=400, detail="plan_index refers to a plan that does not exist.")
+            plan_index = plan_index.astype(INDEX)
+
+        with span("weather_lookup"):
+            weather = self._stage_weather(doc["season_key"], stage_num)
+
+        with span("engine_compute"):
+            plots = doc["plots"]
+            areas = unpack(plots["area"], FLOAT)
+            # Regime codes are stored against the regime list of their time; remap to the current one
+            remap = farm_engine.regime_codes(plots["regimes"])
+            regimes = remap[unpack(plots["regime"], CODE)]
+            methodology = self._methodology(doc)
+            try:
+                plans = farm_engine.compile_plans([engine_core.action_from_schema(plan) for plan in action.plans])
+                outcome = farm_engine.compute_stage(methodology, doc["season_key"], stage_num, weather, regimes,
+                                                    areas, plans, plan_index)
+            except FarmEngineError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+            cumulative = doc["cumulative"]
+            start_biomass = self._biomass(cumulative, plot_count)
+            end_biomass = farm_engine.grow_stage(doc["season_key"], stage_num, weather, regimes,
+                                                 plans, plan_index, start_biomass)
+            cum_ch4 = unpack(cumulative["ch4"], FLOAT) + outcome.ch4_emission
+            cum_n2o = unpack(cumulative["n2o"], FLOAT) + outcome.n2o_emission
+            cum_co2e = unpack(cumulative["co2e"], FLOAT) + outcome.co2e
+
+            stage_result = {
+                "ch4_emission": float(outcome.ch4_emission.sum()),
+                "n2o_emission": float(outcome.n2o_emission.sum()),
+                "biomass_growth": float(((end_biomass - start_biomass) * areas).sum()),
+            }
+            previous = doc["history"][-1]["cumulative_state"] if doc["history"] else {
+                "cumulative_ch4_emission": 0.0, "cumulative_n2o_emission": 0.0, "cumulative_emission": 0.0
+            }
+            cumulative_state = {
+                "cumulative_ch4_emission": previous["cumulative_ch4_emission"] + stage_result["ch4_emission"],
+                "cumulative_n2o_emission": previous["cumulative_n2o_emission"] + stage_result["n2o_emission"],
+                "cumulative_emission": previous["cumulative_emission"] + float(outcome.co2e.sum()),
+                "cumulative_biomass": float((end_biomass * areas).sum()),
+            }
+
+        now = datetime.utcnow()
+        stage = {
+            "stage_number": stage_num,
+            "stage_name": GAME_CONFIG['stages'][stage_num],
+            "weather_conditions": weather,
+            "plans": [plan.dict() for plan in action.plans],
+            "plan_index": pack(plan_index, INDEX),
+            "ch4": pack(outcome.ch4_emission, FLOAT),
+            "n2o": pack(outcome.n2o_emission, FLOAT),
+            "stage_result": stage_result,
+            "cumulative_state": cumulative_state,
+        }
+        sets = {
+            "cumulative": {
+                "ch4": pack(cum_ch4, FLOAT), "n2o": pack(cum_n2o, FLOAT), "co2e": pack(cum_co2e, FLOAT),
+                "biomass": pack(end_biomass, FLOAT),
+            },
+            "last_activity": now,
+            "engine_version": methodology.version,
+        }
+        final_metrics = None
+        status_value = "in_progress"
+        if stage_num == GAME_CONFIG['total_stages']:
+            status_value = "completed"
+            final_metrics = {
+                "final_net_emission": cumulative_state["cumulative_emission"],
+                **crop_growth.final_metrics(cumulative_state["cumulative_biomass"], cumulative_state["cumulative_emission"]),
+                "plot_count": plot_count,
+                "total_area": doc["total_area"],
+            }
+            sets.update({"status": status_value, "end_time": now, "final_metrics": final_metrics})
+
+        with span("save"):
+            saved = FarmSessionCRUD(self.db).append_stage(session_id, doc.get("version", 0), stage, sets)
+        if not saved:
+            raise HTTPException(status_code=409, detail="The farm session was modified concurrently, please retry.")
+
+        logger.debug("Farm stage played", extra={"session_id": session_id, "stage_number": stage_num, "plots": plot_count})
+        return FarmStageResponse(
+            session_id=session_id,
+            status=status_value,
+            version=doc.get("version", 0) + 1,
+            stage=stage,
+            final_metrics=final_metrics,
+            plots=self._plot_results(outcome.ch4_emission, outcome.n2o_emission, cum_co2e, end_biomass * areas) if include_plots else None,
+        )
+
+    def _stage_weather(self, season_key: str, stage_num: int) -> dict:
+        weather = static_data.stage_weather(season_key, stage_num)
+        if weather is not None:
+            return weather
+        weather_doc = self.db["weather_data"].find_one({"season_key": season_key})
+        if not weather_doc or len(weather_doc.get("data") or []) < stage_num:
+            raise HTTPException(status_code=500, detail=f"Weather data for season '{season_key}', stage {stage_num} not found.")
+        return weather_doc["data"][stage_num - 1]
+
+    @staticmethod
+    def _methodology(doc: dict) -> emission_methods.Methodology:
+        """The farm's methodology; farms created before methodologies were scored with `monnas`."""
+        try:
+            return emission_methods.get(doc.get("methodology") or emission_methods.FittedCurveMethod.key)
+        except emission_methods.MethodologyError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    @staticmethod
+    def _biomass(cumulative: dict, plot_count: int) -> np.ndarray:
+        """Standing biomass (kg/ha) per plot; farms created before the growth model start from seedlings."""
+        if "biomass" in cumulative:
+            return unpack(cumulative["biomass"], FLOAT)
+        return np.full(plot_count, engine_core.CROP_INITIAL_BIOMASS)
+
+    @staticmethod
+    def _plot_results(ch4: np.ndarray, n2o: np.ndarray, cumulative: np.ndarray, biomass: np.ndarray) -> PlotResults:
+        return PlotResults.construct(
+            ch4_emission=ch4.tolist(), n2o_emission=n2o.tolist(), cumulative_emission=cumulative.tolist(),
+            biomass=biomass.tolist()
+        )
+
+    def _to_schema(self, doc: dict, include_plots: bool) -> FarmSession:
+        plots: Optional[PlotResults] = None
+        if include_plots:
+            zeros = np.zeros(doc["plot_count"])
+            last = doc["history"][-1] if doc["history"] else None
+            ch4 = n2o = zeros
+            if last is not None and "ch4" in last:
+                ch4, n2o = unpack(last["ch4"], FLOAT), unpack(last["n2o"], FLOAT)
+            elif last is not None:
+                # get_state leaves the per-stage arrays out; read the last stage's
+                stored = FarmSessionCRUD(self.db).get_last_stage(str(doc["_id"]))
+                ch4, n2o = unpack(stored["ch4"], FLOAT), unpack(stored["n2o"], FLOAT)
+            biomass = self._biomass(doc["cumulative"], doc["plot_count"]) * unpack(doc["plots"]["area"], FLOAT)
+            plots = self._plot_results(ch4, n2o, unpack(doc["cumulative"]["co2e"], FLOAT), biomass)
+        return FarmSession(
+            _id=doc["_id"],
+            player_name=doc["player_name"],
+            season_key=doc["season_key"],
+            status=doc["status"],
+            start_time=doc["start_time"],
+            end_time=doc.get("end_time"),
+            last_activity=doc.get("last_activity"),
+            version=doc.get("version", 0),
+            methodology=doc.get("methodology") or emission_methods.FittedCurveMethod.key,
+            engine_version=doc.get("engine_version"),
+            plot_count=doc["plot_count"],
+            total_area=doc["total_area"],
+            history=[{key: stage[key] for key in ("stage_number", "stage_name", "weather_conditions", "plans",
+                                                   "stage_result", "cumulative_state")} for stage in doc["history"]],
+            final_metrics=doc.get("final_metrics"),
+            plots=plots,
+        )
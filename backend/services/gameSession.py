@@ -1,24 +1,50 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional, Union
 from crud.gameSession import GameSessionCRUD
-from schemas.gameSession import GameSession, GameSessionCreate, GameSessionInDB, StageSnapshotCreate, StageSnapshot, StageResult, CumulativeState, PlayerActionCreate
+from schemas.gameSession import GameSession, GameSessionCreate, GameSessionInDB, StageSnapshotCreate, StageSnapshot, StageResult, CumulativeState, PlayerActionCreate, PlayStageDelta
 from services.main import AppService
 from fastapi import HTTPException, status
 from models.main import ObjectId
 from services.game_engine import GameEngine, GameEngineError
+from utils.metrics import span
+from utils.log import sampled
+from services.events import broker, session_topic, LEADERBOARD_TOPIC
+from services.session_archive import SessionArchiveService
+from services import static_data, weather_samples
+import logging
+
+logger = logging.getLogger(__name__)
 
 class GameSessionService(AppService):
     def create_game_session(self, game_session: GameSessionCreate) -> GameSessionInDB:
         # Khởi tạo CRUD với database instance
         crud = GameSessionCRUD(self.db)
-        created_session = crud.create_game_session(game_session)
+        weather = None
+        if game_session.weather_mode == "stochastic":
+            weather = self._draw_weather(game_session.season_key, game_session.weather_seed)
+        created_session = crud.create_game_session(game_session, weather)
         # Không cần from_orm nữa nếu CRUD trả về đúng model Pydantic
         return created_session
 
+    def _draw_weather(self, season_key: str, seed: Optional[int]) -> weather_samples.DrawnWeather:
+        """
+        Lấy mẫu thời tiết cho cả mùa vụ từ các năm lịch sử (bộ nhớ chia sẻ trước, Mongo nếu chưa có).
+        """
+        samples = static_data.season_samples(season_key)
+        if samples is None:
+            doc = self.db[weather_samples.COLLECTION_NAME].find_one({"season_key": season_key})
+            samples = weather_samples.unpack(doc) if doc else None
+        if samples is None or not samples.years:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Stochastic weather is not available for season '{season_key}'."
+            )
+        return weather_samples.draw(samples, weather_samples.new_seed() if seed is None else seed)
+
     def get_all_game_sessions(self) -> List[GameSessionInDB]:
         crud = GameSessionCRUD(self.db)
         sessions = crud.get_all_game_sessions()
-        for session in sessions:
-            print("service", session)
+        logger.debug("Loaded %d game sessions", len(sessions))
         return sessions
     
     def get_session_by_id(self, session_id: str) -> GameSessionInDB:
@@ -29,6 +55,11 @@ class GameSessionService(AppService):
         crud = GameSessionCRUD(self.db)
         
         session = crud.get_by_id(session_id)
+        if not session:
+            # Phiên đã được chuyển sang collection lưu trữ: chỉ đọc, không khôi phục
+            archived = SessionArchiveService(self.db).get_archived(session_id)
+            if archived:
+                session = GameSessionInDB.parse_obj(crud.with_history(archived))
         
         # Luồng xử lý lỗi: Nếu CRUD không trả về gì (None), tức là không tìm thấy
         if not session:
@@ -40,9 +71,62 @@ class GameSessionService(AppService):
         # Nếu tìm thấy, trả về session
         return session
     
-    def play_stage(self, session_id: str, player_action_data: PlayerActionCreate) -> GameSession:
+    @staticmethod
+    def make_etag(version: int, stage_count: int) -> str:
+        return f'"{version}.{stage_count}"'
+
+    def get_session_etag(self, session_id: str) -> str:
+        """
+        ETag của session, tính từ version và số stage bằng một projection nhẹ.
+        """
+        if not ObjectId.is_valid(session_id):
+            raise HTTPException(status_code=400, detail=f"Invalid session ID: {session_id}")
+
+        version = GameSessionCRUD(self.db).get_version(session_id)
+        if not version:
+            archived = SessionArchiveService(self.db).get_archived(session_id)
+            if archived:
+                stage_count = archived.get("stage_count")
+                if stage_count is None:
+                    stage_count = len(archived.get("game_history") or [])
+                version = {"version": archived.get("version") or 0, "stage_count": stage_count}
+        if not version:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Game session with ID '{session_id}' not found"
+            )
+        return self.make_etag(version["version"], version["stage_count"])
+
+    def get_progress(self, session_id: str) -> dict:
+        """
+        Trạng thái gọn nhẹ của một phiên (status, stage cuối) cho các kết nối live.
+        """
+        if not ObjectId.is_valid(session_id):
+            raise HTTPException(status_code=400, detail=f"Invalid session ID: {session_id}")
+
+        progress = GameSessionCRUD(self.db).get_progress(session_id)
+        if not progress:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Game session with ID '{session_id}' not found"
+            )
+        history = progress.pop("game_history", [])
+        progress["_id"] = str(progress["_id"])
+        progress["stage"] = history[-1] if history else None
+        return progress
+
+    def get_leaderboard(self, limit: int = 10) -> List[dict]:
+        sessions = GameSessionCRUD(self.db).get_leaderboard(limit)
+        for session in sessions:
+            session["_id"] = str(session["_id"])
+        return sessions
+
+    def play_stage(self, session_id: str, player_action_data: PlayerActionCreate, compact: bool = False) -> Union[GameSession, PlayStageDelta]:
         """
         Xử lý logic cho một lượt chơi.
+
+        Với `compact=True` chỉ ghi và trả về phần thay đổi (PlayStageDelta),
+        không đọc lại hay serialize toàn bộ session.
         """
         crud = GameSessionCRUD(self.db)
 
@@ -50,47 +134,109 @@ class GameSessionService(AppService):
         if not ObjectId.is_valid(session_id):
             raise HTTPException(status_code=400, detail=f"Invalid session ID: {session_id}")
             
-        current_session = crud.get_by_id(session_id)
+        with span("session_load"):
+            # The compact response needs only the previous stage; the full one returns the whole history
+            current_session = crud.get_by_id(session_id, last_stage_only=compact)
+            if not current_session and SessionArchiveService(self.db).restore(session_id):
+                # Người chơi quay lại một ván đã bị lưu trữ
+                current_session = crud.get_by_id(session_id, last_stage_only=compact)
         if not current_session:
             raise HTTPException(status_code=404, detail="GameSession not found")
         
         if current_session.status == "completed":
              raise HTTPException(status_code=400, detail="This game has already been completed.")
 
-        current_stage_num = len(current_session.game_history) + 1
+        game_engine = GameEngine(session=current_session)
+        current_stage_num = game_engine.current_stage
         season_key = current_session.season_key 
 
-        weather_doc = self.db["weather_data"].find_one({"season_key": season_key})
-        if not weather_doc or not weather_doc.get("data"):
-            raise HTTPException(status_code=500, detail=f"Weather data for season '{season_key}' not found.")
-        
-        # access weather data
-        try:
-            weather_conditions = weather_doc["data"][current_stage_num - 1]
-        except IndexError:
-             raise HTTPException(status_code=500, detail=f"Weather data for stage {current_stage_num} not found.")
+        with span("weather_lookup"):
+            if current_session.weather_mode == "stochastic":
+                # Drawn when the session was created and stored with it
+                weather_conditions = weather_samples.stage_conditions(current_session.weather_data, current_stage_num)
+                if weather_conditions is None:
+                    raise HTTPException(status_code=500, detail=f"Weather data for stage {current_stage_num} not found.")
+            else:
+                # Shared cache first (no round-trip to Mongo); fall back to the collection
+                weather_conditions = static_data.stage_weather(season_key, current_stage_num)
+            if weather_conditions is None:
+                weather_doc = self.db["weather_data"].find_one({"season_key": season_key})
+                if not weather_doc or not weather_doc.get("data"):
+                    raise HTTPException(status_code=500, detail=f"Weather data for season '{season_key}' not found.")
+
+                # access weather data
+                try:
+                    weather_conditions = weather_doc["data"][current_stage_num - 1]
+                except IndexError:
+                    raise HTTPException(status_code=500, detail=f"Weather data for stage {current_stage_num} not found.")
 
         try:
-            game_engine = GameEngine(session=current_session)
+            with span("engine_compute"):
+                # play_stage của GameEngine sẽ thực hiện các bước 5, 6, 7, 8
+                updated_session = game_engine.play_stage(
+                    player_actions=player_action_data, 
+                    weather_data=weather_conditions
+                )
+                updated_session.last_activity = datetime.utcnow()
             
-            # play_stage của GameEngine sẽ thực hiện các bước 5, 6, 7, 8
-            updated_session = game_engine.play_stage(
-                player_actions=player_action_data, 
-                weather_data=weather_conditions
+            with span("save"):
+                saved = crud.append_stage(updated_session)
+            if not saved:
+                raise HTTPException(status_code=409, detail="The game session was modified concurrently, please retry.")
+            updated_session.version += 1
+            updated_session.stage_count = current_stage_num
+            saved_session = self._to_delta(updated_session) if compact else updated_session
+            self._publish_stage(updated_session)
+
+            logger.info(
+                "Stage played",
+                extra={"session_id": session_id, "stage_number": current_stage_num, **sampled()}
             )
-            
-            saved_session = crud.update_session(updated_session)
-            if not saved_session:
-                raise HTTPException(status_code=500, detail="Failed to save the updated game session.")
 
             # 10. Trả về kết quả
             return saved_session
 
         except GameEngineError as e:
             raise HTTPException(status_code=400, detail=str(e))
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
         
+    @staticmethod
+    def _to_delta(session: GameSession) -> PlayStageDelta:
+        last_stage = session.game_history[-1]
+        return PlayStageDelta(
+            session_id=str(session.id),
+            status=session.status,
+            version=session.version,
+            stage=last_stage,
+            cumulative_state=last_stage.cumulative_state,
+            end_time=session.end_time,
+            final_metrics=session.final_metrics
+        )
+
+    def _publish_stage(self, session: GameSessionInDB):
+        """
+        Push the committed stage to live subscribers (session page and leaderboard).
+        """
+        last_stage = session.game_history[-1]
+        session_id = str(session.id)
+        broker.publish(session_topic(session_id), "stage", {
+            "session_id": session_id,
+            "status": session.status,
+            "stage": last_stage,
+            "final_metrics": session.final_metrics,
+        })
+        broker.publish(LEADERBOARD_TOPIC, "stage", {
+            "session_id": session_id,
+            "player_name": session.player_name,
+            "season_key": session.season_key,
+            "stage_number": last_stage.stage_number,
+            "cumulative_emission": last_stage.cumulative_state.cumulative_emission,
+            "status": session.status,
+        })
+
     def add_stage(self, session_id: str, stage_data: StageSnapshotCreate) -> GameSession:
         crud = GameSessionCRUD(self.db)
         
@@ -0,0 +1,225 @@
+"""
+Idempotency-Key support for non-idempotent POST endpoints.
+
+A request carrying an `Idempotency-Key` header is executed at most once per
+(endpoint, key). The handler's result is kept in a bounded in-memory LRU and
+in a Mongo collection with a TTL index, so a retry is answered from the store
+without running the handler (and GameEngine) or writing again. Both the first
+response and a replay are returned to FastAPI as content, so the route's
+`response_model` shapes them the same way.
+
+Concurrent duplicates wait for the first request: inside one worker on a
+threading.Event, across workers by polling the Mongo claim document. A claim
+holds a lease of IDEMPOTENCY_LEASE_SECONDS; a retry takes over the claim of a
+worker that died before its lease expired.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException, Response, status
+from fastapi.encoders import jsonable_encoder
+from pymongo.errors import DuplicateKeyError
+
+from services.main import AppService
+
+COLLECTION_NAME = "idempotencyKey"
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+IDEMPOTENCY_LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "60"))
+
+
+class _MemoryStore:
+    """Bounded LRU of completed responses: key -> (expires_at, record)."""
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, record = item
+            if expires_at < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return record
+
+    def put(self, key: str, record: dict):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, record)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+
+_memory = _MemoryStore(IDEMPOTENCY_MAX_ENTRIES, IDEMPOTENCY_TTL_SECONDS)
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+_indexed_dbs = set()
+
+
+def _fingerprint(body: Any) -> str:
+    payload = json.dumps(jsonable_encoder(body), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IdempotencyService(AppService):
+    def _collection(self):
+        collection = self.db[COLLECTION_NAME]
+        if id(self.db) not in _indexed_dbs:
+            collection.create_index("created_at", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS)
+            _indexed_dbs.add(id(self.db))
+        return collection
+
+    def _replay(self, record: dict, fingerprint: str, response: Optional[Response]):
+        if record["fingerprint"] != fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was already used with a different request."
+            )
+        if response is not None:
+            response.headers["Idempotent-Replayed"] = "true"
+        # The stored content goes through the route's response_model like a fresh result
+        return json.loads(record["body"])
+
+    @staticmethod
+    def _lease_expired(doc: dict) -> bool:
+        # Claims written before leases existed expire IDEMPOTENCY_LEASE_SECONDS after creation
+        expires_at = doc.get("lease_expires_at") or doc["created_at"] + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+        return expires_at < datetime.utcnow()
+
+    def _wait_for_other_worker(self, key: str) -> Optional[dict]:
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            doc = self._collection().find_one({"_id": key})
+            if doc is None:
+                return None # the first request failed and released its claim
+            if doc.get("state") == "completed" or self._lease_expired(doc):
+                return doc
+            time.sleep(0.05)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this Idempotency-Key is still being processed."
+        )
+
+    def run(self, idempotency_key: Optional[str], scope: str, request_body: Any,
+            handler: Callable[[], Any], response: Response = None):
+        """
+        Execute `handler` once for (scope, idempotency_key) and return its
+        result, or replay the stored result for a repeated key.
+        Without a key the handler simply runs.
+
+        `request_body` is everything that shapes the response (body, view, ...):
+        reusing a key with a different one gets a 422. A replay is marked with
+        an `Idempotent-Replayed` header on `response`.
+
+        Failed requests (exceptions) are not stored, so the client may retry them.
+        """
+        if not idempotency_key:
+            return handler()
+
+        key = f"{scope}:{idempotency_key}"
+        fingerprint = _fingerprint(request_body)
+
+        while True:
+            record = _memory.get(key)
+            if record is not None:
+                return self._replay(record, fingerprint, response)
+
+            with _in_flight_lock:
+                event = _in_flight.get(key)
+                if event is None:
+                    event = threading.Event()
+                    _in_flight[key] = event
+                    owner = True
+                else:
+                    owner = False
+
+            if not owner:
+                # Same worker: wait for the first request, then re-check the store
+                if not event.wait(IDEMPOTENCY_WAIT_SECONDS):
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail="A request with this Idempotency-Key is still being processed."
+                    )
+                continue
+
+            try:
+                return self._run_as_owner(key, fingerprint, handler, response)
+            finally:
+                with _in_flight_lock:
+                    _in_flight.pop(key, None)
+                event.set()
+
+    def _claim(self, key: str, fingerprint: str, owner: str) -> Optional[dict]:
+        """
+        Insert the in-progress claim for `key`, or take over a claim whose lease
+        expired (its worker died). Returns None once claimed, or the stored
+        record if another worker already completed the same request.
+        """
+        collection = self._collection()
+        while True:
+            now = datetime.utcnow()
+            claim = {
+                "state": "in_progress",
+                "fingerprint": fingerprint,
+                "owner": owner,
+                "created_at": now,
+                "lease_expires_at": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS),
+            }
+            try:
+                collection.insert_one({"_id": key, **claim})
+                return None
+            except DuplicateKeyError:
+                doc = collection.find_one({"_id": key})
+                if doc is not None and doc.get("state") != "completed" and not self._lease_expired(doc):
+                    doc = self._wait_for_other_worker(key)
+                if doc is None:
+                    continue
+                if doc.get("state") == "completed":
+                    return {k: doc[k] for k in ("fingerprint", "body")}
+                # Expired lease: swap in our claim unless another retry got there first
+                taken = collection.update_one(
+                    {"_id": key, "state": "in_progress", "owner": doc.get("owner"),
+                     "lease_expires_at": doc.get("lease_expires_at")},
+                    {"$set": claim}
+                )
+                if taken.modified_count:
+                    return None
+
+    def _run_as_owner(self, key: str, fingerprint: str, handler: Callable[[], Any], response: Optional[Response]):
+        owner = uuid.uuid4().hex
+        record = self._claim(key, fingerprint, owner)
+        if record is not None:
+            _memory.put(key, record)
+            return self._replay(record, fingerprint, response)
+
+        collection = self._collection()
+        try:
+            result = handler()
+        except BaseException:
+            collection.delete_one({"_id": key, "owner": owner})
+            raise
+
+        record = {
+            "fingerprint": fingerprint,
+            "body": json.dumps(jsonable_encoder(result)),
+        }
+        # Only while we still hold the claim: a retry may have taken over an expired lease
+        collection.update_one({"_id": key, "owner": owner}, {"$set": {"state": "completed", **record}})
+        _memory.put(key, record)
+        return result
@@ -1,8 +1,11 @@
 from pymongo.database import Database
+from utils import profiling
 
 class DBSessionContext:
     def __init__(self, db: Database):
         self.db = db
+        # Services and CRUDs run in the handler's thread: let a request profile (if any) sample it
+        profiling.attach()
 
 class AppService(DBSessionContext):
     pass
@@ -0,0 +1,61 @@
+from typing import List
+
+from fastapi import HTTPException
+
+from config import GAME_CONFIG
+from schemas.methodology import MethodologyComparison, MethodologyComparisonRequest, MethodologyInfo, MethodologyResult, StageEmission
+from services import emission_methods, engine_core, static_data
+from services.emission_methods import MethodologyError
+from services.main import AppService
+
+
+class MethodologyService(AppService):
+    """
+    Emission methodologies and side-by-side comparison of one plan.
+    So sánh kết quả phát thải của cùng một phương án theo các phương pháp khác nhau.
+    """
+
+    def list_methodologies(self) -> List[MethodologyInfo]:
+        default = emission_methods.get().key
+        return [MethodologyInfo(**emission_methods.get(key).describe(), default=key == default)
+                for key in emission_methods.available()]
+
+    def compare(self, request: MethodologyComparisonRequest) -> MethodologyComparison:
+        if len(request.stages) > GAME_CONFIG['total_stages']:
+            raise HTTPException(status_code=400, detail=f"A plan has at most {GAME_CONFIG['total_stages']} stages.")
+        if request.season_key not in engine_core.EF_C:
+            raise HTTPException(status_code=400, detail=f"Unknown season '{request.season_key}'.")
+
+        weather = [self._stage_weather(request.season_key, stage_num) for stage_num in range(1, len(request.stages) + 1)]
+        inputs = [
+            engine_core.stage_input(request.season_key, request.water_regime, stage_num, engine_core.action_from_schema(action), weather[stage_num - 1])
+            for stage_num, action in enumerate(request.stages, start=1)
+        ]
+        try:
+            # Every methodology scores all stages of the plan in one vectorized call
+            outcomes = emission_methods.compare(emission_methods.batch_from_inputs(inputs), request.methodologies)
+        except MethodologyError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        results = []
+        for key, outcome in outcomes.items():
+            co2e = outcome.co2e
+            results.append(MethodologyResult(
+                methodology=key,
+                stages=[StageEmission(ch4_emission=ch4, n2o_emission=n2o, emission=total)
+                        for ch4, n2o, total in zip(outcome.ch4_emission.tolist(), outcome.n2o_emission.tolist(), co2e.tolist())],
+                total_ch4_emission=float(outcome.ch4_emission.sum()),
+                total_n2o_emission=float(outcome.n2o_emission.sum()),
+                total_emission=float(co2e.sum()),
+            ))
+        return MethodologyComparison(season_key=request.season_key, water_regime=request.water_regime,
+                                     weather_conditions=weather, results=results)
+
+    def _stage_weather(self, season_key: str, stage_num: int) -> dict:
+        weather = static_data.stage_weather(season_key, stage_num)
+        if weather is not None:
+            return weather
+        weather_doc = self.db["weather_data"].find_one({"season_key": season_key})
+        if not weather_doc or len(weather_doc.get("data") or []) < stage_num:
+            raise HTTPException(status_code=500, detail=f"Weather data for season '{season_key}', stage {stage_num} not found.")
+        return weather_doc["data"][stage_num - 1]
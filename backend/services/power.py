@@ -1,8 +1,179 @@
+import math
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import requests
 from utils.app_exceptions import AppException
+from services.power_archive import archive, parse_parameters
+from utils.rate_limit import (
+    TokenBucket, CircuitBreaker, RateLimitExceeded, CircuitOpen, backoff_delay, parse_retry_after
+)
+
+logger = logging.getLogger(__name__)
 
 NASA_POWER_API = "https://power.larc.nasa.gov/api/temporal/daily/point"
 
+# Outbound limits, shared by every request in this worker
+POWER_RATE_PER_SECOND = float(os.getenv("POWER_RATE_PER_SECOND", "2"))
+POWER_BURST = int(os.getenv("POWER_BURST", "5"))
+POWER_MAX_WAITERS = int(os.getenv("POWER_MAX_WAITERS", "32"))
+POWER_MAX_WAIT_SECONDS = float(os.getenv("POWER_MAX_WAIT_SECONDS", "10"))
+POWER_MAX_RETRIES = int(os.getenv("POWER_MAX_RETRIES", "3"))
+POWER_BACKOFF_BASE = float(os.getenv("POWER_BACKOFF_BASE", "0.5"))
+POWER_BACKOFF_CAP = float(os.getenv("POWER_BACKOFF_CAP", "8"))
+POWER_TIMEOUT = float(os.getenv("POWER_TIMEOUT", "30"))
+
+rate_limiter = TokenBucket(POWER_RATE_PER_SECOND, POWER_BURST, POWER_MAX_WAITERS)
+circuit_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("POWER_CIRCUIT_FAILURES", "5")),
+    reset_timeout=float(os.getenv("POWER_CIRCUIT_RESET_SECONDS", "30"))
+)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Large JSON queries are split into date-range x parameter chunks fetched in parallel
+POWER_CHUNK_DAYS = int(os.getenv("POWER_CHUNK_DAYS", "366"))
+POWER_CHUNK_PARAMETERS = int(os.getenv("POWER_CHUNK_PARAMETERS", "5"))
+POWER_CHUNK_CONCURRENCY = int(os.getenv("POWER_CHUNK_CONCURRENCY", "4"))
+
+_session = requests.Session()
+_session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=max(10, POWER_CHUNK_CONCURRENCY)))
+# Shared by all requests so the total number of parallel upstream calls stays bounded
+_chunk_pool = ThreadPoolExecutor(max_workers=POWER_CHUNK_CONCURRENCY, thread_name_prefix="power-chunk")
+
+
+def _get_with_resilience(params: dict) -> requests.Response:
+    """
+    GET the POWER API through the shared rate limiter and circuit breaker,
+    retrying 429/5xx and connection errors with jittered exponential backoff
+    (or the upstream's Retry-After, when given).
+    """
+    for attempt in range(POWER_MAX_RETRIES + 1):
+        try:
+            circuit_breaker.before_call()
+        except CircuitOpen as e:
+            raise AppException.ServiceUnavailable(context={
+                "error": "NASA POWER is unavailable, please retry later.",
+                "retry_after": math.ceil(e.retry_after) # Retry-After takes whole seconds
+            })
+        try:
+            rate_limiter.acquire(POWER_MAX_WAIT_SECONDS)
+        except RateLimitExceeded as e:
+            circuit_breaker.release() # the upstream was not contacted
+            raise AppException.TooManyRequests(context={"error": str(e)})
+
+        retry_after = None
+        try:
+            response = _session.get(NASA_POWER_API, params=params, timeout=POWER_TIMEOUT)
+        except requests.RequestException as e:
+            circuit_breaker.record_failure()
+            error = e
+        else:
+            if response.status_code not in RETRYABLE_STATUS:
+                circuit_breaker.record_success()
+                return response
+            # 429 means we are throttled, not that the upstream is down: neither a failure nor a success
+            if response.status_code == 429:
+                circuit_breaker.release()
+            else:
+                circuit_breaker.record_failure()
+            error = None
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+
+        if attempt == POWER_MAX_RETRIES:
+            break
+        delay = backoff_delay(attempt, POWER_BACKOFF_BASE, POWER_BACKOFF_CAP)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if delay > POWER_BACKOFF_CAP:
+            break # the upstream asks us to wait longer than a request should take
+        logger.warning("NASA POWER request failed, retrying in %.2fs (attempt %d)", delay, attempt + 1)
+        time.sleep(delay)
+
+    if error is not None:
+        raise AppException.BadRequest({"error": str(error)})
+    return response
+
+
+def _fetch(params: dict):
+    response = _get_with_resilience(params)
+
+    if response.status_code == 429:
+        raise AppException.TooManyRequests(context={
+            "nasa_status": response.status_code,
+            "retry_after": response.headers.get("Retry-After")
+        })
+
+    if response.status_code >= 400:
+        raise AppException.UnprocessableEntity(context={
+            "nasa_status": response.status_code,
+            "error": response.text
+        })
+
+    return response.json()
+
+
+def _split(start: int, end: int, parameters: str):
+    """[(start, end, "P1,P2"), ...] ordered by date then parameter group; one chunk if the query is small."""
+    try:
+        first = datetime.strptime(str(start), "%Y%m%d").date()
+        last = datetime.strptime(str(end), "%Y%m%d").date()
+    except ValueError:
+        return [(start, end, parameters)] # let the upstream report the bad date
+    names = parse_parameters(parameters)
+    groups = [",".join(names[i:i + POWER_CHUNK_PARAMETERS]) for i in range(0, len(names), POWER_CHUNK_PARAMETERS)] or [parameters]
+
+    chunks = []
+    day = first
+    while day <= last:
+        window_end = min(last, day + timedelta(days=POWER_CHUNK_DAYS - 1))
+        chunks += [(int(day.strftime("%Y%m%d")), int(window_end.strftime("%Y%m%d")), group) for group in groups]
+        day = window_end + timedelta(days=1)
+    return chunks or [(start, end, parameters)]
+
+
+def _merge(merged: dict, payload: dict):
+    """Merge a later chunk into the result; per-parameter series stay in date order."""
+    series = merged["properties"]["parameter"]
+    for name, values in payload["properties"]["parameter"].items():
+        series.setdefault(name, {}).update(values)
+    if isinstance(payload.get("parameters"), dict):
+        merged.setdefault("parameters", {}).update(payload["parameters"])
+
+
+def _fetch_chunked(params: dict) -> dict:
+    """
+    Fetch a large JSON query as parallel chunks. Each chunk is retried on its
+    own by `_get_with_resilience`; results are merged in chunk order as soon
+    as the next one in line is done.
+    """
+    chunks = _split(params["start"], params["end"], params["parameters"])
+    if len(chunks) == 1:
+        return _fetch(params)
+
+    futures = [
+        _chunk_pool.submit(_fetch, {**params, "start": start, "end": end, "parameters": group})
+        for start, end, group in chunks
+    ]
+    merged = None
+    try:
+        for future in futures:
+            payload = future.result()
+            if merged is None:
+                merged = payload
+            else:
+                _merge(merged, payload)
+    finally:
+        for future in futures:
+            future.cancel()
+
+    if isinstance(merged.get("header"), dict):
+        merged["header"].update({"start": str(params["start"]), "end": str(params["end"])})
+    return merged
+
+
 def fetch_daily_power_data(
     start: int,
     end: int,
@@ -25,18 +196,20 @@ def fetch_daily_power_data(
         "header": header.lower(),
         "time-standard": time_standard.lower()
     }
-    try:
-        response = requests.get(NASA_POWER_API, params=params, timeout=30)
-    except requests.RequestException as e:
-        raise AppException.BadRequest({"error": str(e)})
-    
-    if response.status_code == 429:
-        raise AppException.TooManyRequests(context={"nasa_status": response.status_code})
+    if format.lower() != "json":
+        # Only JSON bodies can be merged; other formats go out as one request
+        return _fetch(params)
 
-    if response.status_code >= 400:
-        raise AppException.UnprocessableEntity(context={
-            "nasa_status": response.status_code,
-            "error": response.text
-        })
-    
-    return response.json()
+    use_archive = archive is not None
+    if use_archive:
+        cached = archive.query(latitude, longitude, parameters, start, end, community, time_standard)
+        if cached.complete:
+            return archive.to_power_json(cached, latitude, longitude, start, end)
+
+    payload = _fetch_chunked(params)
+    if use_archive:
+        try:
+            archive.ingest(latitude, longitude, payload, community, time_standard)
+        except (OSError, KeyError, TypeError, ValueError):
+            logger.warning("Could not archive NASA POWER response", exc_info=True)
+    return payload
@@ -0,0 +1,322 @@
+"""
+Local archive of NASA POWER daily series.
+
+Each (community, time standard, location) is a directory of flat columns:
+
+    <root>/<community>/<time_standard>/<lat>_<lon>/
+        dates.i4      int32 YYYYMMDD, strictly increasing
+        T2M.f4        float32, one value per date
+        RH2M.f4       ...
+        meta.json     {"rows": n, "parameters": [...], "generation": g}
+
+Columns are memory-mapped read-only, so a range query is two binary searches
+on the date index and a slice of each column; the returned arrays are views
+into the page cache, no copy and no network access.
+
+Rows newer than the last archived date are appended to every column, then
+`meta.json` is atomically replaced. Readers only look at the first `rows`
+values, so a half-finished append is never visible. A parameter seen for the
+first time gets a whole new column, NaN ("not archived") on days its payload
+did not cover. POWER's own fill value (-999) is stored as-is.
+
+A payload that adds older days (a backfill), or values for days archived as
+NaN, is merged instead: every column is rewritten in merged date order into
+the files of the next generation (`dates.<g>.i4`, `T2M.<g>.f4`; generation 0
+uses the plain names), `meta.json` is switched to it and the previous
+generation is unlinked. Readers keep their mappings of the old files until
+they see the new `meta.json`. Archived values win over the payload.
+
+Lưu trữ cục bộ dữ liệu NASA POWER theo cột, đọc bằng mmap.
+"""
+
+import json
+import os
+import threading
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError: # not available on Windows; writers are then only serialized per process
+    fcntl = None
+
+POWER_ARCHIVE_DIR = os.getenv("POWER_ARCHIVE_DIR", "power_archive")
+
+DATE_DTYPE = np.dtype("<i4")
+VALUE_DTYPE = np.dtype("<f4")
+META_FILE = "meta.json"
+DATES_FILE = "dates.i4"
+
+
+def _dates_file(path: str, generation: int = 0) -> str:
+    return os.path.join(path, DATES_FILE if not generation else f"dates.{generation}.i4")
+
+
+def _column_file(path: str, name: str, generation: int = 0) -> str:
+    return os.path.join(path, f"{name}.f4" if not generation else f"{name}.{generation}.f4")
+
+
+class ArchiveRange(NamedTuple):
+    dates: np.ndarray # int32 YYYYMMDD
+    columns: Dict[str, np.ndarray] # parameter -> float32 view, NaN where not archived
+    complete: bool # every requested day and parameter is archived
+
+
+def location_key(latitude: float, longitude: float) -> str:
+    return f"{latitude:.4f}_{longitude:.4f}"
+
+
+def parse_parameters(parameters) -> List[str]:
+    if isinstance(parameters, str):
+        parameters = parameters.split(",")
+    return [p.strip().upper() for p in parameters if p.strip()]
+
+
+def _to_date(value: int) -> date:
+    return date(value // 10000, value // 100 % 100, value % 100)
+
+
+def _day_count(start: int, end: int) -> int:
+    try:
+        return (_to_date(end) - _to_date(start)).days + 1
+    except ValueError: # not a calendar date; let the upstream report it
+        return -1
+
+
+class _Series:
+    """Read-only mappings of one location, valid for one `meta.json` revision."""
+
+    __slots__ = ("stamp", "rows", "dates", "columns")
+
+    def __init__(self, path: str, stamp):
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        self.stamp = stamp
+        self.rows = meta["rows"]
+        generation = meta.get("generation", 0)
+        self.dates = self._map(_dates_file(path, generation), DATE_DTYPE)
+        self.columns = {name: self._map(_column_file(path, name, generation), VALUE_DTYPE)
+                        for name in meta["parameters"]}
+
+    def _map(self, file_path: str, dtype) -> np.ndarray:
+        if self.rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(file_path, dtype=dtype, mode="r", shape=(self.rows,))
+
+
+class PowerArchive:
+    def __init__(self, root: str = POWER_ARCHIVE_DIR):
+        self.root = root
+        self._series: Dict[str, _Series] = {}
+        self._write_lock = threading.Lock()
+
+    def _path(self, latitude: float, longitude: float, community: str, time_standard: str) -> str:
+        return os.path.join(self.root, community.lower(), time_standard.lower(), location_key(latitude, longitude))
+
+    def _open(self, path: str, retry: bool = True) -> Optional[_Series]:
+        try:
+            st = os.stat(os.path.join(path, META_FILE))
+        except FileNotFoundError:
+            return None
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        series = self._series.get(path)
+        if series is None or series.stamp != stamp:
+            try:
+                series = _Series(path, stamp)
+            except FileNotFoundError:
+                # A merge replaced the generation between reading meta.json and mapping its files
+                return self._open(path, retry=False) if retry else None
+            self._series[path] = series
+        return series
+
+    def query(self, latitude: float, longitude: float, parameters, start: int, end: int,
+              community: str = "ag", time_standard: str = "lst") -> ArchiveRange:
+        """
+        Archived rows with start <= date <= end (YYYYMMDD ints). Columns for
+        parameters that are not archived are absent and `complete` is False.
+        """
+        names = parse_parameters(parameters)
+        series = self._open(self._path(latitude, longitude, community, time_standard))
+        if series is None or series.rows == 0:
+            return ArchiveRange(np.empty(0, dtype=DATE_DTYPE), {}, False)
+
+        lo = int(np.searchsorted(series.dates, start, side="left"))
+        hi = int(np.searchsorted(series.dates, end, side="right"))
+        dates = series.dates[lo:hi]
+        columns = {name: series.columns[name][lo:hi] for name in names if name in series.columns}
+        complete = (
+            hi - lo == _day_count(start, end)
+            and len(columns) == len(names)
+            and not any(np.isnan(column).any() for column in columns.values())
+        )
+        return ArchiveRange(dates, columns, complete)
+
+    def append(self, latitude: float, longitude: float, dates: np.ndarray, columns: Dict[str, np.ndarray],
+               community: str = "ag", time_standard: str = "lst") -> int:
+        """
+        Add the rows of a payload. `dates` must be sorted. Rows newer than the
+        last archived date are appended; older days that are not archived yet
+        (or archived as NaN) are merged in by rewriting the columns. Returns the
+        number of rows added.
+        """
+        path = self._path(latitude, longitude, community, time_standard)
+        os.makedirs(path, exist_ok=True)
+        with self._write_lock, open(os.path.join(path, ".lock"), "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            meta = self._read_meta(path)
+            rows = meta["rows"]
+            generation = meta.get("generation", 0)
+
+            dates = np.asarray(dates, dtype=DATE_DTYPE)
+            if rows:
+                last = int(np.fromfile(_dates_file(path, generation), dtype=DATE_DTYPE,
+                                       count=1, offset=(rows - 1) * DATE_DTYPE.itemsize)[0])
+                keep = dates > last
+            else:
+                keep = np.ones(len(dates), dtype=bool)
+            new_parameters = [name for name in columns if name not in meta["parameters"]]
+            if not keep.all() and self._adds_history(path, meta, dates[~keep],
+                                                     {name: np.asarray(values)[~keep] for name, values in columns.items()}):
+                return self._merge(path, meta, dates, columns)
+
+            new_dates = dates[keep]
+            if not len(new_dates) and not new_parameters:
+                return 0
+
+            parameters = meta["parameters"] + new_parameters
+            # Drop any tail left behind by an interrupted append before writing
+            self._append_file(_dates_file(path, generation), rows, DATE_DTYPE, new_dates)
+            for name in parameters:
+                if name in columns:
+                    new_values = np.asarray(columns[name], dtype=VALUE_DTYPE)[keep]
+                else:
+                    new_values = np.full(len(new_dates), np.nan, dtype=VALUE_DTYPE)
+                if name in new_parameters:
+                    # A new column is written whole; `_adds_history` sent payloads covering archived days to `_merge`
+                    self._append_file(_column_file(path, name, generation), 0, VALUE_DTYPE,
+                                      np.concatenate([np.full(rows, np.nan, dtype=VALUE_DTYPE), new_values]))
+                else:
+                    self._append_file(_column_file(path, name, generation), rows, VALUE_DTYPE, new_values)
+
+            self._write_meta(path, {"rows": rows + len(new_dates), "parameters": parameters, "generation": generation})
+            return len(new_dates)
+
+    @staticmethod
+    def _adds_history(path: str, meta: dict, dates: np.ndarray, columns: Dict[str, np.ndarray]) -> bool:
+        """Whether payload rows at or before the last archived date hold anything the archive lacks."""
+        rows, generation = meta["rows"], meta.get("generation", 0)
+        archived = np.fromfile(_dates_file(path, generation), dtype=DATE_DTYPE, count=rows)
+        pos = np.minimum(np.searchsorted(archived, dates), rows - 1)
+        match = archived[pos] == dates
+        if not match.all():
+            return True
+        for name, values in columns.items():
+            given = ~np.isnan(np.asarray(values, dtype=VALUE_DTYPE))
+            if not given.any():
+                continue
+            if name not in meta["parameters"]:
+                return True
+            stored = np.fromfile(_column_file(path, name, generation), dtype=VALUE_DTYPE, count=rows)
+            if np.isnan(stored[pos[given]]).any():
+                return True
+        return False
+
+    def _merge(self, path: str, meta: dict, dates: np.ndarray, columns: Dict[str, np.ndarray]) -> int:
+        """Rewrite every column in merged date order as the next generation (caller holds the lock)."""
+        rows, generation = meta["rows"], meta.get("generation", 0)
+        parameters = meta["parameters"] + [name for name in columns if name not in meta["parameters"]]
+        archived = np.fromfile(_dates_file(path, generation), dtype=DATE_DTYPE, count=rows)
+        merged = np.union1d(archived, dates).astype(DATE_DTYPE)
+        archived_pos = np.searchsorted(merged, archived)
+        payload_pos = np.searchsorted(merged, dates)
+
+        target = generation + 1
+        self._append_file(_dates_file(path, target), 0, DATE_DTYPE, merged)
+        for name in parameters:
+            column = np.full(len(merged), np.nan, dtype=VALUE_DTYPE)
+            if name in columns:
+                column[payload_pos] = np.asarray(columns[name], dtype=VALUE_DTYPE)
+            if name in meta["parameters"]:
+                stored = np.fromfile(_column_file(path, name, generation), dtype=VALUE_DTYPE, count=rows)
+                known = ~np.isnan(stored)
+                column[archived_pos[known]] = stored[known]
+            self._append_file(_column_file(path, name, target), 0, VALUE_DTYPE, column)
+
+        self._write_meta(path, {"rows": len(merged), "parameters": parameters, "generation": target})
+        for file_path in [_dates_file(path, generation), *(_column_file(path, name, generation) for name in meta["parameters"])]:
+            try:
+                os.unlink(file_path)
+            except FileNotFoundError:
+                pass
+        return len(merged) - rows
+
+    @staticmethod
+    def _read_meta(path: str) -> dict:
+        try:
+            with open(os.path.join(path, META_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"rows": 0, "parameters": []}
+
+    @staticmethod
+    def _write_meta(path: str, meta: dict):
+        tmp_path = os.path.join(path, META_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(path, META_FILE))
+
+    @staticmethod
+    def _append_file(file_path: str, rows: int, dtype, values: np.ndarray):
+        with open(file_path, "ab") as f:
+            f.truncate(rows * dtype.itemsize)
+            f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    # POWER JSON <-> columns
+
+    def ingest(self, latitude: float, longitude: float, payload: dict,
+               community: str = "ag", time_standard: str = "lst") -> int:
+        """Append the series of a POWER daily point JSON response."""
+        dates, columns = columns_from_power_json(payload)
+        if not len(dates):
+            return 0
+        return self.append(latitude, longitude, dates, columns, community, time_standard)
+
+    @staticmethod
+    def to_power_json(result: ArchiveRange, latitude: float, longitude: float, start: int, end: int) -> dict:
+        """Render an archive range in the shape of a POWER daily point JSON response."""
+        day_keys = [str(d) for d in result.dates.tolist()]
+        return {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [longitude, latitude]},
+            "properties": {
+                "parameter": {
+                    name: dict(zip(day_keys, np.round(column.astype(np.float64), 2).tolist()))
+                    for name, column in result.columns.items()
+                }
+            },
+            "header": {"start": str(start), "end": str(end), "fill_value": -999.0, "source": "archive"},
+        }
+
+
+def columns_from_power_json(payload: dict) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    series = payload["properties"]["parameter"]
+    dates = sorted({int(day) for values in series.values() for day in values})
+    index = {day: i for i, day in enumerate(dates)}
+    columns = {}
+    for name, values in series.items():
+        column = np.full(len(dates), np.nan, dtype=VALUE_DTYPE)
+        for day, value in values.items():
+            if value is not None:
+                column[index[int(day)]] = value
+        columns[name.upper()] = column
+    return np.asarray(dates, dtype=DATE_DTYPE), columns
+
+
+archive = PowerArchive() if POWER_ARCHIVE_DIR else None
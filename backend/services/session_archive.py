@@ -0,0 +1,216 @@
+"""
+Lifecycle policy for game sessions.
+
+Sessions nobody has played for `SESSION_STALE_DAYS` (by `last_activity`) and
+sessions completed more than `SESSION_COMPLETED_RETENTION_DAYS` ago are moved
+from the hot `gameSession` collection into `gameSessionArchive`, so the hot
+working set only holds games that are being played.
+
+An archived document keeps a few summary fields for querying and the full
+original session as zlib-compressed BSON in `payload`. Moves are batched:
+one upsert `bulk_write` into the archive, then one delete `bulk_write` from
+the hot collection guarded by `version`, so a session played while being
+moved stays hot (its archive copy is dropped). Every step is idempotent; the
+job can run in several workers at once or be interrupted at any point.
+
+Stages stored in the `turnSnapshot` collection move with the session: they
+are packed into `payload` and deleted from `turnSnapshot` once the session
+has left the hot collection, and `restore()` writes them back. An archived
+session is therefore one document, and the TTL below removes all of it.
+
+With `SESSION_ARCHIVE_TTL_DAYS` > 0 archived sessions are deleted by a Mongo
+TTL index on `archived_at`. Sessions archived before their stages were packed
+still keep them in `turnSnapshot`.
+
+Chuyển các ván bỏ dở / đã xong lâu ngày sang collection lưu trữ (nén).
+"""
+
+import asyncio
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import bson
+from pymongo import DeleteOne, ReplaceOne
+from pymongo.errors import OperationFailure
+
+from crud.turnSnapshot import TurnSnapshotCRUD, STAGE_PROJECTION
+from models.gameSession import GameSessionModel
+from models.main import ObjectId
+from services.main import AppService
+from utils.metrics import REGISTRY, Counter
+
+logger = logging.getLogger(__name__)
+
+HOT_COLLECTION = GameSessionModel.Config.collection_name
+ARCHIVE_COLLECTION = "gameSessionArchive"
+
+SESSION_STALE_DAYS = float(os.getenv("SESSION_STALE_DAYS", "7"))
+SESSION_COMPLETED_RETENTION_DAYS = float(os.getenv("SESSION_COMPLETED_RETENTION_DAYS", "30"))
+SESSION_ARCHIVE_BATCH_SIZE = int(os.getenv("SESSION_ARCHIVE_BATCH_SIZE", "500"))
+SESSION_ARCHIVE_INTERVAL_SECONDS = float(os.getenv("SESSION_ARCHIVE_INTERVAL_SECONDS", "3600")) # 0 disables the job
+SESSION_ARCHIVE_TTL_DAYS = float(os.getenv("SESSION_ARCHIVE_TTL_DAYS", "0")) # 0 keeps archived sessions forever
+
+SUMMARY_FIELDS = ("player_name", "season_key", "water_regime", "status", "start_time", "end_time",
+                  "last_activity", "final_metrics", "engine_version")
+
+SESSIONS_ARCHIVED = REGISTRY.register(Counter(
+    "game_sessions_archived_total", "Game sessions moved to the archive collection.", ("reason",)
+))
+
+_indexed_dbs = set()
+
+
+def compress_session(doc: dict) -> bytes:
+    return zlib.compress(bson.encode(doc), 6)
+
+
+def decompress_session(payload: bytes) -> dict:
+    return bson.decode(zlib.decompress(payload))
+
+
+class SessionArchiveService(AppService):
+    def ensure_indexes(self):
+        if id(self.db) in _indexed_dbs:
+            return
+        hot = self.db[HOT_COLLECTION]
+        hot.create_index([("status", 1), ("last_activity", 1)])
+        hot.create_index([("status", 1), ("end_time", 1)])
+        if SESSION_ARCHIVE_TTL_DAYS > 0:
+            ttl = int(SESSION_ARCHIVE_TTL_DAYS * 86400)
+            try:
+                self.db[ARCHIVE_COLLECTION].create_index("archived_at", expireAfterSeconds=ttl)
+            except OperationFailure:
+                # The index exists with another TTL; update it in place
+                self.db.command("collMod", ARCHIVE_COLLECTION,
+                                index={"keyPattern": {"archived_at": 1}, "expireAfterSeconds": ttl})
+        _indexed_dbs.add(id(self.db))
+
+    @staticmethod
+    def archivable_filter(now: datetime) -> dict:
+        stale_before = now - timedelta(days=SESSION_STALE_DAYS)
+        completed_before = now - timedelta(days=SESSION_COMPLETED_RETENTION_DAYS)
+        unfinished = {"$in": ["in_progress", "failed"]}
+        return {"$or": [
+            {"status": unfinished, "last_activity": {"$lt": stale_before}},
+            # sessions written before last_activity existed
+            {"status": unfinished, "last_activity": None, "start_time": {"$lt": stale_before}},
+            {"status": "completed", "end_time": {"$lt": completed_before}},
+        ]}
+
+    def archive_batch(self, now: Optional[datetime] = None, batch_size: int = SESSION_ARCHIVE_BATCH_SIZE) -> dict:
+        """Move up to `batch_size` archivable sessions. Returns {"scanned", "archived", "skipped"}."""
+        now = now or datetime.utcnow()
+        hot = self.db[HOT_COLLECTION]
+        archive = self.db[ARCHIVE_COLLECTION]
+
+        docs = list(hot.find(self.archivable_filter(now)).limit(batch_size))
+        if not docs:
+            return {"scanned": 0, "archived": 0, "skipped": 0}
+
+        snapshots = TurnSnapshotCRUD(self.db)
+        stored = [doc["_id"] for doc in docs if doc.get("stage_count") is not None]
+        stages = snapshots.get_documents_by_session(stored) if stored else {}
+        archive.bulk_write([
+            ReplaceOne({"_id": doc["_id"]}, self._archive_doc(doc, now, stages.get(doc["_id"])), upsert=True)
+            for doc in docs
+        ], ordered=False)
+        deleted = hot.bulk_write([DeleteOne(self._unchanged(doc)) for doc in docs], ordered=False).deleted_count
+
+        still_hot = set()
+        if deleted < len(docs):
+            # Played while being moved: keep the hot copy, drop the stale archive copy
+            still_hot = {d["_id"] for d in hot.find({"_id": {"$in": [doc["_id"] for doc in docs]}}, {"_id": 1})}
+            if still_hot:
+                archive.delete_many({"_id": {"$in": list(still_hot)}})
+        # Only now that the sessions are gone from the hot collection: their stages live in the payload
+        snapshots.delete_sessions(session_id for session_id in stored if session_id not in still_hot)
+
+        for doc in docs:
+            if doc["_id"] not in still_hot:
+                SESSIONS_ARCHIVED.inc(self._reason(doc))
+        return {"scanned": len(docs), "archived": deleted, "skipped": len(still_hot)}
+
+    def run(self, now: Optional[datetime] = None, batch_size: int = SESSION_ARCHIVE_BATCH_SIZE,
+            max_batches: Optional[int] = None) -> dict:
+        """Archive batches until nothing is left (or `max_batches` is reached)."""
+        self.ensure_indexes()
+        now = now or datetime.utcnow()
+        totals = {"scanned": 0, "archived": 0, "skipped": 0, "batches": 0}
+        while max_batches is None or totals["batches"] < max_batches:
+            result = self.archive_batch(now, batch_size)
+            totals["batches"] += 1
+            for key, value in result.items():
+                totals[key] += value
+            if result["scanned"] < batch_size or result["archived"] == 0:
+                break
+        return totals
+
+    @staticmethod
+    def _unchanged(doc: dict) -> dict:
+        version = doc.get("version") or 0
+        return {"_id": doc["_id"], "version": {"$in": [0, None]} if version == 0 else version}
+
+    @staticmethod
+    def _reason(doc: dict) -> str:
+        return "completed" if doc.get("status") == "completed" else "abandoned"
+
+    @classmethod
+    def _archive_doc(cls, doc: dict, now: datetime, stages: Optional[List[dict]] = None) -> dict:
+        archived = {field: doc.get(field) for field in SUMMARY_FIELDS}
+        archived.update({
+            "_id": doc["_id"],
+            "stage_count": doc["stage_count"] if doc.get("stage_count") is not None else len(doc.get("game_history") or []),
+            "archived_at": now,
+            "reason": cls._reason(doc),
+            "payload": bson.Binary(compress_session(doc if stages is None else {**doc, "snapshots": stages})),
+        })
+        return archived
+
+    def _load(self, session_id: str) -> Optional[dict]:
+        doc = self.db[ARCHIVE_COLLECTION].find_one({"_id": ObjectId(session_id)}, {"payload": 1})
+        return decompress_session(doc["payload"]) if doc else None
+
+    def get_archived(self, session_id: str) -> Optional[dict]:
+        """
+        The original session document of an archived session, or None. Packed stages
+        are returned embedded as `game_history` (without `stage_count`), so readers do
+        not look for them in turnSnapshot.
+        """
+        original = self._load(session_id)
+        if original is not None and "snapshots" in original:
+            original["game_history"] = [
+                {key: value for key, value in stage.items() if key not in STAGE_PROJECTION}
+                for stage in original.pop("snapshots")
+            ]
+            original.pop("stage_count", None)
+        return original
+
+    def restore(self, session_id: str) -> bool:
+        """Move an archived session back to the hot collection (a player came back to it)."""
+        original = self._load(session_id)
+        if original is None:
+            return False
+        stages = original.pop("snapshots", None)
+        if stages is not None:
+            # Stages first: the hot session must not point at stages that are not there yet
+            TurnSnapshotCRUD(self.db).replace_session(original["_id"], stages)
+        original["last_activity"] = datetime.utcnow()
+        original["version"] = (original.get("version") or 0) + 1
+        self.db[HOT_COLLECTION].replace_one({"_id": original["_id"]}, original, upsert=True)
+        self.db[ARCHIVE_COLLECTION].delete_one({"_id": original["_id"]})
+        return True
+
+
+async def archive_periodically(get_db, interval: float = SESSION_ARCHIVE_INTERVAL_SECONDS):
+    """Background task started by the app lifespan."""
+    while True:
+        try:
+            totals = await asyncio.to_thread(lambda: SessionArchiveService(get_db()).run())
+            if totals["archived"]:
+                logger.info("Archived %d game sessions", totals["archived"], extra=totals)
+        except Exception:
+            logger.exception("Session archival failed; retrying in %.0fs", interval)
+        await asyncio.sleep(interval)
@@ -0,0 +1,89 @@
+"""
+Memoization of stage results across sessions.
+
+Most players pick from a handful of fertilizer/irrigation plans, so the same
+(season, water regime, stage, weather, action) comes up again and again. The
+cache maps the canonical key of a `StageInput` and the emission methodology
+to its `StageOutcome` in a bounded LRU. A stage's result does not depend on earlier stages (only the
+cumulative totals do), so it is safe to share between sessions.
+
+The key also holds the methodology's `version`, so entries computed with
+other factor tables are never returned.
+
+Ghi nhớ kết quả tính toán của từng stage giữa các ván chơi.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from services import engine_core
+from services.engine_core import StageInput, StageOutcome
+from utils.metrics import REGISTRY, Counter, Gauge
+
+STAGE_CACHE_SIZE = int(os.getenv("STAGE_CACHE_SIZE", "4096")) # 0 disables the cache
+
+STAGE_CACHE_REQUESTS = REGISTRY.register(Counter(
+    "stage_cache_requests_total", "Stage result cache lookups.", ("result",)
+))
+STAGE_CACHE_ENTRIES = REGISTRY.register(Gauge(
+    "stage_cache_entries", "Stage results currently memoized."
+))
+
+
+def stage_key(inp: StageInput) -> tuple:
+    """
+    Canonical key of a stage input. Fertilizer items are already sorted by
+    `engine_core.stage_input_from_action`, so key order in the request does
+    not matter.
+    """
+    return (
+        inp.season_key, inp.water_regime, inp.stage_num,
+        inp.avg_temp_c, inp.total_rainfall_mm, inp.avg_humidity_percent, inp.flooding_level,
+        inp.organic_fertilizer, inp.synthetic_fertilizer, inp.days, inp.area,
+    )
+
+
+class StageCache:
+    def __init__(self, max_entries: int = STAGE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[tuple, StageOutcome]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compute(self, inp: StageInput, methodology=None) -> StageOutcome:
+        """Outcome of `inp` under `methodology` (an `emission_methods.Methodology`; engine_core when None)."""
+        compute_stage = engine_core.compute_stage if methodology is None else methodology.compute_stage
+        if self.max_entries <= 0:
+            return compute_stage(inp)
+
+        try:
+            key = (getattr(methodology, "key", None), getattr(methodology, "version", None), *stage_key(inp))
+            hash(key)
+        except TypeError: # unhashable value in the request (e.g. a nested list); just compute
+            return compute_stage(inp)
+
+        with self._lock:
+            outcome = self._items.get(key)
+            if outcome is not None:
+                self._items.move_to_end(key)
+        if outcome is not None:
+            STAGE_CACHE_REQUESTS.inc("hit")
+            # StageOutcome is mutable; hand out a copy so callers cannot alter the cached value
+            return StageOutcome(outcome.ch4_emission, outcome.n2o_emission)
+
+        STAGE_CACHE_REQUESTS.inc("miss")
+        outcome = compute_stage(inp)
+        with self._lock:
+            self._items[key] = StageOutcome(outcome.ch4_emission, outcome.n2o_emission)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+            STAGE_CACHE_ENTRIES.set(len(self._items))
+        return outcome
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            STAGE_CACHE_ENTRIES.set(0)
+
+
+stage_cache = StageCache()
@@ -0,0 +1,125 @@
+"""
+Static game data (season weather) shared by all workers through a
+`SharedCache`.
+
+The leader worker loads `weather_data` from MongoDB once and publishes it as
+one float64 array `[season, stage, field]`, together with the historical
+samples of stochastic weather (`weather_samples`, one float32 array
+`[season, year, stage, field]`); every other worker attaches to
+the same pages instead of querying Mongo on each stage. The leader
+republishes every `STATIC_DATA_REFRESH_SECONDS` when the collection changed,
+and workers pick the new version up on their next lookup. If the leader
+exits, another worker takes the role at its next refresh tick.
+
+Dữ liệu thời tiết dùng chung giữa các worker qua bộ nhớ chia sẻ.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Optional
+
+import numpy as np
+
+from config import DB_CONFIG
+from services import weather_samples
+from services.weather_samples import SeasonSamples
+from utils.shared_cache import SharedCache
+
+logger = logging.getLogger(__name__)
+
+STATIC_DATA_REFRESH_SECONDS = float(os.getenv("STATIC_DATA_REFRESH_SECONDS", "300"))
+WEATHER_FIELDS = ("avg_temp_c", "total_rainfall_mm", "avg_humidity_percent")
+
+cache = SharedCache(f"static-data-{DB_CONFIG['db_name'] or 'default'}")
+_season_index = (0, {}, {}) # (snapshot version, season_key -> weather row, season_key -> samples row)
+
+
+def load_weather(db):
+    """Read `weather_data` into (arrays, meta) ready to publish."""
+    docs = sorted(db["weather_data"].find({}, {"season_key": 1, "data": 1}), key=lambda doc: doc["season_key"])
+    stage_counts = [len(doc.get("data") or []) for doc in docs]
+    weather = np.full((len(docs), max(stage_counts, default=0), len(WEATHER_FIELDS)), np.nan)
+    for row, doc in enumerate(docs):
+        for stage, values in enumerate(doc.get("data") or []):
+            weather[row, stage] = [values[field] for field in WEATHER_FIELDS]
+    meta = {"seasons": [doc["season_key"] for doc in docs], "stage_counts": stage_counts, "fields": list(WEATHER_FIELDS)}
+
+    sample_docs = sorted(db[weather_samples.COLLECTION_NAME].find({}), key=lambda doc: doc["season_key"])
+    seasons = [weather_samples.unpack(doc) for doc in sample_docs]
+    shape = (len(seasons), max((len(s.years) for s in seasons), default=0),
+             max((s.values.shape[1] for s in seasons), default=0), len(weather_samples.SAMPLE_FIELDS))
+    samples = np.full(shape, np.nan, dtype=weather_samples.DTYPE)
+    for row, season in enumerate(seasons):
+        samples[row, :len(season.years), :season.values.shape[1]] = season.values
+    meta.update({
+        "sample_seasons": [doc["season_key"] for doc in sample_docs],
+        "sample_years": [season.years for season in seasons],
+        "sample_stage_counts": [season.values.shape[1] for season in seasons],
+    })
+    return {"weather": weather, "samples": samples}, meta
+
+
+def publish(db) -> Optional[int]:
+    """Publish the current weather data. Returns the new version, or None if nothing changed."""
+    arrays, meta = load_weather(db)
+    current = cache.get()
+    if (current is not None and current.meta == meta and current.arrays.keys() == arrays.keys()
+            and all(np.array_equal(current.arrays[name], array, equal_nan=True) for name, array in arrays.items())):
+        return None
+    return cache.publish(arrays, meta)
+
+
+def stage_weather(season_key: str, stage_num: int) -> Optional[dict]:
+    """
+    Weather conditions of a stage (1-based) from the shared cache; None when
+    the cache has not been published yet or does not know the season/stage.
+    """
+    snapshot = cache.get()
+    if snapshot is None:
+        return None
+    row = _rows(snapshot)[0].get(season_key)
+    if row is None or not 1 <= stage_num <= snapshot.meta["stage_counts"][row]:
+        return None
+    values = snapshot.arrays["weather"][row, stage_num - 1].tolist()
+    return dict(zip(WEATHER_FIELDS, values))
+
+
+def season_samples(season_key: str) -> Optional[SeasonSamples]:
+    """
+    Historical (year, stage) weather of a season from the shared cache, as views
+    on the shared pages; None when not published or no samples were built.
+    """
+    snapshot = cache.get()
+    if snapshot is None:
+        return None
+    row = _rows(snapshot)[1].get(season_key)
+    if row is None:
+        return None
+    years = snapshot.meta["sample_years"][row]
+    values = snapshot.arrays["samples"][row, :len(years), :snapshot.meta["sample_stage_counts"][row]]
+    return SeasonSamples(years, values)
+
+
+def _rows(snapshot):
+    """Season -> row maps of the weather and samples arrays, rebuilt once per published version."""
+    global _season_index
+    version, weather_rows, sample_rows = _season_index
+    if version != snapshot.version:
+        weather_rows = {season: row for row, season in enumerate(snapshot.meta["seasons"])}
+        sample_rows = {season: row for row, season in enumerate(snapshot.meta.get("sample_seasons", []))}
+        _season_index = (snapshot.version, weather_rows, sample_rows)
+    return weather_rows, sample_rows
+
+
+async def maintain(get_db, interval: float = STATIC_DATA_REFRESH_SECONDS):
+    """Background task: the leader worker (re)publishes static data; others only take over if it exits."""
+    while True:
+        try:
+            if cache.try_become_leader():
+                version = await asyncio.to_thread(lambda: publish(get_db()))
+                if version is not None:
+                    logger.info("Published static game data (version %d)", version)
+        except Exception:
+            logger.exception("Publishing static game data failed; retrying in %.0fs", interval)
+        await asyncio.sleep(interval)
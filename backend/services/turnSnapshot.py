@@ -0,0 +1,40 @@
+from typing import List, Optional
+
+from fastapi import HTTPException, status
+
+from crud.gameSession import GameSessionCRUD
+from crud.turnSnapshot import TurnSnapshotCRUD
+from models.main import ObjectId
+from schemas.gameSession import StageSnapshot
+from services.main import AppService
+from services.session_archive import SessionArchiveService
+
+
+class TurnSnapshotService(AppService):
+    """
+    Đọc các lượt chơi đã lưu của một game session mà không tải cả session.
+    """
+
+    def get_stages(self, session_id: str, first: Optional[int] = None, last: Optional[int] = None) -> List[StageSnapshot]:
+        """
+        Stages `first`..`last` (inclusive) of a session, in order. Stages played
+        before the turnSnapshot collection existed are read from the session document.
+        """
+        if not ObjectId.is_valid(session_id):
+            raise HTTPException(status_code=400, detail=f"Invalid session ID: {session_id}")
+
+        session = GameSessionCRUD(self.db).get_history_source(session_id) or SessionArchiveService(self.db).get_archived(session_id)
+        if not session:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Game session with ID '{session_id}' not found"
+            )
+
+        if session.get("stage_count") is not None:
+            stages = TurnSnapshotCRUD(self.db).get_stages(session_id, first, last)
+        else:
+            stages = [
+                stage for stage in session.get("game_history") or []
+                if (first is None or stage["stage_number"] >= first) and (last is None or stage["stage_number"] <= last)
+            ]
+        return [StageSnapshot.parse_obj(stage) for stage in stages]
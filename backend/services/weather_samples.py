@@ -0,0 +1,84 @@
+"""
+Stochastic stage weather resampled from historical seasons.
+
+`tools/build_weather_samples.py` aggregates multi-year daily NASA POWER data
+into one row per (year, stage) for every season, the same way the fixed
+season weather was built (28-day stages: mean temperature, total rainfall,
+mean humidity, mean radiation). Each season is stored in the
+`weather_samples` collection as one packed float32 array
+`[year, stage, field]`, and `static_data` publishes all seasons to shared
+memory next to the fixed weather.
+
+A stochastic session draws one historical year from its seed, so the four
+stages keep the correlations of a real season. Drawing is one
+`numpy.random.Generator` call and an array lookup. The drawn stages are
+stored in the session's `weather_data`, so a session never depends on the
+samples again once created.
+
+Thời tiết ngẫu nhiên cho từng ván, lấy mẫu theo năm từ dữ liệu lịch sử.
+"""
+
+import secrets
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+from bson import Binary
+
+COLLECTION_NAME = "weather_samples"
+SAMPLE_FIELDS = ("avg_temp_c", "total_rainfall_mm", "avg_humidity_percent", "avg_radiation_mj_m2")
+# Keys of the session's weather_data (the GAME_CONFIG['weather_data'] layout) for each field
+SESSION_KEYS = ("temp", "rain", "humidity", "radiation")
+DTYPE = np.dtype("<f4")
+
+
+class SeasonSamples(NamedTuple):
+    years: List[int]
+    values: np.ndarray # [year, stage, field], float32
+
+
+class DrawnWeather(NamedTuple):
+    seed: int
+    year: int
+    weather_data: Dict[str, dict] # stage number (str) -> {"temp", "rain", "humidity", "radiation"}
+
+
+def pack(season_key: str, years: List[int], values: np.ndarray, **extra) -> dict:
+    """Document of one season's samples (`values` is [year, stage, field] in SAMPLE_FIELDS order)."""
+    values = np.ascontiguousarray(values, dtype=DTYPE)
+    return {
+        "season_key": season_key,
+        "years": [int(year) for year in years],
+        "stage_count": int(values.shape[1]),
+        "fields": list(SAMPLE_FIELDS),
+        "values": Binary(values.tobytes()),
+        **extra,
+    }
+
+
+def unpack(doc: dict) -> SeasonSamples:
+    values = np.frombuffer(doc["values"], dtype=DTYPE).reshape(len(doc["years"]), doc["stage_count"], len(doc["fields"]))
+    if tuple(doc["fields"]) != SAMPLE_FIELDS:
+        values = values[:, :, [doc["fields"].index(field) for field in SAMPLE_FIELDS]]
+    return SeasonSamples(doc["years"], values)
+
+
+def new_seed() -> int:
+    return secrets.randbits(63)
+
+
+def draw(samples: SeasonSamples, seed: int) -> DrawnWeather:
+    """The historical year picked by `seed`: the same seed and samples always give the same weather."""
+    index = int(np.random.default_rng(seed).integers(len(samples.years)))
+    weather_data = {
+        str(stage + 1): {key: round(float(value), 2) for key, value in zip(SESSION_KEYS, row)}
+        for stage, row in enumerate(samples.values[index])
+    }
+    return DrawnWeather(seed, samples.years[index], weather_data)
+
+
+def stage_conditions(weather_data: Dict[str, dict], stage_num: int) -> Optional[dict]:
+    """A stored stage of a session's weather_data in the engine's weather keys."""
+    stage = weather_data.get(str(stage_num))
+    if stage is None:
+        return None
+    return {field: stage[key] for field, key in zip(SAMPLE_FIELDS, SESSION_KEYS) if stage.get(key) is not None}
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from config import GAME_CONFIG
+from services import crop_growth, emission_methods, engine_core, farm_engine
+from services.engine_core import Action
+from services.weather_samples import stage_conditions
+
+STAGES = range(1, GAME_CONFIG['total_stages'] + 1)
+
+ACTIONS = [
+    Action(flooding_level=5.0, organic_fertilizer=(("Compost", 2000.0),),
+           synthetic_fertilizer=(("NPK_de_nhanh", 100.0), ("Urea", 80.0))),
+    Action(flooding_level=0.0, organic_fertilizer=(("Straw_short", 1500.0),)),
+    Action(flooding_level=12.0, synthetic_fertilizer=(("Ammonium_sulphate", 50.0),)),
+    Action(flooding_level=3.0),
+]
+
+
+def _weather(season_key, stage_num):
+    return stage_conditions(GAME_CONFIG['weather_data'][season_key], stage_num)
+
+
+@pytest.mark.parametrize("methodology_key", emission_methods.available())
+@pytest.mark.parametrize("season_key", sorted(GAME_CONFIG['weather_data']))
+def test_one_plot_farm_scores_like_a_single_field(methodology_key, season_key):
+    methodology = emission_methods.get(methodology_key)
+    plans = farm_engine.compile_plans(ACTIONS)
+    for water_regime in farm_engine.WATER_REGIMES:
+        regimes = farm_engine.regime_codes([water_regime])
+        for stage_num in STAGES:
+            weather = _weather(season_key, stage_num)
+            for plan, action in enumerate(ACTIONS):
+                farm = farm_engine.compute_stage(
+                    methodology, season_key, stage_num, weather, regimes,
+                    np.array([1.0]), plans, np.array([plan])
+                )
+                field = methodology.compute_stage(
+                    engine_core.stage_input(season_key, water_regime, stage_num, action, weather)
+                )
+                assert farm.ch4_emission[0] == pytest.approx(field.ch4_emission, rel=1e-12, abs=1e-12)
+                assert farm.n2o_emission[0] == pytest.approx(field.n2o_emission, rel=1e-12, abs=1e-12)
+
+
+def test_plot_emissions_scale_with_area():
+    methodology = emission_methods.get(emission_methods.DEFAULT_METHODOLOGY)
+    plans = farm_engine.compile_plans(ACTIONS[:1])
+    weather = _weather("he-thu", 2)
+    farm = farm_engine.compute_stage(
+        methodology, "he-thu", 2, weather, farm_engine.regime_codes(["AWD", "AWD"]),
+        np.array([1.0, 2.5]), plans, np.array([0, 0])
+    )
+    np.testing.assert_allclose(farm.ch4_emission[1], 2.5 * farm.ch4_emission[0], rtol=1e-12)
+    np.testing.assert_allclose(farm.n2o_emission[1], 2.5 * farm.n2o_emission[0], rtol=1e-12)
+
+
+@pytest.mark.parametrize("season_key", sorted(GAME_CONFIG['weather_data']))
+def test_one_plot_farm_grows_like_a_single_field(season_key):
+    plans = farm_engine.compile_plans(ACTIONS)
+    for water_regime in farm_engine.WATER_REGIMES:
+        regimes = farm_engine.regime_codes([water_regime])
+        for plan, action in enumerate(ACTIONS):
+            farm = np.array([engine_core.CROP_INITIAL_BIOMASS])
+            field = engine_core.CROP_INITIAL_BIOMASS
+            applied_n = engine_core.applied_nitrogen(action.synthetic_fertilizer, action.organic_fertilizer)
+            for stage_num in STAGES:
+                weather = _weather(season_key, stage_num)
+                farm = farm_engine.grow_stage(season_key, stage_num, weather, regimes, plans, np.array([plan]), farm)
+                field = crop_growth.stage_biomass(season_key, water_regime, stage_num, field, weather,
+                                                  action.flooding_level, applied_n)
+                assert farm[0] == pytest.approx(field, rel=1e-12)
+
+
+def test_unknown_season_is_rejected():
+    methodology = emission_methods.get(emission_methods.DEFAULT_METHODOLOGY)
+    with pytest.raises(farm_engine.FarmEngineError):
+        farm_engine.compute_stage(
+            methodology, "xuan-he", 1, _weather("he-thu", 1), farm_engine.regime_codes(["AWD"]),
+            np.array([1.0]), farm_engine.compile_plans(ACTIONS[:1]), np.array([0])
+        )
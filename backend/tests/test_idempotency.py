@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+mongomock = pytest.importorskip("mongomock")
+
+from services import idempotency
+from services.idempotency import COLLECTION_NAME, IdempotencyService
+
+SCOPE = "create-game-session:client-a"
+KEY = f"{SCOPE}:key-1"
+BODY = {"season": "spring"}
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(idempotency, "_memory", idempotency._MemoryStore(100, 3600))
+    monkeypatch.setattr(idempotency, "_in_flight", {})
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT_SECONDS", 0.2)
+    return IdempotencyService(mongomock.MongoClient().db)
+
+
+def _stale_claim(service, **fields):
+    """The claim of a worker that died while handling the request."""
+    doc = {
+        "_id": KEY,
+        "state": "in_progress",
+        "fingerprint": idempotency._fingerprint(BODY),
+        "owner": "dead-worker",
+        "created_at": datetime.utcnow() - timedelta(seconds=2 * idempotency.IDEMPOTENCY_LEASE_SECONDS),
+        **fields,
+    }
+    service.db[COLLECTION_NAME].insert_one(doc)
+
+
+def test_handler_runs_once(service):
+    calls = []
+
+    def handler():
+        calls.append(1)
+        return {"id": len(calls)}
+
+    assert service.run("key-1", SCOPE, BODY, handler) == {"id": 1}
+    assert service.run("key-1", SCOPE, BODY, handler) == {"id": 1}
+    assert calls == [1]
+    assert service.db[COLLECTION_NAME].find_one({"_id": KEY})["state"] == "completed"
+
+
+def test_replay_from_mongo_after_restart(service, monkeypatch):
+    service.run("key-1", SCOPE, BODY, lambda: {"id": 1})
+    monkeypatch.setattr(idempotency, "_memory", idempotency._MemoryStore(100, 3600))
+    assert service.run("key-1", SCOPE, BODY, lambda: pytest.fail("handler ran twice")) == {"id": 1}
+
+
+def test_same_key_other_body_is_rejected(service):
+    service.run("key-1", SCOPE, BODY, lambda: {"id": 1})
+    with pytest.raises(HTTPException) as error:
+        service.run("key-1", SCOPE, {"season": "autumn"}, lambda: {"id": 2})
+    assert error.value.status_code == 422
+
+
+def test_failed_request_releases_claim(service):
+    def failing():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        service.run("key-1", SCOPE, BODY, failing)
+    assert service.db[COLLECTION_NAME].find_one({"_id": KEY}) is None
+    assert service.run("key-1", SCOPE, BODY, lambda: {"id": 2}) == {"id": 2}
+
+
+def test_expired_lease_is_taken_over(service):
+    _stale_claim(service, lease_expires_at=datetime.utcnow() - timedelta(seconds=1))
+    assert service.run("key-1", SCOPE, BODY, lambda: {"id": 2}) == {"id": 2}
+    doc = service.db[COLLECTION_NAME].find_one({"_id": KEY})
+    assert doc["state"] == "completed"
+    assert doc["owner"] != "dead-worker"
+
+
+def test_legacy_claim_expires_from_created_at(service):
+    _stale_claim(service)  # no lease_expires_at: written before leases existed
+    assert service.run("key-1", SCOPE, BODY, lambda: {"id": 2}) == {"id": 2}
+
+
+def test_live_lease_is_not_taken_over(service):
+    _stale_claim(
+        service,
+        created_at=datetime.utcnow(),
+        lease_expires_at=datetime.utcnow() + timedelta(seconds=idempotency.IDEMPOTENCY_LEASE_SECONDS),
+    )
+    with pytest.raises(HTTPException) as error:
+        service.run("key-1", SCOPE, BODY, lambda: pytest.fail("handler ran while another worker holds the key"))
+    assert error.value.status_code == 409
+    assert service.db[COLLECTION_NAME].find_one({"_id": KEY})["owner"] == "dead-worker"
+
+
+def test_completion_after_takeover_keeps_new_owner(service):
+    """A worker whose lease was taken over must not overwrite the new owner's claim."""
+    collection = service.db[COLLECTION_NAME]
+
+    def slow_handler():
+        # While this request runs, its lease expires and a retry takes over the claim
+        collection.update_one({"_id": KEY}, {"$set": {"owner": "retry-worker"}})
+        return {"id": 1}
+
+    assert service.run("key-1", SCOPE, BODY, slow_handler) == {"id": 1}
+    doc = collection.find_one({"_id": KEY})
+    assert doc["owner"] == "retry-worker"
+    assert doc["state"] == "in_progress"
+
+
+def test_keys_are_scoped(service):
+    service.run("key-1", SCOPE, BODY, lambda: {"id": 1})
+    assert service.run("key-1", "create-game-session:client-b", BODY, lambda: {"id": 2}) == {"id": 2}
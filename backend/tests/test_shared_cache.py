@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+from utils import shared_cache
+from utils.shared_cache import _CONTROL, SharedCache
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path / "cache")
+
+
+def test_nothing_published(directory):
+    cache = SharedCache("weather", directory)
+    assert cache.version() == 0
+    assert cache.get() is None
+
+
+def test_publish_and_read(directory):
+    writer = SharedCache("weather", directory)
+    arrays = {"temp": np.arange(12, dtype=np.float32).reshape(3, 4), "codes": np.array([1, 2, 3], dtype=np.uint8)}
+    assert writer.publish(arrays, {"source": "test"}) == 1
+
+    snapshot = SharedCache("weather", directory).get()
+    assert snapshot.version == 1
+    assert snapshot.meta == {"source": "test"}
+    for name, array in arrays.items():
+        assert snapshot.arrays[name].dtype == array.dtype
+        np.testing.assert_array_equal(snapshot.arrays[name], array)
+    assert not snapshot.arrays["temp"].flags.writeable
+
+
+def test_reader_follows_new_versions(directory):
+    writer = SharedCache("weather", directory)
+    reader = SharedCache("weather", directory)
+    writer.publish({"x": np.array([1.0])}, {"n": 1})
+    first = reader.get()
+    assert reader.get() is first  # unchanged version: same snapshot, no re-attach
+
+    writer.publish({"x": np.array([2.0, 3.0])}, {"n": 2})
+    second = reader.get()
+    assert second.version == 2
+    np.testing.assert_array_equal(second.arrays["x"], [2.0, 3.0])
+    # The superseded file is unlinked, but the mapping held by the reader stays valid
+    assert not os.path.exists(os.path.join(directory, "weather.1.bin"))
+    np.testing.assert_array_equal(first.arrays["x"], [1.0])
+
+
+def test_data_file_gone_returns_none(directory):
+    SharedCache("weather", directory).publish({"x": np.array([1.0])}, {})
+    os.unlink(os.path.join(directory, "weather.1.bin"))
+    assert SharedCache("weather", directory).get() is None
+
+
+def test_superseded_between_version_and_open_retries(directory, monkeypatch):
+    cache = SharedCache("weather", directory)
+    cache.publish({"x": np.array([1.0])}, {})
+    attach = SharedCache._attach
+    calls = []
+
+    def racing_attach(self, version):
+        calls.append(version)
+        if len(calls) == 1:
+            raise FileNotFoundError(version)
+        return attach(self, version)
+
+    monkeypatch.setattr(SharedCache, "_attach", racing_attach)
+    snapshot = SharedCache("weather", directory).get()
+    assert snapshot.version == 1
+    assert calls == [1, 1]
+
+
+def test_publish_after_interrupted_update(directory):
+    cache = SharedCache("weather", directory)
+    cache.publish({"x": np.array([1.0])}, {})
+    control = cache._control_map()
+    seq, version = _CONTROL.unpack_from(control, 0)
+    # A publisher died between the two sequence bumps: odd sequence number
+    _CONTROL.pack_into(control, 0, seq + 1, version)
+    assert cache.version() == 1
+    assert cache.publish({"x": np.array([2.0])}, {}) == 2
+    assert SharedCache("weather", directory).get().version == 2
+
+
+@pytest.mark.skipif(shared_cache.fcntl is None, reason="leader election needs fcntl")
+def test_one_leader(directory):
+    first = SharedCache("weather", directory)
+    second = SharedCache("weather", directory)
+    assert first.try_become_leader()
+    assert first.try_become_leader()  # kept
+    assert not second.try_become_leader()
+    first._leader_file.close()  # the leader process exited
+    first._leader_file = None
+    assert second.try_become_leader()
+
+
+def _publish_in_child(directory, value):
+    SharedCache("weather", directory).publish({"x": np.array([value])}, {"pid": os.getpid()})
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_publish_from_another_process(directory):
+    reader = SharedCache("weather", directory)
+    context = multiprocessing.get_context("fork")
+    for expected_version, value in ((1, 5.0), (2, 7.0)):
+        child = context.Process(target=_publish_in_child, args=(directory, value))
+        child.start()
+        child.join(10)
+        assert child.exitcode == 0
+        snapshot = reader.get()
+        assert snapshot.version == expected_version
+        assert snapshot.meta["pid"] == child.pid
+        np.testing.assert_array_equal(snapshot.arrays["x"], [value])
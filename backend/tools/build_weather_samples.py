@@ -0,0 +1,133 @@
+"""
+Build the historical weather samples used by stochastic sessions.
+
+For every season in GAME_CONFIG and every year in the requested range, the
+season is shifted to that year (same start day and month), cut into
+`total_stages` stages of `engine_core.STAGE_DAYS` days and aggregated like
+the fixed season weather: mean temperature (T2M), total rainfall
+(PRECTOTCORR), mean humidity (RH2M) and mean radiation (ALLSKY_SFC_SW_DWN,
+MJ/m²/day). Years with missing days are skipped. Each season is written to
+the `weather_samples` collection as one packed float32 array; running
+workers pick the new samples up at their next static data refresh.
+
+The daily data comes from `services.power`, i.e. the NASA POWER archive
+when it already holds the range, chunked upstream requests otherwise.
+
+Tạo dữ liệu mẫu thời tiết nhiều năm cho chế độ thời tiết ngẫu nhiên.
+
+Usage (from the backend/ folder):
+
+    python -m tools.build_weather_samples --start-year 2001 --end-year 2024
+    python -m tools.build_weather_samples --start-year 2001 --end-year 2024 --dry-run
+"""
+
+import argparse
+import json
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from config import GAME_CONFIG
+from services import engine_core, weather_samples
+from services.power import fetch_daily_power_data
+from services.power_archive import columns_from_power_json
+
+PARAMETERS = ("T2M", "PRECTOTCORR", "RH2M", "ALLSKY_SFC_SW_DWN") # in weather_samples.SAMPLE_FIELDS order
+AGGREGATES = (np.mean, np.sum, np.mean, np.mean)
+
+
+def season_window(season: dict, year: int) -> Tuple[date, date]:
+    """First and last day of a season started in `year`."""
+    start = datetime.strptime(season["start_date"], "%Y%m%d").date().replace(year=year)
+    days = GAME_CONFIG["total_stages"] * engine_core.STAGE_DAYS
+    return start, start + timedelta(days=days - 1)
+
+
+def _yyyymmdd(day: date) -> int:
+    return day.year * 10000 + day.month * 100 + day.day
+
+
+def stage_rows(dates: np.ndarray, columns: Dict[str, np.ndarray], start: date):
+    """[stage, field] aggregates of one season, or None when a day is missing."""
+    days = GAME_CONFIG["total_stages"] * engine_core.STAGE_DAYS
+    first = np.searchsorted(dates, _yyyymmdd(start))
+    expected = [_yyyymmdd(start + timedelta(days=offset)) for offset in range(days)]
+    if not np.array_equal(dates[first:first + days], expected):
+        return None
+    daily = np.stack([columns[parameter][first:first + days] for parameter in PARAMETERS], axis=1)
+    if np.isnan(daily).any():
+        return None
+    stages = daily.reshape(GAME_CONFIG["total_stages"], engine_core.STAGE_DAYS, len(PARAMETERS))
+    return np.stack([aggregate(stages[:, :, field], axis=1) for field, aggregate in enumerate(AGGREGATES)], axis=1)
+
+
+def build(start_year: int, end_year: int) -> List[dict]:
+    location = GAME_CONFIG["location"]
+    windows = {
+        season_key: [(year, season_window(season, year)) for year in range(start_year, end_year + 1)]
+        for season_key, season in GAME_CONFIG["seasons"].items()
+    }
+    first = min(window[0] for season in windows.values() for _, window in season)
+    last = max(window[1] for season in windows.values() for _, window in season)
+    payload = fetch_daily_power_data(
+        _yyyymmdd(first), _yyyymmdd(last), location["longitude"], location["latitude"], parameters=",".join(PARAMETERS)
+    )
+    dates, columns = columns_from_power_json(payload) # sorted by date
+    # POWER marks missing values with -999
+    columns = {parameter: np.where(values <= -999, np.nan, values) for parameter, values in columns.items()}
+
+    docs = []
+    for season_key, season_windows in windows.items():
+        years, values = [], []
+        for year, (start, _) in season_windows:
+            rows = stage_rows(dates, columns, start)
+            if rows is not None:
+                years.append(year)
+                values.append(rows)
+        if not years:
+            continue
+        docs.append(weather_samples.pack(
+            season_key, years, np.stack(values),
+            stage_days=engine_core.STAGE_DAYS, source="NASA POWER", built_at=datetime.utcnow()
+        ))
+    return docs
+
+
+def save(db, docs: List[dict]):
+    collection = db[weather_samples.COLLECTION_NAME]
+    for doc in docs:
+        collection.replace_one({"season_key": doc["season_key"]}, doc, upsert=True)
+
+
+def summary(docs: List[dict]) -> dict:
+    result = {}
+    for doc in docs:
+        samples = weather_samples.unpack(doc)
+        result[doc["season_key"]] = {
+            "years": len(samples.years),
+            "first_year": samples.years[0],
+            "last_year": samples.years[-1],
+            # Spread across years of each stage's fields, to check the samples look sane
+            "stage_mean": np.round(samples.values.mean(axis=0), 2).tolist(),
+            "stage_std": np.round(samples.values.std(axis=0), 2).tolist(),
+        }
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build historical weather samples for stochastic sessions.")
+    parser.add_argument("--start-year", type=int, required=True)
+    parser.add_argument("--end-year", type=int, required=True)
+    parser.add_argument("--dry-run", action="store_true", help="Print the summary without writing.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    from db.db import get_db
+
+    args = parse_args()
+    docs = build(args.start_year, args.end_year)
+    if not args.dry_run:
+        save(get_db(), docs)
+    print(json.dumps({"fields": list(weather_samples.SAMPLE_FIELDS), "seasons": summary(docs)}, indent=2))
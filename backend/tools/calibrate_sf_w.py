@@ -0,0 +1,267 @@
+"""
+Refit the SF_w coefficients from field observations.
+
+SF_w = a * exp(b*T) * (1 + c*R) * sigmoid(d*H) * sigmoid(e*F) is fitted
+separately for every (stage, water regime) of `engine_core.SF_W_COEFFICIENTS`
+(12 fits) with bounded Levenberg-Marquardt: residuals and the analytic
+Jacobian are computed with numpy over all observations of the group and all
+starting points at once, and parameters that reach a bound are held there
+(projected steps). The first start is the current coefficients, the others
+are drawn uniformly within the bounds. The fits run in worker processes.
+
+The observations (CSV, or Parquet with pyarrow) need the columns `stage`,
+`water_regime`, `avg_temp_c`, `total_rainfall_mm`, `avg_humidity_percent`,
+`flooding_level` and either `sf_w` or, with `--target ch4`, a measured
+`ch4_kg_ha_day` and the `season_key` (converted to SF_w with EF_c and the fixed
+scaling factors, assuming no organic amendment).
+
+The report gives, per fit, the number of observations, RMSE, MAE and R², the
+same statistics for the current coefficients, and the parameters that ended
+on a bound. The coefficient file is loaded by the engine with
+`SF_W_COEFFICIENTS_FILE=<file>`; groups without enough observations are left
+out of it and keep their built-in coefficients. `ENGINE_VERSION` changes with
+the coefficients, so `tools.recompute_sessions` then re-scores stored sessions.
+
+Hiệu chỉnh lại các hệ số a–e của SF_w từ số liệu đo đạc ngoài đồng ruộng.
+
+Usage (from the backend/ folder):
+
+    python -m tools.calibrate_sf_w observations.csv --output coefficients/sf_w.json
+    python -m tools.calibrate_sf_w observations.parquet --target ch4 --starts 16 --dry-run
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from services import engine_core
+from tools import tables
+
+PARAMETERS = ("a", "b", "c", "d", "e")
+DEFAULT_BOUNDS = {"a": (1e-6, 10.0), "b": (0.0, 0.2), "c": (0.0, 0.1), "d": (0.0, 5.0), "e": (0.0, 5.0)}
+INPUT_COLUMNS = ("avg_temp_c", "total_rainfall_mm", "avg_humidity_percent", "flooding_level")
+MIN_OBSERVATIONS = 10
+
+
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    return 0.5 * (1.0 + np.tanh(0.5 * z))
+
+
+def sf_w_curve(theta: np.ndarray, x: np.ndarray):
+    """
+    SF_w and its Jacobian for K parameter sets at once.
+
+    Args:
+        theta: (K, 5) coefficients a..e
+        x: (4, N) temperature, rainfall, humidity, flooding level
+    Returns:
+        f: (K, N), jacobian: (K, 5, N)
+    """
+    a, b, c, d, e = (theta[:, i, None] for i in range(5))
+    temp, rain, humidity, flooding = x
+    rain_term = 1.0 + c * rain
+    s_h = _sigmoid(d * humidity)
+    s_f = _sigmoid(e * flooding)
+    g = np.exp(b * temp) * rain_term * s_h * s_f
+    f = a * g
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d_c = np.where(rain_term != 0, f * rain / rain_term, 0.0)
+    jacobian = np.stack([g, f * temp, d_c, f * humidity * (1 - s_h), f * flooding * (1 - s_f)], axis=1)
+    return f, jacobian
+
+
+def fit(x: np.ndarray, y: np.ndarray, starts: np.ndarray, lower: np.ndarray, upper: np.ndarray,
+        max_iter: int = 500, ftol: float = 1e-12) -> Tuple[np.ndarray, float, int, bool]:
+    """
+    Bounded least squares from several starts; returns the best (theta, cost, iterations, converged).
+    `starts` is (K, 5) and must lie within the bounds.
+    """
+    theta = starts.copy()
+    k = len(theta)
+    f, jacobian = sf_w_curve(theta, x)
+    residual = f - y
+    cost = 0.5 * np.einsum("kn,kn->k", residual, residual)
+    damping = np.full(k, 1e-3)
+    done = np.zeros(k, dtype=bool)
+    eye = np.eye(5)
+    iterations = 0
+    for iterations in range(1, max_iter + 1):
+        jtj = jacobian @ jacobian.transpose(0, 2, 1)
+        gradient = (jacobian @ residual[..., None])[..., 0]
+        # Parameters on a bound that the gradient pushes outwards are held fixed for this step
+        held = ((theta <= lower) & (gradient > 0)) | ((theta >= upper) & (gradient < 0))
+        free = ~held
+        scale = np.maximum(np.diagonal(jtj, axis1=1, axis2=2), 1e-12)
+        system = (jtj + damping[:, None, None] * scale[:, :, None] * eye) * (free[:, :, None] & free[:, None, :])
+        system += eye * held[:, :, None]
+        step = np.linalg.solve(system, -(gradient * free)[..., None])[..., 0]
+        candidate = np.clip(theta + step, lower, upper)
+
+        f_new, jacobian_new = sf_w_curve(candidate, x)
+        residual_new = f_new - y
+        cost_new = 0.5 * np.einsum("kn,kn->k", residual_new, residual_new)
+        better = (cost_new < cost) & ~done
+        improvement = np.where(better, cost - cost_new, 0.0)
+
+        theta[better] = candidate[better]
+        residual[better] = residual_new[better]
+        jacobian[better] = jacobian_new[better]
+        cost[better] = cost_new[better]
+        damping = np.clip(np.where(better, damping / 3.0, damping * 2.0), 1e-12, 1e12)
+        done |= (better & (improvement <= ftol * np.maximum(cost, 1e-300))) | (damping >= 1e12) | (cost == 0)
+        if done.all():
+            break
+    best = int(np.argmin(cost))
+    return theta[best], float(cost[best]), iterations, bool(done[best])
+
+
+def goodness(theta, x: np.ndarray, y: np.ndarray) -> dict:
+    predicted = sf_w_curve(np.asarray(theta, dtype=float)[None, :], x)[0][0]
+    error = predicted - y
+    total = float(((y - y.mean()) ** 2).sum())
+    return {
+        "rmse": float(np.sqrt((error ** 2).mean())),
+        "mae": float(np.abs(error).mean()),
+        "r2": 1.0 - float((error ** 2).sum()) / total if total > 0 else None,
+    }
+
+
+def fit_group(task: dict) -> dict:
+    """Fit one (stage, water regime). Runs in a worker process."""
+    x, y = task["x"], task["y"]
+    lower, upper = task["lower"], task["upper"]
+    result = {"stage": task["stage"], "water_regime": task["water_regime"], "observations": int(len(y))}
+    current = np.array(engine_core.SF_W_COEFFICIENTS[(task["stage"], task["water_regime"])])
+    if len(y) < task["min_observations"]:
+        result["skipped"] = f"{len(y)} observations, at least {task['min_observations']} needed"
+        return result
+
+    rng = np.random.default_rng(task["seed"])
+    starts = np.vstack([np.clip(current, lower, upper), rng.uniform(lower, upper, size=(task["starts"] - 1, 5))])
+    started = time.perf_counter()
+    theta, _, iterations, converged = fit(x, y, starts, lower, upper, task["max_iter"])
+    at_bound = [name for name, value, lo, hi in zip(PARAMETERS, theta, lower, upper)
+                if np.isclose(value, lo, rtol=1e-9, atol=1e-15) or np.isclose(value, hi, rtol=1e-9, atol=1e-15)]
+    result.update({
+        **dict(zip(PARAMETERS, theta.tolist())),
+        "fit": {**goodness(theta, x, y), "iterations": iterations, "converged": converged, "at_bound": at_bound,
+                "seconds": round(time.perf_counter() - started, 3)},
+        "current": goodness(current, x, y),
+    })
+    return result
+
+
+def load_observations(path: str, target: str) -> Dict[str, np.ndarray]:
+    if target == "ch4":
+        columns = tables.read_columns(path, numeric=("stage", *INPUT_COLUMNS, "ch4_kg_ha_day"),
+                                      text=("water_regime", "season_key"))
+        unknown = sorted(set(columns["season_key"]) - set(engine_core.EF_C))
+        if unknown:
+            raise tables.TableError(f"{path}: unknown season_key {unknown}")
+        ef_c = np.array([engine_core.EF_C[season] for season in columns["season_key"]])
+        columns["sf_w"] = columns["ch4_kg_ha_day"] / (ef_c * engine_core.SF_P * engine_core.SF_S * engine_core.SF_R)
+    else:
+        columns = tables.read_columns(path, numeric=("stage", *INPUT_COLUMNS, "sf_w"), text=("water_regime",))
+    finite = np.isfinite(columns["sf_w"])
+    for name in INPUT_COLUMNS:
+        finite &= np.isfinite(columns[name])
+    return {name: values[finite] for name, values in columns.items()}
+
+
+def tasks(observations: Dict[str, np.ndarray], bounds: Dict[str, Tuple[float, float]], starts: int,
+          seed: int, max_iter: int, min_observations: int) -> List[dict]:
+    lower = np.array([bounds[name][0] for name in PARAMETERS], dtype=float)
+    upper = np.array([bounds[name][1] for name in PARAMETERS], dtype=float)
+    x_all = np.stack([observations[name] for name in INPUT_COLUMNS])
+    result = []
+    for index, (stage, regime) in enumerate(sorted(engine_core.SF_W_COEFFICIENTS)):
+        rows = (observations["stage"] == stage) & (observations["water_regime"] == regime)
+        result.append({
+            "stage": stage, "water_regime": regime, "x": x_all[:, rows], "y": observations["sf_w"][rows],
+            "lower": lower, "upper": upper, "starts": max(starts, 1), "seed": seed + index,
+            "max_iter": max_iter, "min_observations": max(min_observations, len(PARAMETERS)),
+        })
+    return result
+
+
+def coefficient_file(results: List[dict], source: str, rows: int, target: str, bounds: dict, label: str = None) -> dict:
+    fitted = [r for r in results if "skipped" not in r]
+    digest = hashlib.sha1(repr([(r["stage"], r["water_regime"], *(r[p] for p in PARAMETERS)) for r in fitted])
+                          .encode("utf-8")).hexdigest()[:8]
+    now = datetime.utcnow()
+    return {
+        "format": engine_core.SF_W_FILE_FORMAT,
+        "version": label or f"{now.strftime('%Y%m%dT%H%M%S')}-{digest}",
+        "created_at": now.isoformat(),
+        "source": os.path.basename(source),
+        "rows": rows,
+        "target": target,
+        "bounds": {name: list(bounds[name]) for name in PARAMETERS},
+        "coefficients": fitted,
+        "skipped": [{"stage": r["stage"], "water_regime": r["water_regime"], "reason": r["skipped"]}
+                    for r in results if "skipped" in r],
+    }
+
+
+def parse_bounds(values: List[str]) -> Dict[str, Tuple[float, float]]:
+    bounds = dict(DEFAULT_BOUNDS)
+    for value in values or []:
+        try:
+            name, limits = value.split("=", 1)
+            low, high = (float(limit) for limit in limits.split(":", 1))
+        except ValueError:
+            raise SystemExit(f"--bound expects NAME=LOW:HIGH, got {value!r}")
+        if name not in PARAMETERS or not low < high:
+            raise SystemExit(f"--bound {value!r}: NAME is one of {PARAMETERS} and LOW < HIGH")
+        bounds[name] = (low, high)
+    return bounds
+
+
+def run(args) -> dict:
+    started = time.perf_counter()
+    observations = load_observations(args.observations, args.target)
+    bounds = parse_bounds(args.bound)
+    work = tasks(observations, bounds, args.starts, args.seed, args.max_iter, args.min_observations)
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(fit_group, work))
+    doc = coefficient_file(results, args.observations, int(len(observations["sf_w"])), args.target, bounds, args.version)
+    if not args.dry_run:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=2)
+    return {"output": None if args.dry_run else args.output, "version": doc["version"], "rows": doc["rows"],
+            "seconds": round(time.perf_counter() - started, 3), "fits": results}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Refit the SF_w coefficients from field observations.")
+    parser.add_argument("observations", help="CSV or Parquet file of observations.")
+    parser.add_argument("--output", default="coefficients/sf_w.json", help="Coefficient file to write.")
+    parser.add_argument("--target", choices=("sf_w", "ch4"), default="sf_w",
+                        help="Fit the sf_w column, or SF_w derived from ch4_kg_ha_day and season_key.")
+    parser.add_argument("--bound", action="append", metavar="NAME=LOW:HIGH",
+                        help=f"Override a parameter bound (default {DEFAULT_BOUNDS}).")
+    parser.add_argument("--starts", type=int, default=8, help="Starting points per fit, the first is the current coefficients.")
+    parser.add_argument("--max-iter", type=int, default=500)
+    parser.add_argument("--min-observations", type=int, default=MIN_OBSERVATIONS,
+                        help="Groups with fewer observations keep their current coefficients.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random starting points.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument("--version", default=None, help="Version label of the file (default: timestamp and hash).")
+    parser.add_argument("--dry-run", action="store_true", help="Print the report without writing the file.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    try:
+        report = run(parse_args())
+    except tables.TableError as e:
+        raise SystemExit(str(e))
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,275 @@
+"""
+Load test harness for the game API.
+
+Simulates N concurrent players. Each player creates a game session, plays all
+stages with randomized valid actions and reads the final session back. The
+run is summarised as a JSON report with throughput, error rate and
+p50/p95/p99 latency per endpoint.
+
+Mô phỏng N người chơi đồng thời để đo khả năng chịu tải của một worker.
+
+Usage (from the backend/ folder):
+
+    # In-process ASGI app backed by an in-memory Mongo (mongomock)
+    python -m tools.load_test --players 200 --concurrency 50 --ramp-up 5
+
+    # Against a running server (python server.py)
+    python -m tools.load_test --base-url http://127.0.0.1:8000 --players 200
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+from config import GAME_CONFIG
+
+WATER_REGIMES = ["traditional_technique", "AWD", "regular_rainfed"]
+ORGANIC_FERTILIZERS = ["Straw_short", "Straw_long", "Compost", "Farm_yard_manure", "Green_manure"]
+SYNTHETIC_FERTILIZERS = [
+    "Urea", "Diammonium_phosphate", "Ammonium_sulphate", "Ammonium_chloride",
+    "Ammonium_nitrate", "Lân", "Kali", "NPK_de_nhanh", "NPK_lam_rong",
+]
+
+# What the frontend (StepPlay.tsx) sends: amendment keys in stage 1 ("" when none was
+# chosen), then one of these labels per stage, or "urea" when none was chosen
+FRONTEND_ORGANIC = ["", *ORGANIC_FERTILIZERS]
+FRONTEND_SYNTHETIC = [
+    "", "Urea", "Diammonium phosphate", "Ammonium sulphate", "Ammonium chloride", "Ammonium nitrate",
+    "Superphosphate", "Kali", "NPK in stage 2 (NPK_de_nhanh)", "NPK in stage 3 (NPK_lam_rong)",
+]
+
+CREATE_SESSION = "POST /game-sessions/"
+PLAY_STAGE = "POST /game-sessions/{session_id}/play-stage"
+READ_SESSION = "GET /game-sessions/{session_id}"
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def random_player_action(rng: random.Random) -> dict:
+    """Build a random but valid body for the play-stage endpoint."""
+    organic = {
+        name: round(rng.uniform(0.0, 5.0), 2)
+        for name in rng.sample(ORGANIC_FERTILIZERS, rng.randint(0, 2))
+    }
+    synthetic = {
+        name: round(rng.uniform(0.0, 150.0), 1)
+        for name in rng.sample(SYNTHETIC_FERTILIZERS, rng.randint(1, 3))
+    }
+    return {
+        "player_action": {
+            "fertilization": {
+                "organic_fertilizer": organic,
+                "synthetic_fertilizer": synthetic,
+            },
+            "irrigation": {"level": round(rng.uniform(0.0, 10.0), 1)},
+        }
+    }
+
+
+def frontend_player_action(rng: random.Random, stage: int) -> dict:
+    """The play-stage body exactly as the frontend builds it (stage is 0-based)."""
+    if stage == 0:
+        name = rng.choice(FRONTEND_ORGANIC)
+        organic, synthetic = {name: round(rng.uniform(0.0, 5.0), 2) if name else 0}, {}
+    else:
+        name = rng.choice(FRONTEND_SYNTHETIC)
+        organic, synthetic = {}, {name or "urea": round(rng.uniform(0.0, 150.0), 1) if name else 0}
+    return {
+        "player_action": {
+            "fertilization": {
+                "organic_fertilizer": organic,
+                "synthetic_fertilizer": synthetic,
+            },
+            "irrigation": {"level": rng.randint(0, 10)},
+        }
+    }
+
+
+class Recorder:
+    """Collects latency samples and errors per endpoint."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.status_codes: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    async def call(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await client.request(method, url, **kwargs)
+            status_code = response.status_code
+        except httpx.HTTPError:
+            status_code = 0
+        self.latencies[endpoint].append((time.perf_counter() - started) * 1000.0)
+        self.status_codes[endpoint][status_code] += 1
+        if status_code == 0 or status_code >= 400:
+            self.errors[endpoint] += 1
+            return None
+        return response
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        total_requests = 0
+        total_errors = 0
+        for endpoint, samples in self.latencies.items():
+            samples = sorted(samples)
+            count = len(samples)
+            errors = self.errors[endpoint]
+            total_requests += count
+            total_errors += errors
+            endpoints[endpoint] = {
+                "requests": count,
+                "errors": errors,
+                "error_rate": errors / count if count else 0.0,
+                "throughput_rps": count / elapsed if elapsed else 0.0,
+                "latency_ms": {
+                    "mean": sum(samples) / count if count else 0.0,
+                    "p50": percentile(samples, 50),
+                    "p95": percentile(samples, 95),
+                    "p99": percentile(samples, 99),
+                    "max": samples[-1] if samples else 0.0,
+                },
+                "status_codes": {str(k): v for k, v in sorted(self.status_codes[endpoint].items())},
+            }
+        return {
+            "elapsed_s": elapsed,
+            "requests": total_requests,
+            "errors": total_errors,
+            "error_rate": total_errors / total_requests if total_requests else 0.0,
+            "throughput_rps": total_requests / elapsed if elapsed else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+async def run_player(player_id: int, client: httpx.AsyncClient, recorder: Recorder, args, semaphore: asyncio.Semaphore):
+    rng = random.Random(args.seed * 100003 + player_id if args.seed is not None else None)
+    await asyncio.sleep(args.ramp_up * player_id / max(args.players, 1))
+
+    async def think():
+        if args.think_time > 0:
+            await asyncio.sleep(rng.uniform(0, args.think_time))
+
+    async with semaphore:
+        body = {
+            "player_name": f"loadtest-{player_id}",
+            "season_key": rng.choice(list(GAME_CONFIG["seasons"].keys())),
+            "water_regime": rng.choice(WATER_REGIMES),
+        }
+        response = await recorder.call(client, CREATE_SESSION, "POST", "/game-sessions/", json=body)
+        if response is None:
+            return
+        session_id = response.json()["_id"]
+
+        for stage in range(GAME_CONFIG["total_stages"]):
+            await think()
+            action = frontend_player_action(rng, stage) if args.actions == "frontend" else random_player_action(rng)
+            response = await recorder.call(
+                client, PLAY_STAGE, "POST", f"/game-sessions/{session_id}/play-stage", json=action,
+            )
+            if response is None:
+                return
+
+        await think()
+        await recorder.call(client, READ_SESSION, "GET", f"/game-sessions/{session_id}")
+
+
+def build_in_process_client(timeout: float) -> httpx.AsyncClient:
+    """
+    Wire the FastAPI app to an in-memory Mongo stand-in and seed the per-stage
+    weather documents that `play_stage` reads.
+    """
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit("In-process mode needs mongomock: pip install mongomock (or pass --base-url).")
+
+    from main import app
+    from db.db import get_db
+
+    db = mongomock.MongoClient()["loadtest"]
+    for season_key, stages in GAME_CONFIG["weather_data"].items():
+        db["weather_data"].insert_one({
+            "season_key": season_key,
+            "data": [
+                {
+                    "avg_temp_c": stage["temp"],
+                    "total_rainfall_mm": stage["rain"],
+                    "avg_humidity_percent": stage["humidity"],
+                }
+                for _, stage in sorted(stages.items())
+            ],
+        })
+    app.dependency_overrides[get_db] = lambda: db
+
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout)
+
+
+async def main(args) -> dict:
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout)
+    else:
+        client = build_in_process_client(args.timeout)
+
+    recorder = Recorder()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    started = time.perf_counter()
+    async with client:
+        await asyncio.gather(*(
+            run_player(i, client, recorder, args, semaphore) for i in range(args.players)
+        ))
+    elapsed = time.perf_counter() - started
+
+    report = recorder.report(elapsed)
+    report["config"] = {
+        "mode": "http" if args.base_url else "in-process",
+        "base_url": args.base_url,
+        "players": args.players,
+        "concurrency": args.concurrency,
+        "ramp_up_s": args.ramp_up,
+        "think_time_s": args.think_time,
+        "seed": args.seed,
+        "actions": args.actions,
+    }
+    report["players_per_s"] = args.players / elapsed if elapsed else 0.0
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent-player load test for the game API.")
+    parser.add_argument("--players", type=int, default=100, help="Number of simulated players.")
+    parser.add_argument("--concurrency", type=int, default=20, help="Maximum players in flight at once.")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Seconds over which players are started.")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Max random pause (s) between a player's requests.")
+    parser.add_argument("--base-url", default=None, help="Target a running server instead of the in-process app.")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible player actions.")
+    parser.add_argument("--actions", choices=["random", "frontend"], default="random",
+                        help="'frontend' sends the play-stage bodies exactly as the web client builds them.")
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file instead of stdout.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(main(args))
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload)
+    else:
+        print(payload)
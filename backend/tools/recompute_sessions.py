@@ -0,0 +1,305 @@
+"""
+Re-score stored game sessions with the current emission model.
+
+After recalibrating coefficients in `services/engine_core.py` (or the factor
+tables of a methodology in `services/emission_methods.py`) the stored
+`stage_result`, `cumulative_state` and `final_metrics` (net emission and the
+crop growth fields) of every session are stale. This job streams sessions whose `engine_version`
+differs from the current `version` of their methodology, recomputes their stages in worker
+processes and writes the results back with unordered `bulk_write` batches,
+stamping the new version. Stages are read from and written to the
+`turnSnapshot` collection, or the embedded `game_history` of sessions that
+predate it.
+
+The job is resumable: the last processed `_id` is saved to a checkpoint file
+after every written batch. A session modified by a player while being
+recomputed (its `version` changed) is skipped: its stages are not touched,
+its id is kept in the checkpoint, and a run resumed from that checkpoint
+queries it again. Which guarded session updates went through is read back
+by the `recompute_batch` token each batch stamps.
+
+Tính lại kết quả các ván đã lưu khi hệ số của mô hình thay đổi.
+
+Usage (from the backend/ folder):
+
+    python -m tools.recompute_sessions --dry-run
+    python -m tools.recompute_sessions --workers 8 --batch-size 1000 --checkpoint recompute.ckpt
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Set, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from crud.turnSnapshot import TurnSnapshotCRUD, COLLECTION_NAME as SNAPSHOT_COLLECTION
+from models.gameSession import GameSessionModel
+from services import crop_growth, emission_methods, engine_core
+
+COLLECTION_NAME = GameSessionModel.Config.collection_name
+TOLERANCE = 1e-9
+PROJECTION = {"season_key": 1, "water_regime": 1, "methodology": 1, "status": 1, "version": 1, "game_history": 1, "stage_count": 1,
+              "final_metrics": 1}
+
+
+def recompute_session(doc: dict) -> dict:
+    """
+    Recompute one stored session. Runs in a worker process.
+
+    Returns {"_id", "version", "sets": {...} or None, "stage_sets": {stage_number: {...}},
+    "old", "new", "error"}; `stage_sets` is filled instead of `game_history.N` keys in
+    `sets` for sessions whose stages live in turnSnapshot.
+    """
+    result = {"_id": doc["_id"], "version": doc.get("version", 0), "sets": None, "stage_sets": {},
+              "old": None, "new": None, "error": None}
+    snapshots = doc.get("stage_count") is not None
+    try:
+        history = doc.get("game_history") or []
+        inputs = [
+            engine_core.stage_input_from_action(
+                doc["season_key"], doc["water_regime"], stage["stage_number"],
+                stage["player_action"]["player_action"], stage["weather_conditions"]
+            )
+            for stage in history
+        ]
+        # Sessions are rescored with the methodology they were played with, one batch per session
+        methodology = emission_methods.get(doc.get("methodology") or emission_methods.FittedCurveMethod.key)
+        outcomes = methodology.compute_stages(inputs)
+        sets = {"engine_version": methodology.version}
+        changed = False
+        biomass = engine_core.CROP_INITIAL_BIOMASS
+        totals = engine_core.Totals()
+        for index, (stage, inp, outcome) in enumerate(zip(history, inputs, outcomes)):
+            totals = totals.add(outcome)
+            applied_n = engine_core.applied_nitrogen(inp.synthetic_fertilizer, inp.organic_fertilizer)
+            end_biomass = crop_growth.stage_biomass(inp.season_key, inp.water_regime, inp.stage_num, biomass,
+                                                    stage["weather_conditions"], inp.flooding_level, applied_n)
+            new_result = {
+                "ch4_emission": outcome.ch4_emission,
+                "n2o_emission": outcome.n2o_emission,
+                "biomass_growth": (end_biomass - biomass) * inp.area,
+            }
+            new_state = {
+                "cumulative_ch4_emission": totals.cumulative_ch4_emission,
+                "cumulative_n2o_emission": totals.cumulative_n2o_emission,
+                "cumulative_emission": totals.cumulative_emission,
+                "cumulative_biomass": end_biomass * inp.area,
+            }
+            biomass = end_biomass
+            if _differs(stage.get("stage_result"), new_result) or _differs(stage.get("cumulative_state"), new_state):
+                changed = True
+            if snapshots:
+                result["stage_sets"][stage["stage_number"]] = {"stage_result": new_result, "cumulative_state": new_state}
+            else:
+                sets[f"game_history.{index}.stage_result"] = new_result
+                sets[f"game_history.{index}.cumulative_state"] = new_state
+            result["new"] = totals.cumulative_emission
+
+        final_metrics = doc.get("final_metrics") or {}
+        result["old"] = final_metrics.get("final_net_emission")
+        if doc.get("status") == "completed" and history:
+            sets["final_metrics.final_net_emission"] = result["new"]
+            crop = crop_growth.final_metrics(new_state["cumulative_biomass"], result["new"])
+            sets.update({f"final_metrics.{key}": value for key, value in crop.items()})
+
+        result["sets"] = sets
+        result["changed"] = changed
+    except (KeyError, TypeError, ValueError) as e: # MethodologyError is a ValueError
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def _differs(old: Optional[dict], new: dict) -> bool:
+    if not old:
+        return True
+    return any(old.get(key) is None or abs(old[key] - value) > TOLERANCE for key, value in new.items())
+
+
+def _batches(cursor, size: int) -> Iterator[List[dict]]:
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _with_stages(db, batches: Iterator[List[dict]]) -> Iterator[List[dict]]:
+    """Attach the turnSnapshot stages of each batch's sessions as `game_history` (one query per batch)."""
+    for batch in batches:
+        stored = [doc["_id"] for doc in batch if doc.get("stage_count") is not None]
+        if stored:
+            stages = TurnSnapshotCRUD(db).get_stages_by_session(stored)
+            for doc in batch:
+                if doc["_id"] in stages:
+                    doc["game_history"] = stages[doc["_id"]]
+        yield batch
+
+
+def _recompute_batch(batch: List[dict]) -> List[dict]:
+    return [recompute_session(doc) for doc in batch]
+
+
+def _load_checkpoint(path: Optional[str]) -> Tuple[Optional[ObjectId], Set[ObjectId]]:
+    """The last processed _id and the ids skipped because of a concurrent play."""
+    if path and os.path.exists(path):
+        with open(path) as f:
+            checkpoint = json.load(f)
+        return ObjectId(checkpoint["last_id"]), {ObjectId(_id) for _id in checkpoint.get("skipped", [])}
+    return None, set()
+
+
+def _save_checkpoint(path: Optional[str], last_id: ObjectId, skipped: Set[ObjectId]):
+    if not path:
+        return
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"last_id": str(last_id), "skipped": sorted(map(str, skipped)),
+                   "versions": methodology_versions()}, f)
+    os.replace(tmp_path, path)
+
+
+def methodology_versions() -> dict:
+    return {key: emission_methods.get(key).version for key in emission_methods.available()}
+
+
+def stale_query() -> dict:
+    """Sessions whose engine_version is not the current version of their methodology."""
+    legacy = emission_methods.FittedCurveMethod.key # sessions from before methodologies have no key
+    versions = methodology_versions()
+    return {"$or": [
+        *({"methodology": {"$in": [None, key]} if key == legacy else key, "engine_version": {"$ne": version}}
+          for key, version in versions.items()),
+        {"methodology": {"$nin": [None, *versions]}}, # unknown methodology: reported as an error
+    ]}
+
+
+def run(db, workers: int = None, batch_size: int = 500, checkpoint: str = None,
+        dry_run: bool = False, limit: int = None, report_every: float = 5.0, out=sys.stderr) -> dict:
+    collection = db[COLLECTION_NAME]
+    query = stale_query()
+    last_id, skipped = _load_checkpoint(checkpoint)
+    if last_id is not None:
+        # Sessions skipped behind the checkpoint are retried along with the rest
+        query = {"$and": [query, {"$or": [{"_id": {"$gt": last_id}}, {"_id": {"$in": list(skipped)}}]}]}
+
+    cursor = collection.find(query, PROJECTION, no_cursor_timeout=False).sort("_id", 1).batch_size(batch_size)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    workers = workers or os.cpu_count() or 1
+    batches = _with_stages(db, _batches(cursor, batch_size))
+    stats = {"scanned": 0, "changed": 0, "written": 0, "skipped_concurrent": 0, "errors": 0,
+             "max_abs_diff": 0.0, "samples": [], "failed_ids": []}
+    started = last_report = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Executor.map would submit the whole cursor up front: keep a bounded window of batches
+        # in flight instead, and write and checkpoint them in cursor order as they complete
+        pending = deque()
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < 2 * workers:
+                batch = next(batches, None)
+                if batch is None:
+                    exhausted = True
+                    break
+                pending.append(pool.submit(_recompute_batch, batch))
+            if not pending:
+                break
+            results = pending.popleft().result()
+            token = ObjectId()
+            ids, operations, stage_operations, stamps = [], [], {}, []
+            for item in results:
+                stats["scanned"] += 1
+                if item["error"]:
+                    stats["errors"] += 1
+                    if len(stats["failed_ids"]) < 100:
+                        stats["failed_ids"].append(str(item["_id"]))
+                    continue
+                if item["changed"]:
+                    stats["changed"] += 1
+                    if item["old"] is not None and item["new"] is not None:
+                        diff = abs(item["new"] - item["old"])
+                        stats["max_abs_diff"] = max(stats["max_abs_diff"], diff)
+                        if dry_run and len(stats["samples"]) < 20:
+                            stats["samples"].append({"_id": str(item["_id"]), "old": item["old"], "new": item["new"]})
+                if item["changed"] and item["stage_sets"]:
+                    stage_operations[item["_id"]] = [
+                        UpdateOne({"session_id": item["_id"], "stage_number": number},
+                                  {"$set": {**stage_sets, "engine_version": item["sets"]["engine_version"]}})
+                        for number, stage_sets in item["stage_sets"].items()
+                    ]
+                version = item["version"]
+                version_filter = {"$in": [0, None]} if version == 0 else version
+                sets = {**item["sets"], "recompute_batch": token}
+                if item["_id"] in stage_operations:
+                    # Stamped only once its stages are written; until then the next run still selects it
+                    stamps.append(UpdateOne({"_id": item["_id"], "recompute_batch": token},
+                                            {"$set": {"engine_version": sets.pop("engine_version")}}))
+                ids.append(item["_id"])
+                operations.append(UpdateOne(
+                    {"_id": item["_id"], "version": version_filter},
+                    {"$set": sets, "$inc": {"version": 1}} if item["changed"] else {"$set": sets}
+                ))
+
+            if operations and not dry_run:
+                write = collection.bulk_write(operations, ordered=False)
+                stats["written"] += write.modified_count
+                # Only sessions whose version guard matched carry this batch's token
+                updated = {doc["_id"] for doc in collection.find({"_id": {"$in": ids}, "recompute_batch": token}, {"_id": 1})}
+                stats["skipped_concurrent"] += len(ids) - len(updated)
+                skipped.difference_update(updated)
+                skipped.update(_id for _id in ids if _id not in updated)
+                # A skipped session keeps its stages as they are, consistent with its totals
+                stage_writes = [op for _id in ids if _id in updated for op in stage_operations.get(_id, ())]
+                if stage_writes:
+                    db[SNAPSHOT_COLLECTION].bulk_write(stage_writes, ordered=False)
+                if stamps:
+                    collection.bulk_write(stamps, ordered=False)
+            if results and not dry_run:
+                _save_checkpoint(checkpoint, results[-1]["_id"], skipped)
+
+            now = time.perf_counter()
+            if now - last_report >= report_every:
+                rate = stats["scanned"] / (now - started)
+                print(f"scanned={stats['scanned']} changed={stats['changed']} written={stats['written']} "
+                      f"errors={stats['errors']} rate={rate:.0f} sessions/s", file=out)
+                last_report = now
+
+    elapsed = time.perf_counter() - started
+    stats.update({
+        "engine_version": engine_core.ENGINE_VERSION,
+        "methodology_versions": methodology_versions(),
+        "dry_run": dry_run,
+        "elapsed_s": elapsed,
+        "sessions_per_s": stats["scanned"] / elapsed if elapsed else 0.0,
+    })
+    return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute stored sessions with the current emission model.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument("--batch-size", type=int, default=500, help="Sessions per worker batch and bulk_write.")
+    parser.add_argument("--checkpoint", default=None, help="File used to resume after the last written batch.")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing.")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many sessions.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    from db.db import get_db
+
+    args = parse_args()
+    stats = run(get_db(), workers=args.workers, batch_size=args.batch_size, checkpoint=args.checkpoint,
+                dry_run=args.dry_run, limit=args.limit)
+    print(json.dumps(stats, indent=2))
@@ -0,0 +1,264 @@
+"""
+Evaluate scenario sweeps offline, without the HTTP API.
+
+Each input row (CSV, or Parquet with pyarrow) is one season played with a
+fixed plan:
+
+- `season_key`, `water_regime`: required.
+- `scenario_id`: optional, the row number when missing.
+- `methodology`: optional, an `emission_methods` key; the default one when
+  missing.
+- `level_1` ... `level_4`: the flooding level of each stage. Stages without
+  a `level_N` column are not played, and the played stages must start at 1.
+- `organic_N`, `synthetic_N`: the fertilizers of stage N, e.g.
+  `Urea=80; Kali=20`. Empty means none.
+
+Actions are validated like API requests (`StageAction`). Stages use the
+fixed season weather of GAME_CONFIG. A row that fails validation is written
+with its `error` and empty results.
+
+The input is read in chunks of `--chunk-rows` rows. Chunks are evaluated in
+worker processes: every methodology scores all stages of a chunk in one
+vectorized call, and crop growth runs on all rows at once, stage by stage.
+Results are appended to the output (CSV, or Parquet row groups) in input
+order as chunks complete. At most `--max-pending` chunks are in flight, so
+memory use does not depend on the size of the input.
+
+Chạy hàng loạt kịch bản (mùa vụ × chế độ nước × lịch bón phân) ngoài API.
+
+Usage (from the backend/ folder):
+
+    python -m tools.run_scenarios scenarios.csv results.csv
+    python -m tools.run_scenarios scenarios.parquet results.parquet --workers 8 --chunk-rows 20000
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+from pydantic import ValidationError
+
+from config import GAME_CONFIG
+from schemas.gameSession import StageAction
+from services import crop_growth, emission_methods, engine_core, weather_samples
+from tools import tables
+
+REQUIRED_COLUMNS = ("season_key", "water_regime")
+OPTIONAL_COLUMNS = ("scenario_id", "methodology")
+_ITEM = re.compile(r"^\s*([^=:]+?)\s*[=:]\s*([^=:]+?)\s*$")
+
+
+def stage_columns(names: List[str]) -> Tuple[int, List[str]]:
+    """Number of played stages and the per-stage columns present in the input."""
+    stages = 0
+    while f"level_{stages + 1}" in names and stages < GAME_CONFIG['total_stages']:
+        stages += 1
+    if stages == 0:
+        raise tables.TableError("The input needs at least a level_1 column.")
+    columns = [f"{kind}_{stage}" for stage in range(1, stages + 1) for kind in ("level", "organic", "synthetic")]
+    return stages, [name for name in columns if name in names]
+
+
+def output_columns(stages: int) -> List[str]:
+    per_stage = [f"{kind}_{stage}" for stage in range(1, stages + 1) for kind in ("ch4", "n2o", "biomass")]
+    return ["scenario_id", "season_key", "water_regime", "methodology", *per_stage,
+            "total_ch4_emission", "total_n2o_emission", "total_emission",
+            "final_biomass", "final_yield", "emission_intensity", "error"]
+
+
+def parse_amounts(cell: str) -> Dict[str, str]:
+    """'Urea=80; Kali=20' -> {'Urea': '80', 'Kali': '20'}; names and numbers are checked by StageAction."""
+    amounts = {}
+    for item in re.split(r"[;,]", cell):
+        if not item.strip():
+            continue
+        match = _ITEM.match(item)
+        if match is None:
+            raise ValueError(f"expected TYPE=AMOUNT, got {item.strip()!r}")
+        amounts[match.group(1)] = match.group(2)
+    return amounts
+
+
+def _stage_weather() -> Dict[Tuple[str, int], dict]:
+    return {
+        (season_key, stage): weather_samples.stage_conditions(GAME_CONFIG['weather_data'][season_key], stage)
+        for season_key in GAME_CONFIG['weather_data'] for stage in range(1, GAME_CONFIG['total_stages'] + 1)
+    }
+
+
+def _error_text(e: Exception) -> str:
+    if isinstance(e, ValidationError):
+        return "; ".join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors())
+    return str(e)
+
+
+def evaluate_chunk(task: dict) -> Dict[str, list]:
+    """Evaluate one chunk of rows. Runs in a worker process."""
+    chunk, stages, first_row = task["chunk"], task["stages"], task["first_row"]
+    rows = len(chunk["season_key"])
+    weather = _stage_weather()
+    default_methodology = emission_methods.get().key
+
+    out = {name: np.full(rows, np.nan) for name in output_columns(stages)}
+    out["scenario_id"] = chunk["scenario_id"].tolist() if "scenario_id" in chunk else \
+        [str(first_row + row + 1) for row in range(rows)]
+    out["season_key"] = chunk["season_key"].tolist()
+    out["water_regime"] = chunk["water_regime"].tolist()
+    out["methodology"] = [value or default_methodology for value in chunk["methodology"].tolist()] \
+        if "methodology" in chunk else [default_methodology] * rows
+    out["error"] = [""] * rows
+
+    # --- Validate every row, collect its stage inputs ---
+    inputs: Dict[int, List[engine_core.StageInput]] = {}
+    for row in range(rows):
+        season_key, water_regime = out["season_key"][row], out["water_regime"][row]
+        try:
+            emission_methods.get(out["methodology"][row])
+            if season_key not in GAME_CONFIG['weather_data']:
+                raise ValueError(f"unknown season_key {season_key!r}")
+            if water_regime not in emission_methods.WATER_REGIMES:
+                raise ValueError(f"unknown water_regime {water_regime!r}")
+            row_inputs = []
+            for stage in range(1, stages + 1):
+                action = StageAction(
+                    fertilization={
+                        "organic_fertilizer": parse_amounts(chunk[f"organic_{stage}"][row]) if f"organic_{stage}" in chunk else {},
+                        "synthetic_fertilizer": parse_amounts(chunk[f"synthetic_{stage}"][row]) if f"synthetic_{stage}" in chunk else {},
+                    },
+                    irrigation={"level": chunk[f"level_{stage}"][row]},
+                )
+                row_inputs.append(engine_core.stage_input(season_key, water_regime, stage, engine_core.action_from_schema(action),
+                                                          weather[(season_key, stage)]))
+            inputs[row] = row_inputs
+        except (ValueError, ValidationError) as e: # MethodologyError is a ValueError
+            out["error"][row] = _error_text(e)
+
+    valid = np.array(sorted(inputs), dtype=np.intp)
+    if len(valid):
+        _emissions(out, inputs, valid, stages)
+        _growth(out, inputs, valid, stages, weather)
+    return {name: (values.tolist() if isinstance(values, np.ndarray) else values) for name, values in out.items()}
+
+
+def _emissions(out: dict, inputs: Dict[int, list], valid: np.ndarray, stages: int):
+    """One vectorized call per methodology over all stages of its rows."""
+    methodologies = np.array(out["methodology"], dtype=object)[valid]
+    ch4 = np.empty((len(valid), stages))
+    n2o = np.empty((len(valid), stages))
+    for key in dict.fromkeys(methodologies.tolist()):
+        selected = np.flatnonzero(methodologies == key)
+        batch = emission_methods.batch_from_inputs([inp for i in selected for inp in inputs[valid[i]]])
+        outcome = emission_methods.get(key).evaluate(batch)
+        ch4[selected] = outcome.ch4_emission.reshape(len(selected), stages)
+        n2o[selected] = outcome.n2o_emission.reshape(len(selected), stages)
+    for stage in range(stages):
+        out[f"ch4_{stage + 1}"][valid] = ch4[:, stage]
+        out[f"n2o_{stage + 1}"][valid] = n2o[:, stage]
+    out["total_ch4_emission"][valid] = ch4.sum(axis=1)
+    out["total_n2o_emission"][valid] = n2o.sum(axis=1)
+    out["total_emission"][valid] = (ch4 * engine_core.GWP_CH4 + n2o * engine_core.GWP_N2O).sum(axis=1)
+
+
+def _growth(out: dict, inputs: Dict[int, list], valid: np.ndarray, stages: int, weather: dict):
+    """Crop growth of all valid rows at once, stage by stage."""
+    biomass = np.full(len(valid), engine_core.CROP_INITIAL_BIOMASS)
+    supply = np.array([crop_growth.irrigation_supply(inputs[row][0].water_regime) for row in valid])
+    for stage in range(stages):
+        stage_inputs = [inputs[row][stage] for row in valid]
+        applied_n = np.array([engine_core.applied_nitrogen(inp.synthetic_fertilizer, inp.organic_fertilizer)
+                              for inp in stage_inputs])
+        flooding = np.array([inp.flooding_level for inp in stage_inputs])
+        rain = np.array([inp.total_rainfall_mm for inp in stage_inputs])
+        temp = np.array([inp.avg_temp_c for inp in stage_inputs])
+        radiation = np.array([crop_growth.radiation(inp.season_key, weather[(inp.season_key, inp.stage_num)])
+                              for inp in stage_inputs])
+        f_n = crop_growth.nitrogen_factor(applied_n)
+        f_w = crop_growth.water_factor(supply, flooding, rain)
+        biomass = crop_growth.grow(biomass, stage + 1, temp, radiation, f_n, f_w)
+        out[f"biomass_{stage + 1}"][valid] = biomass * engine_core.DEFAULT_AREA
+    grain = crop_growth.grain_yield(biomass * engine_core.DEFAULT_AREA)
+    out["final_biomass"][valid] = biomass * engine_core.DEFAULT_AREA
+    out["final_yield"][valid] = grain
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["emission_intensity"][valid] = np.where(grain > 0, out["total_emission"][valid] / grain, np.nan)
+
+
+def run(input_path: str, output_path: str, workers: int = None, chunk_rows: int = 10000,
+        max_pending: int = None, report_every: float = 5.0, out=sys.stderr) -> dict:
+    names = tables.column_names(input_path)
+    missing = [name for name in REQUIRED_COLUMNS if name not in names]
+    if missing:
+        raise tables.TableError(f"{input_path}: missing column(s) {missing}")
+    stages, per_stage = stage_columns(names)
+    text = [*REQUIRED_COLUMNS, *(name for name in OPTIONAL_COLUMNS if name in names), *per_stage]
+
+    stats = {"rows": 0, "errors": 0, "chunks": 0}
+    started = last_report = time.perf_counter()
+    chunks = tables.iter_chunks(input_path, text=text, chunk_rows=chunk_rows)
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as pool, \
+            tables.TableWriter(output_path, output_columns(stages)) as writer:
+        pending = deque()
+        first_row = 0
+        exhausted = False
+        while pending or not exhausted:
+            # Keep a bounded window of chunks in flight; results are written in input order
+            while not exhausted and len(pending) < max_pending:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                pending.append(pool.submit(evaluate_chunk, {"chunk": chunk, "stages": stages, "first_row": first_row}))
+                first_row += len(chunk["season_key"])
+            if not pending:
+                break
+            result = pending.popleft().result()
+            writer.write(result)
+            stats["chunks"] += 1
+            stats["rows"] += len(result["error"])
+            stats["errors"] += sum(1 for error in result["error"] if error)
+
+            now = time.perf_counter()
+            if now - last_report >= report_every:
+                print(f"rows={stats['rows']} errors={stats['errors']} "
+                      f"rate={stats['rows'] / (now - started):.0f} rows/s", file=out)
+                last_report = now
+
+    elapsed = time.perf_counter() - started
+    stats.update({
+        "output": output_path,
+        "stages": stages,
+        "engine_version": engine_core.ENGINE_VERSION,
+        "elapsed_s": elapsed,
+        "rows_per_s": stats["rows"] / elapsed if elapsed else 0.0,
+    })
+    return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate scenario sweeps offline.")
+    parser.add_argument("input", help="CSV or Parquet file of scenarios.")
+    parser.add_argument("output", help="CSV or Parquet file to write the results to.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument("--chunk-rows", type=int, default=10000, help="Rows per chunk.")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="Chunks in flight at once (default: twice the workers); bounds memory use.")
+    parser.add_argument("--report-every", type=float, default=5.0, help="Seconds between progress lines.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        stats = run(args.input, args.output, args.workers, args.chunk_rows, args.max_pending, args.report_every)
+    except tables.TableError as e:
+        raise SystemExit(str(e))
+    print(json.dumps(stats, indent=2))
@@ -0,0 +1,173 @@
+"""
+Column readers and writers for the offline tools: CSV, or Parquet when
+`pyarrow` is installed.
+
+Tables are read in chunks of `chunk_rows` rows as a dict of numpy arrays, one
+per requested column: numbers as float64, text as str arrays. `TableWriter`
+appends such chunks to a CSV file or as Parquet row groups, so neither side
+holds more than one chunk in memory.
+
+Đọc/ghi bảng dữ liệu (CSV/Parquet) theo từng khối cột numpy.
+"""
+
+import csv
+import os
+from typing import Dict, Iterator, List, Sequence
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError: # optional, only needed for .parquet files
+    pyarrow = parquet = None
+
+Columns = Dict[str, np.ndarray]
+
+
+class TableError(ValueError):
+    pass
+
+
+def is_parquet(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in (".parquet", ".pq")
+
+
+def column_names(path: str) -> List[str]:
+    if is_parquet(path):
+        _require_pyarrow()
+        return list(parquet.ParquetFile(path).schema_arrow.names)
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return [name.strip() for name in next(csv.reader(f), [])]
+
+
+def iter_chunks(path: str, numeric: Sequence[str] = (), text: Sequence[str] = (),
+                chunk_rows: int = 65536) -> Iterator[Columns]:
+    """Chunks of the requested columns; raises TableError when a column is missing or not a number."""
+    if is_parquet(path):
+        yield from _parquet_chunks(path, numeric, text, chunk_rows)
+    else:
+        yield from _csv_chunks(path, numeric, text, chunk_rows)
+
+
+def read_columns(path: str, numeric: Sequence[str] = (), text: Sequence[str] = ()) -> Columns:
+    """The whole table at once."""
+    chunks = list(iter_chunks(path, numeric, text))
+    if not chunks:
+        return {name: np.empty(0) for name in numeric} | {name: np.empty(0, dtype=str) for name in text}
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in (*numeric, *text)}
+
+
+def _check_columns(path: str, available: Sequence[str], wanted: Sequence[str]):
+    missing = [name for name in wanted if name not in available]
+    if missing:
+        raise TableError(f"{path}: missing column(s) {missing}")
+
+
+def _csv_chunks(path, numeric, text, chunk_rows) -> Iterator[Columns]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        header = [name.strip() for name in header]
+        _check_columns(path, header, (*numeric, *text))
+        numeric_at = [header.index(name) for name in numeric]
+        text_at = [header.index(name) for name in text]
+        rows = []
+        line = 1
+        for row in reader:
+            line += 1
+            if not row:
+                continue
+            rows.append(row)
+            if len(rows) == chunk_rows:
+                yield _csv_columns(path, line - len(rows) + 1, rows, numeric, numeric_at, text, text_at)
+                rows = []
+        if rows:
+            yield _csv_columns(path, line - len(rows) + 1, rows, numeric, numeric_at, text, text_at)
+
+
+def _csv_columns(path, first_line, rows, numeric, numeric_at, text, text_at) -> Columns:
+    columns = {}
+    for name, at in zip(numeric, numeric_at):
+        try:
+            columns[name] = np.array([row[at] for row in rows], dtype=float)
+        except (ValueError, IndexError):
+            raise TableError(f"{path}: column '{name}' has an empty or non-numeric value near line {first_line}")
+    for name, at in zip(text, text_at):
+        columns[name] = np.array([row[at].strip() for row in rows], dtype=str)
+    return columns
+
+
+def _require_pyarrow():
+    if parquet is None:
+        raise TableError("Parquet files need pyarrow (pip install pyarrow)")
+
+
+def _parquet_chunks(path, numeric, text, chunk_rows) -> Iterator[Columns]:
+    _require_pyarrow()
+    table = parquet.ParquetFile(path)
+    _check_columns(path, table.schema_arrow.names, (*numeric, *text))
+    for batch in table.iter_batches(batch_size=chunk_rows, columns=[*numeric, *text]):
+        columns = {}
+        for name in numeric:
+            values = batch.column(name)
+            if values.null_count:
+                raise TableError(f"{path}: column '{name}' has empty values")
+            try:
+                columns[name] = values.to_numpy(zero_copy_only=False).astype(float)
+            except (ValueError, TypeError):
+                raise TableError(f"{path}: column '{name}' is not numeric")
+        for name in text:
+            columns[name] = np.array(batch.column(name).to_pylist(), dtype=str)
+        yield columns
+
+
+class TableWriter:
+    """Appends chunks (dicts of equal-length arrays, in `columns` order) to a CSV or Parquet file."""
+
+    def __init__(self, path: str, columns: Sequence[str]):
+        self.path = path
+        self.columns = list(columns)
+        self.rows = 0
+        self._parquet = is_parquet(path)
+        if self._parquet:
+            _require_pyarrow()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = None
+        self._writer = None
+        if not self._parquet:
+            self._file = open(path, "w", newline="", encoding="utf-8")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.columns)
+
+    def write(self, chunk: Dict[str, Sequence]):
+        if self._parquet:
+            table = pyarrow.table({name: chunk[name] for name in self.columns})
+            if self._writer is None:
+                self._writer = parquet.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        else:
+            values = [_csv_values(chunk[name]) for name in self.columns]
+            self._writer.writerows(zip(*values))
+            self._file.flush()
+        self.rows += len(chunk[self.columns[0]])
+
+    def close(self):
+        if self._parquet and self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _csv_values(values) -> list:
+    """Cells of one column; missing numbers (NaN, None) are written as empty cells."""
+    values = values.tolist() if isinstance(values, np.ndarray) else list(values)
+    return ["" if value is None or (isinstance(value, float) and value != value) else value for value in values]
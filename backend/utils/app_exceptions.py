@@ -30,3 +30,9 @@ class AppException(object):
             """Rate limit hit"""
             status_code = 429
             AppExceptionCase.__init__(self, status_code, context)
+
+    class ServiceUnavailable(AppExceptionCase):
+        def __init__(self, context=None):
+            """Upstream service unavailable"""
+            status_code = 503
+            AppExceptionCase.__init__(self, status_code, context)
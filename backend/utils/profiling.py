@@ -0,0 +1,282 @@
+"""
+On-demand profiling of live requests (admin only, off by default).
+
+When `PROFILING_ENABLED` is set, `middleware.profiling` profiles a request
+that carries `X-Profile: 1` together with a valid `X-Admin-Token`, or a
+random `PROFILING_SAMPLE_RATE` share of all requests. A profiled request
+gets a `Sampler`: a thread that reads the Python stacks of the threads
+serving the request every `PROFILING_INTERVAL_MS` (`sys._current_frames`)
+and, when the request ends, writes a speedscope (or folded-stack, for
+flamegraph.pl) file into `PROFILING_DIR`, keeping the newest
+`PROFILING_MAX_FILES` files.
+
+Sync endpoints run in the threadpool, so the sampler learns which thread to
+watch from `attach()`, called when a service or CRUD object is created
+(`services.main.DBSessionContext`); the profile travels there in a context
+variable. With profiling disabled the middleware is not installed and
+`attach()` is a single context-variable read.
+
+Chỉ dùng để chẩn đoán request chậm trên production; mặc định tắt.
+"""
+
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILING_ADMIN_TOKEN = os.getenv("PROFILING_ADMIN_TOKEN", "") # empty: header trigger and admin endpoints refused
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0")) # share of requests profiled without header
+PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "2"))
+PROFILING_MAX_SECONDS = float(os.getenv("PROFILING_MAX_SECONDS", "30")) # a sampler never runs longer than this
+PROFILING_MAX_CONCURRENT = int(os.getenv("PROFILING_MAX_CONCURRENT", "2"))
+PROFILING_DIR = os.getenv("PROFILING_DIR", "profiles")
+PROFILING_MAX_FILES = int(os.getenv("PROFILING_MAX_FILES", "50"))
+PROFILING_FORMAT = os.getenv("PROFILING_FORMAT", "speedscope") # speedscope | folded
+
+_MAX_DEPTH = 256
+_current: ContextVar[Optional["Sampler"]] = ContextVar("profiling_sampler", default=None)
+_slots = threading.BoundedSemaphore(max(PROFILING_MAX_CONCURRENT, 1))
+
+Frame = Tuple[str, str, int] # function, file, first line
+
+
+def is_admin(token: Optional[str]) -> bool:
+    return bool(PROFILING_ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, PROFILING_ADMIN_TOKEN)
+
+
+def should_profile(header: Optional[str], token: Optional[str]) -> bool:
+    if header is not None and header.strip().lower() in ("1", "true", "yes"):
+        return is_admin(token)
+    return PROFILING_SAMPLE_RATE > 0 and random.random() < PROFILING_SAMPLE_RATE
+
+
+def attach():
+    """Let the sampler of the current request (if any) watch the calling thread."""
+    sampler = _current.get()
+    if sampler is not None:
+        sampler.watch(threading.get_ident())
+
+
+class Sampler(threading.Thread):
+    """Wall-clock stack sampler for the threads of one request."""
+
+    def __init__(self, name: str, interval: float = PROFILING_INTERVAL_MS / 1000.0):
+        super().__init__(name="profiler", daemon=True)
+        self.profile_name = name
+        self.interval = interval
+        self.path = os.path.join(PROFILING_DIR, f"{name}.{_extension()}")
+        self._threads: set = set()
+        self._weights: Dict[Tuple[int, Tuple[Frame, ...]], float] = Counter() # (thread, stack) -> seconds
+        self._stopped = threading.Event()
+        self._token = None
+
+    # --- lifecycle, called from the middleware ---
+
+    @classmethod
+    def begin(cls, name: str) -> Optional["Sampler"]:
+        """Start a sampler bound to the current context, or None when too many are running."""
+        if not _slots.acquire(blocking=False):
+            return None
+        sampler = cls(name)
+        sampler._token = _current.set(sampler)
+        sampler.start()
+        return sampler
+
+    def end(self):
+        """Stop sampling; the sampler thread writes the profile file itself."""
+        _current.reset(self._token)
+        self._stopped.set()
+
+    def watch(self, thread_id: int):
+        self._threads.add(thread_id)
+
+    # --- sampler thread ---
+
+    def run(self):
+        try:
+            started = last = time.perf_counter()
+            deadline = started + PROFILING_MAX_SECONDS
+            frames = None
+            while not self._stopped.wait(self.interval):
+                now = time.perf_counter()
+                frames = sys._current_frames()
+                for thread_id in tuple(self._threads):
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        self._weights[(thread_id, _stack(frame))] += now - last
+                last = now
+                if now > deadline:
+                    break
+            del frames # drop the last references to other threads' frames
+            if self._weights:
+                _write(self.path, self.render(time.perf_counter() - started))
+                prune()
+        finally:
+            _slots.release()
+
+    def render(self, duration: float) -> str:
+        if PROFILING_FORMAT == "folded":
+            return _folded(self._weights)
+        return json.dumps(_speedscope(self.profile_name, self._weights, duration))
+
+
+def _extension() -> str:
+    return "folded.txt" if PROFILING_FORMAT == "folded" else "speedscope.json"
+
+
+def _stack(frame) -> Tuple[Frame, ...]:
+    """Stack of a frame, outermost call first."""
+    stack = []
+    while frame is not None and len(stack) < _MAX_DEPTH:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def _speedscope(name: str, weights: Dict, duration: float) -> dict:
+    """https://www.speedscope.app/file-format-schema.json, one sampled profile per thread (milliseconds)."""
+    frame_index: Dict[Frame, int] = {}
+    profiles: Dict[int, dict] = {}
+    for (thread_id, stack), seconds in weights.items():
+        profile = profiles.setdefault(thread_id, {
+            "type": "sampled", "name": f"{name} thread {thread_id}", "unit": "milliseconds",
+            "startValue": 0, "endValue": duration * 1000.0, "samples": [], "weights": [],
+        })
+        profile["samples"].append([frame_index.setdefault(frame, len(frame_index)) for frame in stack])
+        profile["weights"].append(seconds * 1000.0)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "monnas",
+        "shared": {"frames": [{"name": f, "file": file, "line": line} for f, file, line in frame_index]},
+        "profiles": list(profiles.values()),
+    }
+
+
+def _folded(weights: Dict) -> str:
+    """Brendan Gregg's folded stacks (`frame;frame;frame microseconds`), for flamegraph.pl."""
+    lines = Counter()
+    for (_, stack), seconds in weights.items():
+        lines[";".join(f"{f} ({os.path.basename(file)}:{line})" for f, file, line in stack)] += seconds
+    return "".join(f"{stack} {round(seconds * 1e6)}\n" for stack, seconds in lines.items())
+
+
+def _write(path: str, content: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        f.write(content)
+    os.replace(path + ".tmp", path)
+
+
+def profile_name(method: str, path: str, request_id: Optional[str]) -> str:
+    slug = "".join(c if c.isalnum() else "-" for c in path.strip("/"))[:60] or "root"
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+    return f"{stamp}-{os.getpid()}-{method.lower()}-{slug}-{(request_id or '')[:16]}"
+
+
+# --- Output directory ---
+
+def list_files() -> List[dict]:
+    """Profiles and snapshots in PROFILING_DIR, newest first."""
+    try:
+        entries = [e for e in os.scandir(PROFILING_DIR) if e.is_file() and not e.name.endswith(".tmp")]
+    except FileNotFoundError:
+        return []
+    files = []
+    for entry in entries:
+        try:
+            stat = entry.stat()
+        except FileNotFoundError: # pruned by another worker
+            continue
+        files.append({"name": entry.name, "size": stat.st_size, "modified": datetime.utcfromtimestamp(stat.st_mtime)})
+    files.sort(key=lambda f: f["modified"], reverse=True)
+    return files
+
+
+def file_path(name: str) -> Optional[str]:
+    """Path of a file in PROFILING_DIR, None for unknown names (no path traversal)."""
+    if os.path.basename(name) != name or name.startswith("."):
+        return None
+    path = os.path.join(PROFILING_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def prune(keep: int = PROFILING_MAX_FILES):
+    for old in list_files()[keep:]:
+        try:
+            os.unlink(os.path.join(PROFILING_DIR, old["name"]))
+        except FileNotFoundError:
+            pass
+
+
+# --- tracemalloc (per worker process) ---
+
+_last_snapshot: Optional[tracemalloc.Snapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def start_tracemalloc(frames: int = 25) -> dict:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    return tracemalloc_status()
+
+
+def stop_tracemalloc() -> dict:
+    global _last_snapshot
+    tracemalloc.stop()
+    _last_snapshot = None
+    return tracemalloc_status()
+
+
+def tracemalloc_status() -> dict:
+    tracing = tracemalloc.is_tracing()
+    current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+    return {"pid": os.getpid(), "tracing": tracing, "frames": tracemalloc.get_traceback_limit() if tracing else 0,
+            "traced_bytes": current, "peak_bytes": peak}
+
+
+def take_snapshot(limit: int = 30, group_by: str = "lineno", compare: bool = False) -> Optional[dict]:
+    """
+    Top allocation sites of this worker, dumped to PROFILING_DIR for offline analysis
+    (`tracemalloc.Snapshot.load`). With `compare`, sites are ranked by growth since the
+    previous snapshot. None when tracemalloc is not tracing.
+    """
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        return None
+    with _snapshot_lock:
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__), # the samplers' own stacks
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        previous, _last_snapshot = _last_snapshot, snapshot
+
+    name = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{os.getpid()}.tracemalloc"
+    os.makedirs(PROFILING_DIR, exist_ok=True)
+    snapshot.dump(os.path.join(PROFILING_DIR, name))
+    prune()
+
+    if compare and previous is not None:
+        stats = snapshot.compare_to(previous, group_by)[:limit]
+        top = [{"site": _site(s.traceback), "size": s.size, "size_diff": s.size_diff,
+                "count": s.count, "count_diff": s.count_diff} for s in stats]
+    else:
+        stats = snapshot.statistics(group_by)[:limit]
+        top = [{"site": _site(s.traceback), "size": s.size, "count": s.count} for s in stats]
+    return {**tracemalloc_status(), "file": name, "group_by": group_by, "compared": bool(compare and previous), "top": top}
+
+
+def _site(traceback: tracemalloc.Traceback) -> List[str]:
+    return [f"{frame.filename}:{frame.lineno}" for frame in traceback]
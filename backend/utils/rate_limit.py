@@ -0,0 +1,142 @@
+"""
+Client-side protection for calls to upstream services: a token-bucket rate
+limiter with a bounded wait queue, a circuit breaker and a jittered
+exponential backoff helper. All of them are thread-safe and meant to be
+shared by every request in a worker.
+"""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+class RateLimitExceeded(Exception):
+    """No token became available in time, or too many callers are already waiting."""
+
+
+class CircuitOpen(Exception):
+    """The circuit breaker is open; the upstream is considered down."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"circuit open, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int, max_waiters: int = 32):
+        """
+        Args:
+            rate: tokens added per second (sustained request rate)
+            burst: bucket capacity
+            max_waiters: callers allowed to wait for a token at the same time
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_waiters = max_waiters
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._waiters = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout: float) -> None:
+        """Take one token, waiting up to `timeout` seconds. Raises RateLimitExceeded."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            if self._waiters >= self.max_waiters:
+                raise RateLimitExceeded("too many requests waiting for the upstream rate limit")
+            self._waiters += 1
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+                if now + wait > deadline:
+                    raise RateLimitExceeded("timed out waiting for the upstream rate limit")
+                time.sleep(wait)
+        finally:
+            with self._lock:
+                self._waiters -= 1
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures;
+    open -> half-open after `reset_timeout` seconds, letting one trial call through;
+    half-open -> closed on success, back to open on failure.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "closed":
+                return
+            elapsed = time.monotonic() - self._opened_at
+            if self.state == "open" and elapsed >= self.reset_timeout:
+                self.state = "half-open"
+            if self.state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            raise CircuitOpen(max(0.0, self.reset_timeout - elapsed))
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def release(self):
+        """
+        The call says nothing about the upstream's health (abandoned before reaching it,
+        or throttled with 429): free a half-open trial, record nothing.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == "half-open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,174 @@
+"""
+Read-mostly cache shared by all worker processes on a host.
+
+Every published value is an immutable file `<name>.<version>.bin` holding a
+JSON header and raw numpy arrays. A small control file `<name>.ctl`, mapped
+by every process, holds the current version; publishing writes the new data
+file first and then bumps the version, guarded by a sequence counter
+(seqlock), so readers never see a half-written state.
+
+Readers map the data file once per version and hand out `np.frombuffer`
+views on the mapping, so attaching is zero-copy and the pages are shared
+through the page cache. Checking for a newer version is one 16-byte read
+from the control mapping. Data files of older versions are unlinked by the
+publisher; mappings already held by readers stay valid.
+"""
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from typing import Dict, NamedTuple, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError: # not available on Windows; publishing is then only serialized per process
+    fcntl = None
+
+SHARED_CACHE_DIR = os.getenv(
+    "SHARED_CACHE_DIR",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "monnas-cache")
+)
+
+_CONTROL = struct.Struct("<QQ") # seq, version
+_HEADER_LENGTH = struct.Struct("<Q")
+_ALIGN = 64
+
+
+def _aligned(size: int) -> int:
+    return -(-size // _ALIGN) * _ALIGN
+
+
+class Snapshot(NamedTuple):
+    version: int
+    meta: dict
+    arrays: Dict[str, np.ndarray] # read-only views on the shared mapping
+
+
+class SharedCache:
+    def __init__(self, name: str, directory: str = SHARED_CACHE_DIR):
+        self.name = name
+        self.directory = directory
+        self._control: Optional[mmap.mmap] = None
+        self._snapshot: Optional[Snapshot] = None
+        self._leader_file = None
+        self._lock = threading.Lock()
+
+    def _path(self, suffix: str) -> str:
+        return os.path.join(self.directory, f"{self.name}.{suffix}")
+
+    def _control_map(self) -> mmap.mmap:
+        if self._control is None:
+            with self._lock:
+                if self._control is None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    fd = os.open(self._path("ctl"), os.O_RDWR | os.O_CREAT, 0o644)
+                    try:
+                        if os.fstat(fd).st_size < _CONTROL.size:
+                            os.ftruncate(fd, _CONTROL.size)
+                        self._control = mmap.mmap(fd, _CONTROL.size)
+                    finally:
+                        os.close(fd)
+        return self._control
+
+    def version(self) -> int:
+        """Current published version (0 = nothing published yet)."""
+        control = self._control_map()
+        for _ in range(10000):
+            seq, version = _CONTROL.unpack_from(control, 0)
+            if seq % 2 == 0 and _CONTROL.unpack_from(control, 0)[0] == seq:
+                return version
+        return version # a publisher died mid-update; its data file was complete before the bump
+
+    def get(self, retry: bool = True) -> Optional[Snapshot]:
+        """
+        The current snapshot, re-attached only when a newer version was published.
+        None when nothing is published or the published file is gone.
+        """
+        version = self.version()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        if version == 0:
+            return None
+        try:
+            snapshot = self._attach(version)
+        except FileNotFoundError:
+            # Superseded and unlinked between reading the version and opening it: retry once.
+            # A file still missing after that was removed under the control file (e.g. tmpfs
+            # cleanup), and callers fall back to their source of truth.
+            return self.get(retry=False) if retry else None
+        self._snapshot = snapshot
+        return snapshot
+
+    def _attach(self, version: int) -> Snapshot:
+        with open(self._path(f"{version}.bin"), "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (header_length,) = _HEADER_LENGTH.unpack_from(mapping, 0)
+        header = json.loads(bytes(mapping[_HEADER_LENGTH.size:_HEADER_LENGTH.size + header_length]))
+        data_start = _aligned(_HEADER_LENGTH.size + header_length)
+        arrays = {
+            name: np.frombuffer(mapping, dtype=spec["dtype"], count=int(np.prod(spec["shape"])),
+                                offset=data_start + spec["offset"]).reshape(spec["shape"])
+            for name, spec in header["arrays"].items()
+        }
+        return Snapshot(version, header["meta"], arrays)
+
+    def publish(self, arrays: Dict[str, np.ndarray], meta: dict) -> int:
+        """Write a new version and make it current in every process. Returns the version."""
+        control = self._control_map()
+        with self._lock, open(self._path("lock"), "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            seq, previous = _CONTROL.unpack_from(control, 0)
+            seq += seq % 2 # a previous publisher may have died mid-update
+            version = previous + 1
+
+            contiguous = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+            specs, offset = {}, 0
+            for name, array in contiguous.items():
+                specs[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+                offset += _aligned(array.nbytes)
+            header = json.dumps({"meta": meta, "arrays": specs}).encode("utf-8")
+            data_start = _aligned(_HEADER_LENGTH.size + len(header))
+
+            path = self._path(f"{version}.bin")
+            with open(path + ".tmp", "wb") as f:
+                f.write(_HEADER_LENGTH.pack(len(header)) + header)
+                for name, array in contiguous.items():
+                    f.seek(data_start + specs[name]["offset"])
+                    f.write(array.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + ".tmp", path)
+
+            _CONTROL.pack_into(control, 0, seq + 1, version)
+            _CONTROL.pack_into(control, 0, seq + 2, version)
+            control.flush()
+
+            if previous and os.path.exists(self._path(f"{previous}.bin")):
+                os.unlink(self._path(f"{previous}.bin"))
+        return version
+
+    def try_become_leader(self) -> bool:
+        """
+        Take the leader role for this cache if no other live process holds it.
+        The role is kept until the process exits.
+        """
+        if self._leader_file is not None:
+            return True
+        if fcntl is None:
+            return True
+        os.makedirs(self.directory, exist_ok=True)
+        leader_file = open(self._path("leader"), "w")
+        try:
+            fcntl.flock(leader_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            leader_file.close()
+            return False
+        self._leader_file = leader_file
+        return True